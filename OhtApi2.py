@@ -1,9 +1,1864 @@
  # -*- coding: utf-8 -*-
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
+import functools
+import hashlib
 import json
+import os
+import queue
+import random
+import sqlite3
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
 import requests
+import requests.adapters
 import requests.exceptions
+import urllib3.exceptions
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# fastest available json parser, used for lazy responses
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+RESPONSE_NTUPLE = "ntuple"
+RESPONSE_LAZY = "lazy"
+
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+# downloaded data is written to path_to_save + PARTIAL_SUFFIX and renamed on completion
+PARTIAL_SUFFIX = ".part"
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+RESPONSE_TYPE_CACHE_SIZE = 512
+
+# segments of machine_translate_many are joined by MT_SEPARATOR into one request of at most
+# MT_GET_BATCH_SIZE (url encoded, fits into URL) or MT_POST_BATCH_SIZE (request body) characters
+MT_SEPARATOR = "\n"
+MT_GET_BATCH_SIZE = 1800
+MT_POST_BATCH_SIZE = 1 << 16
+
+# when OhtApi checks URL availability (see url_check param of constructor)
+URL_CHECK_EAGER = "eager"
+URL_CHECK_LAZY = "lazy"
+URL_CHECK_BACKGROUND = "background"
+
+# idempotent GET endpoints (keys of OhtApi._apiUrl) retried by default ResiliencePolicy
+RETRY_ENDPOINTS = frozenset(["project-details", "word-count", "quote",
+                             "discover-langs", "discover-langs_pairs", "supported-expertises"])
+# HTTP codes which mean that server is degraded and request can be retried
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# states of ResiliencePolicy circuit breaker
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half-open"
+
+# endpoint classes of RateLimiter
+RATE_READ = "read"
+RATE_WRITE = "write"
+RATE_MT = "mt"
+_MT_ENDPOINTS = frozenset(["machine-translate", "machine-detect-lang"])
+
+# ProjectWatcher: seconds between polls of project in given status, final statuses are not polled
+POLL_INTERVALS = {"pending": 300, "in_progress": 120, "submitted": 60, "signed": 30}
+POLL_INTERVAL = 120
+FINAL_STATUSES = frozenset(["completed", "canceled", "cancelled"])
+
+# kinds of ProjectEvent
+EVENT_STATUS = "status"
+EVENT_RESOURCES = "resources"
+EVENT_ERROR = "error"
+
+# upper bounds in seconds of HistogramExporter buckets, the last bucket is unbounded
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# timings of RequestTrace collected by HistogramExporter
+TRACE_TIMINGS = ("dns", "connect", "ttfb", "download", "seconds", "decode", "total")
+
+# states of SubmissionJournal entries
+SUBMISSION_PENDING = "pending"
+SUBMISSION_DONE = "done"
+
+# URL: concurrent.futures.Future with result of availability check, shared by all lazy/background instances
+_url_checks = {}
+_url_checks_lock = threading.Lock()
+
+# SpanContext of current code, parent of spans of requests made in it (see use_span)
+_current_span = contextvars.ContextVar("oht_current_span", default=None)
+
+UploadResult = namedtuple("UploadResult", ["index", "source", "resources", "answer", "error"])
+SpanContext = namedtuple("SpanContext", ["trace_id", "span_id", "parent_id"])
+RequestTimings = namedtuple("RequestTimings", ["dns", "connect", "ttfb", "download"])
+HistogramSnapshot = namedtuple("HistogramSnapshot", ["count", "sum", "buckets"])
+EndpointStats = namedtuple("EndpointStats", ["calls", "errors", "bytes_sent", "bytes_received", "seconds"])
+ProjectOutput = namedtuple("ProjectOutput", ["source", "resource", "path", "skipped", "error"])
+UploadProgress = namedtuple("UploadProgress", ["done", "failed", "total", "bytes_sent", "elapsed", "bytes_per_second"])
+ProjectEvent = namedtuple("ProjectEvent", ["project_id", "kind", "status", "previous_status", "resources",
+                                           "new_resources", "answer", "error"])
+QuoteTable = namedtuple("QuoteTable", ["target_lang", "service", "expertise", "wordcount", "credits", "net_price",
+                                       "transaction_fee", "price", "currency", "error"])
+CallbackEvent = namedtuple("CallbackEvent", ["event", "project_id", "payload", "key"])
+CallbackStats = namedtuple("CallbackStats", ["received", "duplicates", "invalid", "handler_errors"])
+JournalEntry = namedtuple("JournalEntry", ["fingerprint", "endpoint", "params", "state", "project_id", "answer",
+                                           "created", "updated"])
+CommentSync = namedtuple("CommentSync", ["project_id", "comments", "error"])
+MtCacheStats = namedtuple("MtCacheStats", ["memory_hits", "disk_hits", "misses", "stores"])
+MtResult = namedtuple("MtResult", ["key", "source", "translation", "error"])
+OrderReport = namedtuple("OrderReport", ["target_lang", "resources", "credits", "project_id", "answer", "error"])
+ResilienceStats = namedtuple("ResilienceStats", ["retries", "state", "failures", "opened", "rejected"])
+
+
+class OhtError(Exception):
+    """
+    OHT server answer with non zero status code
+    """
+
+    def __init__(self, answer):
+        super().__init__("{0}: {1}".format(answer.status.code, answer.status.msg))
+        self.answer = answer
+
+
+@functools.lru_cache(maxsize=RESPONSE_TYPE_CACHE_SIZE)
+def _response_type(fields):
+    """
+    namedtuple type for response object with given field names, created once per set of fields
+    :param fields: {Tuple} -> field names in order of appearance in json object
+    :return: namedtuple type or None if some field name is not identifier (object is left as dict)
+    """
+    if all(map(str.isidentifier, fields)):
+        return namedtuple("oht_response", fields)
+    return None
+
+
+def _json_to_object_hook(data):
+    """ json object hook of OhtApi.json_to_ntuple """
+    record = _response_type(tuple(data))
+    if record is None:
+        return {key: val for key, val in data.items() if not key.isidentifier()}
+    return record._make(data.values())
+
+
+def _copy_stream(source, target, buffer_size):
+    """
+    Copy file-like source to target through one reused buffer
+    :return: {Integer} -> number of copied bytes
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        read = source.readinto(buffer)
+        if not read:
+            return total
+        target.write(view[:read])
+        total += read
+
+
+def _range_start(path_to_save, resume):
+    """
+    :return: {Integer} -> size of already downloaded part of path_to_save, 0 if nothing to resume
+    """
+    part = path_to_save + PARTIAL_SUFFIX
+    return os.path.getsize(part) if resume and os.path.exists(part) else 0
+
+
+def _range_headers(offset):
+    return {"Range": "bytes={0}-".format(offset)} if offset else None
+
+
+class MultipartEncoder:
+    """
+    Streaming multipart/form-data request body: parts are read from their sources by chunks while request is sent,
+    so uploaded file is never loaded into memory as a whole.
+    Must be used as context manager: files opened by encoder (sources given as path) are closed on exit,
+    file objects given by caller are left open.
+    """
+
+    def __init__(self, fields=None, files=None, boundary=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        :param fields: {Dict} -> (optional) text fields, name: value
+        :param files: {Dict} -> (optional) file fields, name: source or name: (source, file_name, file_mime), where source is
+            path to file | binary file-like object | bytes | bytearray | memoryview
+        :param boundary: {String} -> (optional) multipart boundary, random if not specified
+        :param chunk_size: {Integer} -> (optional) max size of chunk for iteration
+        """
+        self.__fields = fields or {}
+        self.__files = files or {}
+        self.__boundary = boundary or uuid.uuid4().hex
+        self.__chunkSize = chunk_size
+        self.__opened = []
+        self.__parts = []
+        self.__length = None
+        self.__index = 0
+        self.__offset = 0
+
+    @property
+    def content_type(self):
+        return "multipart/form-data; boundary=" + self.__boundary
+
+    def headers(self):
+        """
+        :return: {Dict} -> HTTP headers for this body
+        """
+        headers = {"Content-Type": self.content_type}
+        if self.__length is not None:
+            headers["Content-Length"] = str(self.__length)
+        return headers
+
+    def __enter__(self):
+        length = 0
+        for name, value in self.__fields.items():
+            self.__parts.append(self._part_header(name))
+            self._add(memoryview(str(value).encode("utf-8")), b"\r\n")
+        for name, spec in self.__files.items():
+            source, file_name, file_mime = spec if isinstance(spec, tuple) else (spec, "", "")
+            if isinstance(source, str):
+                file_name = file_name or os.path.basename(source)
+                source = open(source, "rb")
+                self.__opened.append(source)
+            elif isinstance(source, (bytes, bytearray, memoryview)):
+                source = memoryview(source).cast("B")
+            else:
+                file_name = file_name or os.path.basename(str(getattr(source, "name", "")))
+            self.__parts.append(self._part_header(name, file_name or name, file_mime or "application/octet-stream"))
+            self._add(source, b"\r\n")
+        self.__parts.append(memoryview("--{0}--\r\n".format(self.__boundary).encode("ascii")))
+
+        for part in self.__parts:
+            size = part.nbytes if isinstance(part, memoryview) else self._file_size(part)
+            if size is None:
+                length = None
+                break
+            length += size
+        self.__length = length
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        while self.__opened:
+            self.__opened.pop().close()
+
+    def _part_header(self, name, file_name=None, file_mime=None):
+        header = '--{0}\r\nContent-Disposition: form-data; name="{1}"'.format(self.__boundary, name)
+        if file_name is not None:
+            header += '; filename="{0}"\r\nContent-Type: {1}'.format(file_name.replace('"', "%22"), file_mime)
+        return memoryview((header + "\r\n\r\n").encode("utf-8"))
+
+    def _add(self, part, trailer):
+        self.__parts.append(part)
+        self.__parts.append(memoryview(trailer))
+
+    @staticmethod
+    def _file_size(file):
+        try:
+            return os.fstat(file.fileno()).st_size - file.tell()
+        except (AttributeError, OSError, ValueError):
+            pass
+        try:
+            position = file.tell()
+            size = file.seek(0, os.SEEK_END) - position
+            file.seek(position)
+            return size
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        if self.__length is None:
+            raise TypeError("size of multipart body is unknown")
+        return self.__length
+
+    def read(self, size=-1):
+        """
+        :param size: {Integer} -> max number of bytes to read, negative - read up to the end
+        :return: {bytes} -> next piece of body, empty at the end
+        """
+        chunks = []
+        remaining = size if size is not None and size >= 0 else -1
+        while remaining and self.__index < len(self.__parts):
+            part = self.__parts[self.__index]
+            if isinstance(part, memoryview):
+                end = part.nbytes if remaining < 0 else min(part.nbytes, self.__offset + remaining)
+                chunk = part[self.__offset:end].tobytes()
+                self.__offset = end
+                if end == part.nbytes:
+                    self.__index += 1
+                    self.__offset = 0
+            else:
+                chunk = part.read(remaining)
+                if not chunk:
+                    self.__index += 1
+                    continue
+            chunks.append(chunk)
+            if remaining > 0:
+                remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def __iter__(self):
+        chunk = self.read(self.__chunkSize)
+        while chunk:
+            yield chunk
+            chunk = self.read(self.__chunkSize)
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
+
+
+def _upload_spec(source):
+    """
+    :return: {Tuple} -> (source, file_name, file_mime) for item of OhtApi.upload_many sources
+    """
+    if isinstance(source, tuple):
+        return (tuple(source) + ("", ""))[:3]
+    return source, "", ""
+
+
+def _source_size(source):
+    """
+    :return: {Integer} -> size of upload source in bytes, 0 if unknown
+    """
+    if isinstance(source, str):
+        try:
+            return os.path.getsize(source)
+        except OSError:
+            return 0
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    return MultipartEncoder._file_size(source) or 0
+
+
+class _UploadTracker:
+    """
+    Collect UploadResult of upload_many and report UploadProgress
+    """
+
+    def __init__(self, specs, progress):
+        self.__total = len(specs)
+        self.__sizes = [_source_size(spec[0]) for spec in specs]
+        self.__progress = progress
+        self.__start = time.monotonic()
+        self.__done = self.__failed = self.__bytesSent = 0
+
+    def result(self, index, spec, answer=None, error=None):
+        if error is None and answer.status.code != 0:
+            error = OhtError(answer)
+        self.__done += 1
+        if error is None:
+            self.__bytesSent += self.__sizes[index]
+        else:
+            self.__failed += 1
+        if self.__progress is not None:
+            elapsed = time.monotonic() - self.__start
+            self.__progress(UploadProgress(self.__done, self.__failed, self.__total, self.__bytesSent, elapsed,
+                                           self.__bytesSent / elapsed if elapsed else 0.0))
+        resources = list(answer.results) if error is None else []
+        return UploadResult(index, spec[0], resources, answer, error)
+
+
+def _resource_list(value):
+    """ resources fields of project_detail are list of uuid or empty string """
+    if isinstance(value, str):
+        return [value] if value else []
+    return list(value or [])
+
+
+def _project_targets(answer):
+    """
+    :param answer: project_detail answer
+    :return: {List} -> (source uuid, target uuid) for every translation/proof/transcription of project,
+        source uuid is None for target which is not bound to any source
+    """
+    if answer.status.code != 0:
+        raise OhtError(answer)
+    results = answer.results
+    targets = []
+    bound = set()
+    binding = getattr(results, "resource_binding", None) or {}
+    for source, resources in binding.items():
+        for target in _resource_list(resources):
+            if target not in bound:
+                bound.add(target)
+                targets.append((source, target))
+    for kind in ("translations", "proofs", "transcriptions"):
+        for target in _resource_list(getattr(results.resources, kind, "")):
+            if target not in bound:
+                bound.add(target)
+                targets.append((None, target))
+    return targets
+
+
+def _path_part(name):
+    """
+    :return: {String} -> last component of server supplied name, "" for empty name, "." and ".."
+    """
+    name = os.path.basename(str(name or "").replace("\\", "/"))
+    return "" if name in (".", "..") else name
+
+
+def _output_path(dest_dir, source, target, file_name, used):
+    """
+    dest_dir/<source uuid>/<file name> (dest_dir/<file name> for not bound target),
+    target uuid is added to file name if it's already used by other target
+    :raise ValueError if server supplied names do not give a path inside dest_dir
+    """
+    folder = dest_dir
+    if source:
+        if not _path_part(source):
+            raise ValueError("invalid source resource uuid {0!r}".format(source))
+        folder = os.path.join(dest_dir, _path_part(source))
+    name = _path_part(file_name) or _path_part(target)
+    if not name:
+        raise ValueError("invalid resource uuid {0!r}".format(target))
+    path = os.path.join(folder, name)
+    if path in used:
+        path = os.path.join(folder, "{0}_{1}".format(_path_part(target), _path_part(file_name)).rstrip("_"))
+    root = os.path.realpath(dest_dir)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError("path {0!r} is outside of {1!r}".format(path, dest_dir))
+    used.add(path)
+    return path
+
+
+def _output_plan(dest_dir, targets, metas):
+    """
+    :param targets: see _project_targets
+    :param metas: {List} -> get_resource answer (or exception) for each target
+    :return: {List} -> (source, target, path, skip, error), skip is True if path already exist with the same length
+    """
+    used = set()
+    plan = []
+    for (source, target), meta in zip(targets, metas):
+        if isinstance(meta, Exception):
+            plan.append((source, target, "", False, meta))
+            continue
+        if meta.status.code != 0:
+            plan.append((source, target, "", False, OhtError(meta)))
+            continue
+        try:
+            path = _output_path(dest_dir, source, target, getattr(meta.results, "file_name", ""), used)
+        except ValueError as error:
+            plan.append((source, target, "", False, error))
+            continue
+        length = getattr(meta.results, "length", None)
+        skip = length is not None and os.path.isfile(path) and os.path.getsize(path) == int(length)
+        plan.append((source, target, path, skip, None))
+    return plan
+
+
+def _mt_items(pairs_or_texts):
+    """
+    :return: {List} -> (key, text), key is position for plain texts
+    """
+    return [(index, item) if isinstance(item, str) else tuple(item) for index, item in enumerate(pairs_or_texts)]
+
+
+def _mt_batches(texts, max_size, post=False):
+    """
+    Pack unique texts into batches, joined size of batch does not exceed max_size.
+    Texts with MT_SEPARATOR inside or longer than max_size are sent alone.
+    :return: {List} -> lists of texts
+    """
+    def size(text):
+        return len(text.encode("utf-8")) if post else len(urllib.parse.quote_plus(text))
+
+    separator = size(MT_SEPARATOR)
+    batches = []
+    batch, batch_size = [], 0
+    for text in dict.fromkeys(texts):
+        text_size = size(text)
+        if MT_SEPARATOR in text or text_size >= max_size:
+            batches.append([text])
+            continue
+        if batch and batch_size + separator + text_size > max_size:
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch_size += text_size + (separator if batch else 0)
+        batch.append(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _mt_split(answer, batch):
+    """
+    :param answer: machine_translate answer for joined batch
+    :return: {List} -> translation of each text of batch, None if server changed number of segments
+    :raise OhtError if server return non zero status code
+    """
+    if answer.status.code != 0:
+        raise OhtError(answer)
+    translations = answer.results.TranslatedText.split(MT_SEPARATOR) if len(batch) > 1 \
+        else [answer.results.TranslatedText]
+    return translations if len(translations) == len(batch) else None
+
+
+def _mt_results(items, translated):
+    """
+    :param translated: {Dict} -> text: (translation, error)
+    :return: {List} -> MtResult in order of items
+    """
+    return [MtResult(key, text, *translated[text]) for key, text in items]
+
+
+def _mt_answer(translation):
+    """ raw machine_translate answer with translation, stored in MtCache for texts translated in batch """
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "results": {"TranslatedText": translation}, "errors": []})
+
+
+def _json_key(value):
+    """ json turns tuples of cache key into lists, restore them """
+    return tuple(_json_key(item) for item in value) if isinstance(value, list) else value
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with time-to-live, used for answers of OHT discovery endpoints.
+    Entries keep raw answer text, so cache can be saved to disk (save) and loaded on next start (load or path param),
+    loaded answers are parsed on first use.
+    """
+
+    def __init__(self, ttl=3600, maxsize=256, path=None, clock=time.monotonic):
+        """
+        :param ttl: {Float} -> seconds entry is valid after it was stored
+        :param maxsize: {Integer} -> max number of entries, least recently used entry is dropped on overflow
+        :param path: {String} -> (optional) snapshot file, loaded in constructor if exists and used by save/load by default
+        :param clock: {Callable} -> (optional) monotonic time source
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key, decode=None):
+        """
+        :param key: hashable key
+        :param decode: {Callable} -> (optional) build value from raw text if entry was loaded from snapshot
+        :return: stored value, None if there is no valid entry
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.__clock():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            if entry[1] is None and decode is not None:
+                entry[1] = decode(entry[2])
+            return entry[1]
+
+    def set(self, key, value, raw=None, expires=None):
+        """
+        :param key: hashable key
+        :param value: value to store
+        :param raw: {String} -> (optional) raw text of value, only entries with raw text are saved to snapshot
+        :param expires: {Float} -> (optional) expiry time by clock, ttl seconds from now if not specified
+        """
+        with self.__lock:
+            self.__entries[key] = [self.__clock() + self.ttl if expires is None else expires, value, raw]
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Drop entry with key, or all entries if key is not specified
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def save(self, path=None):
+        """
+        Write valid entries with raw text to snapshot file (atomically)
+        """
+        path = path or self.path
+        with self.__lock:
+            now, wall = self.__clock(), time.time()
+            items = [{"key": key, "expires": wall + entry[0] - now, "raw": entry[2]}
+                     for key, entry in self.__entries.items() if entry[2] is not None and entry[0] > now]
+        with open(path + PARTIAL_SUFFIX, "w", encoding="utf-8") as file:
+            json.dump(items, file)
+        os.replace(path + PARTIAL_SUFFIX, path)
+
+    def load(self, path=None):
+        """
+        Add not expired entries from snapshot file
+        :return: {Integer} -> number of loaded entries
+        """
+        with open(path or self.path, encoding="utf-8") as file:
+            items = json.load(file)
+        with self.__lock:
+            now, wall = self.__clock(), time.time()
+            loaded = 0
+            for item in items:
+                if item["expires"] > wall:
+                    self.__entries[_json_key(item["key"])] = [now + item["expires"] - wall, None, item["raw"]]
+                    loaded += 1
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return loaded
+
+
+class MtCache:
+    """
+    Content-addressed cache of machine_translate and machine_detect_lang answers: in-memory LRU (TTLCache)
+    in front of optional sqlite file. Thread-safe, file can be shared by processes.
+    Disk tier is limited by total size of answers, least recently used entries are dropped first.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, maxsize=4096, max_bytes=64 << 20, clock=time.time):
+        """
+        :param path: {String} -> (optional) sqlite database file, memory only cache if not specified
+        :param ttl: {Float} -> seconds entry is valid after it was stored
+        :param maxsize: {Integer} -> max number of entries in memory
+        :param max_bytes: {Integer} -> max total size of answers in database
+        :param clock: {Callable} -> (optional) wall time source, entries in file outlive the process
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.__clock = clock
+        self.__memory = TTLCache(ttl=ttl, maxsize=maxsize, clock=clock)
+        self.__lock = threading.Lock()
+        self.__stats = [0, 0, 0, 0]
+        self.__db = None
+        if path:
+            self.__db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS mt (key TEXT PRIMARY KEY, raw TEXT NOT NULL, "
+                              "expires REAL NOT NULL, used REAL NOT NULL, size INTEGER NOT NULL)")
+            self.__dbBytes = self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM mt").fetchone()[0]
+
+    @staticmethod
+    def key(*parts):
+        """
+        :param parts: {String} -> ("translate", from_lang, to_lang, text) or ("detect", text)
+        :return: {String} -> sha256 of parts
+        """
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        :return: {String} -> raw answer, None if there is no valid entry
+        """
+        raw = self.__memory.get(key)
+        if raw is not None:
+            with self.__lock:
+                self.__stats[0] += 1
+            return raw
+        with self.__lock:
+            if self.__db is not None:
+                now = self.__clock()
+                row = self.__db.execute("SELECT raw, expires FROM mt WHERE key = ? AND expires > ?", (key, now)).fetchone()
+                if row is not None:
+                    self.__db.execute("UPDATE mt SET used = ? WHERE key = ?", (now, key))
+                    self.__stats[1] += 1
+                    self.__memory.set(key, row[0], expires=row[1])
+                    return row[0]
+            self.__stats[2] += 1
+        return None
+
+    def set(self, key, raw):
+        """
+        :param raw: {String} -> raw answer with status code 0
+        """
+        self.__memory.set(key, raw)
+        with self.__lock:
+            self.__stats[3] += 1
+            if self.__db is None:
+                return
+            now = self.__clock()
+            old = self.__db.execute("SELECT size FROM mt WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.__dbBytes -= old[0]
+            self.__db.execute("INSERT OR REPLACE INTO mt (key, raw, expires, used, size) VALUES (?, ?, ?, ?, ?)",
+                              (key, raw, now + self.ttl, now, len(raw)))
+            self.__dbBytes += len(raw)
+            if self.__dbBytes > self.max_bytes:
+                self._evict(now)
+
+    def _evict(self, now):
+        """
+        Drop expired entries, then least recently used ones until database is 10% below max_bytes
+        """
+        self.__db.execute("DELETE FROM mt WHERE expires <= ?", (now,))
+        total = self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM mt").fetchone()[0]
+        goal = self.max_bytes * 0.9
+        victims = []
+        if total > goal:
+            for key, size in self.__db.execute("SELECT key, size FROM mt ORDER BY used").fetchall():
+                victims.append((key,))
+                total -= size
+                if total <= goal:
+                    break
+            self.__db.executemany("DELETE FROM mt WHERE key = ?", victims)
+        self.__dbBytes = total
+
+    def stats(self):
+        """
+        :return: MtCacheStats namedtuple with fields:
+            memory_hits, disk_hits: {Integer} -> answers found in memory and in database
+            misses: {Integer} -> answers not found (sent to server)
+            stores: {Integer} -> stored answers
+        """
+        with self.__lock:
+            return MtCacheStats(*self.__stats)
+
+    def clear(self):
+        """
+        Drop all entries (in memory and database) and counters
+        """
+        self.__memory.invalidate()
+        with self.__lock:
+            self.__stats = [0, 0, 0, 0]
+            if self.__db is not None:
+                self.__db.execute("DELETE FROM mt")
+                self.__dbBytes = 0
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+
+class PendingSubmissionError(Exception):
+    """
+    The same project was submitted before, but its outcome is unknown (e.g. request timed out).
+    Check projects in OHT and call SubmissionJournal.resolve or forget.
+    """
+
+    def __init__(self, entry):
+        super().__init__("project submission {0} to {1} has unknown outcome".format(entry.fingerprint, entry.endpoint))
+        self.entry = entry
+
+
+class SubmissionJournal:
+    """
+    Write-ahead journal of project creation requests (sqlite file, thread-safe, can be shared by processes).
+    Fingerprint of request is stored before POST and project_id after successful answer, so repeated
+    submission of the same project returns stored answer instead of creating (and paying for) another one.
+    """
+
+    def __init__(self, path, clock=time.time):
+        """
+        :param path: {String} -> sqlite database file, created if it does not exist
+        :param clock: {Callable} -> (optional) wall time source
+        """
+        self.path = path
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS submissions (fingerprint TEXT PRIMARY KEY, endpoint TEXT NOT NULL, "
+                          "params TEXT NOT NULL, state TEXT NOT NULL, project_id TEXT, answer TEXT, "
+                          "created REAL NOT NULL, updated REAL NOT NULL)")
+
+    @staticmethod
+    def fingerprint(endpoint, params):
+        """
+        :param endpoint: {String} -> key of OhtApi._apiUrl
+        :param params: {Dict} -> request params, secret_key is ignored
+        :return: {String} -> sha256 of endpoint and params
+        """
+        data = json.dumps([endpoint, sorted((name, str(val)) for name, val in params.items() if name != "secret_key")])
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _entry(self, fingerprint):
+        row = self.__db.execute("SELECT fingerprint, endpoint, params, state, project_id, answer, created, updated "
+                                "FROM submissions WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return JournalEntry(*row) if row is not None else None
+
+    def get(self, fingerprint):
+        """
+        :return: JournalEntry namedtuple, None if there is no such submission
+        """
+        with self.__lock:
+            return self._entry(fingerprint)
+
+    def begin(self, fingerprint, endpoint, params):
+        """
+        Record submission before it is sent
+        :return: JournalEntry of previous submission with the same fingerprint, None if it is new
+        """
+        params = json.dumps({name: str(val) for name, val in params.items() if name != "secret_key"}, sort_keys=True)
+        with self.__lock:
+            now = self.__clock()
+            cursor = self.__db.execute("INSERT OR IGNORE INTO submissions (fingerprint, endpoint, params, state, created, "
+                                       "updated) VALUES (?, ?, ?, ?, ?, ?)",
+                                       (fingerprint, endpoint, params, SUBMISSION_PENDING, now, now))
+            return None if cursor.rowcount else self._entry(fingerprint)
+
+    def resolve(self, fingerprint, project_id, answer=None):
+        """
+        Record created project (after successful answer or after manual check of pending submission)
+        :param answer: {String} -> (optional) raw answer of server
+        """
+        with self.__lock:
+            self.__db.execute("UPDATE submissions SET state = ?, project_id = ?, answer = ?, updated = ? "
+                              "WHERE fingerprint = ?",
+                              (SUBMISSION_DONE, str(project_id), answer, self.__clock(), fingerprint))
+
+    def forget(self, fingerprint):
+        """
+        Drop submission: server rejected it, or project has to be ordered once more
+        """
+        with self.__lock:
+            self.__db.execute("DELETE FROM submissions WHERE fingerprint = ?", (fingerprint,))
+
+    def entries(self, state=None):
+        """
+        :param state: {String} -> (optional) SUBMISSION_PENDING or SUBMISSION_DONE
+        :return: {List} -> JournalEntry namedtuples, oldest first
+        """
+        query = "SELECT fingerprint, endpoint, params, state, project_id, answer, created, updated FROM submissions"
+        with self.__lock:
+            if state is None:
+                rows = self.__db.execute(query + " ORDER BY created").fetchall()
+            else:
+                rows = self.__db.execute(query + " WHERE state = ? ORDER BY created", (state,)).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+class CommentStore:
+    """
+    Local store of project comments keyed by project id and comment id, updated by OhtApi.sync_comments.
+    Answer which did not change since previous sync is not parsed at all, otherwise only new comments
+    are turned into namedtuples. If path is set, new comments are appended to it as compact json lines
+    [project_id, comment] and loaded in constructor. Thread-safe.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: {String} -> (optional) file to keep comments, memory only store if not specified
+        """
+        self.path = path
+        self.__lock = threading.Lock()
+        # project_id: {comment id: comment dict}
+        self.__comments = {}
+        # project_id: digest of last answer
+        self.__digests = {}
+        if path and os.path.exists(path):
+            with open(path, "rb") as file:
+                for line in file:
+                    if line.strip():
+                        project_id, comment = _json_loads(line)
+                        self.__comments.setdefault(str(project_id), {})[str(comment["id"])] = comment
+
+    def __len__(self):
+        with self.__lock:
+            return sum(len(comments) for comments in self.__comments.values())
+
+    def projects(self):
+        """
+        :return: {List} -> id (str) of projects with stored comments
+        """
+        with self.__lock:
+            return list(self.__comments)
+
+    def comments(self, project_id):
+        """
+        :return: {List} -> stored comments of project (namedtuples like project_comments results), oldest first
+        """
+        with self.__lock:
+            comments = list(self.__comments.get(str(project_id), {}).values())
+        return [_json_to_object_hook(comment) for comment in comments]
+
+    def update(self, project_id, raw):
+        """
+        Merge project_comments answer into store
+        :param project_id: project id
+        :param raw: {String} -> raw project_comments answer
+        :return: {List} -> new comments (namedtuples like project_comments results)
+        :raise OhtError if server return non zero status code
+        """
+        project_id = str(project_id)
+        digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+        with self.__lock:
+            if self.__digests.get(project_id) == digest:
+                return []
+        data = _json_loads(raw)
+        if data["status"]["code"] != 0:
+            raise OhtError(json.loads(raw, object_hook=_json_to_object_hook))
+        with self.__lock:
+            known = self.__comments.setdefault(project_id, {})
+            new = [comment for comment in data["results"] or [] if str(comment["id"]) not in known]
+            if new and self.path:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.writelines(json.dumps([project_id, comment], separators=(",", ":"), ensure_ascii=False) + "\n"
+                                    for comment in new)
+            for comment in new:
+                known[str(comment["id"])] = comment
+            self.__digests[project_id] = digest
+        return [_json_to_object_hook(comment) for comment in new]
+
+
+class LanguageIndex:
+    """
+    Local index of supported_language_pairs (and expertises) answers with O(1) lookups,
+    used to check request parameters before sending them to OHT (see OhtApi language_index param)
+    """
+
+    def __init__(self, language_pairs=None, expertises=None):
+        """
+        :param language_pairs: (optional) supported_language_pairs answer
+        :param expertises: {Dict} -> (optional) (source_lang, target_lang): expertises answer,
+            use ("", "") key for answer of expertises() without languages
+        """
+        self.__pairs = {}
+        self.__expertises = {}
+        if language_pairs is not None:
+            self.add_language_pairs(language_pairs)
+        for (source_lang, target_lang), answer in (expertises or {}).items():
+            self.add_expertises(answer, source_lang, target_lang)
+
+    @classmethod
+    def from_api(cls, api, expertise_pairs=()):
+        """
+        Build index with requests to OHT server
+        :param api: OhtApi
+        :param expertise_pairs: {List} -> (source_lang, target_lang) pairs to fetch expertises for,
+            general expertises list is always fetched
+        """
+        index = cls(api.supported_language_pairs())
+        index.add_expertises(api.expertises())
+        for source_lang, target_lang in expertise_pairs:
+            index.add_expertises(api.expertises(source_lang, target_lang), source_lang, target_lang)
+        return index
+
+    @staticmethod
+    def _key(source_lang, target_lang):
+        return source_lang.lower(), target_lang.lower()
+
+    def add_language_pairs(self, answer):
+        """
+        :param answer: supported_language_pairs answer
+        :raise OhtError if answer has non zero status code
+        """
+        if answer.status.code != 0:
+            raise OhtError(answer)
+        for item in answer.results:
+            for target in item.targets:
+                self.__pairs[self._key(item.source.code, target.code)] = target.availability
+
+    def add_expertises(self, answer, source_lang="", target_lang=""):
+        """
+        :param answer: expertises answer
+        :param source_lang: {String} -> languages expertises was requested for, empty for general list
+        :param target_lang: {String}
+        :raise OhtError if answer has non zero status code
+        """
+        if answer.status.code != 0:
+            raise OhtError(answer)
+        self.__expertises[self._key(source_lang, target_lang)] = frozenset(item.expertise_code for item in answer.results)
+
+    def __len__(self):
+        return len(self.__pairs)
+
+    def is_supported(self, source_lang, target_lang):
+        return self._key(source_lang, target_lang) in self.__pairs
+
+    def availability(self, source_lang, target_lang):
+        """
+        :return: {String} -> high | medium | low, None if pair is not supported
+        """
+        return self.__pairs.get(self._key(source_lang, target_lang))
+
+    def expertises_for(self, source_lang, target_lang):
+        """
+        :return: {frozenset} -> expertise codes for pair (general list if there is no pair specific one),
+            None if index has no expertises
+        """
+        found = self.__expertises.get(self._key(source_lang, target_lang))
+        return found if found is not None else self.__expertises.get(("", ""))
+
+    def check(self, source_lang, target_lang, expertise=""):
+        """
+        :raise ValueError if language pair or expertise is not supported
+        """
+        if self.__pairs and not self.is_supported(source_lang, target_lang):
+            raise ValueError("language pair {0} -> {1} is not supported".format(source_lang, target_lang))
+        known = self.expertises_for(source_lang, target_lang)
+        if expertise and known is not None and expertise not in known:
+            raise ValueError("expertise {0} is not supported for {1} -> {2}".format(expertise, source_lang, target_lang))
+
+
+def _check_url(transport, url, timeout, background=False):
+    """
+    Availability check of url, done once for all instances
+    :return: concurrent.futures.Future -> True if url return 200, False for other code;
+        failed check (ConnectionError, ...) is not cached
+    """
+    with _url_checks_lock:
+        future = _url_checks.get(url)
+        if future is not None:
+            return future
+        future = _url_checks[url] = concurrent.futures.Future()
+
+    def check():
+        try:
+            future.set_result(transport.request("head", url, timeout=timeout).status_code == requests.codes.ok)
+        except Exception as error:
+            with _url_checks_lock:
+                _url_checks.pop(url, None)
+            future.set_exception(error)
+
+    if background:
+        threading.Thread(target=check, daemon=True).start()
+    else:
+        check()
+    return future
+
+
+def _body_size(data):
+    """
+    :return: {Integer} -> size of request body passed as data to transport, 0 if unknown
+    """
+    if data is None:
+        return 0
+    if isinstance(data, dict):
+        return len(urllib.parse.urlencode(data))
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def _request_size(kwargs):
+    """
+    :return: {Integer} -> size of url encoded query string and body of request with transport kwargs
+    """
+    params = kwargs.get("params")
+    query = len(urllib.parse.urlencode([(name, val) for name, val in params.items() if val is not None],
+                                       doseq=True)) if params else 0
+    return query + _body_size(kwargs.get("data"))
+
+
+def _response_size(response, stream):
+    """
+    :return: {Integer} -> size of response body, for streamed response - from Content-Length header
+    """
+    if not stream:
+        content = getattr(response, "content", None)
+        return len(content) if content is not None else 0
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except (AttributeError, ValueError):
+        return 0
+
+
+class RequestStats:
+    """
+    Thread-safe accounting of HTTP requests per endpoint (key of OhtApi._apiUrl)
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__stats = {}
+
+    def record(self, endpoint, bytes_sent=0, bytes_received=0, seconds=0.0, error=False):
+        with self.__lock:
+            calls, errors, sent, received, total = self.__stats.get(endpoint, (0, 0, 0, 0, 0.0))
+            self.__stats[endpoint] = EndpointStats(calls + 1, errors + bool(error), sent + bytes_sent,
+                                                   received + bytes_received, total + seconds)
+
+    def snapshot(self):
+        """
+        :return: {Dict} -> endpoint: EndpointStats namedtuple with fields:
+            calls: {Integer} -> number of HTTP requests
+            errors: {Integer} -> number of requests failed with exception (connection error, timeout, ...)
+            bytes_sent: {Integer} -> size of request bodies
+            bytes_received: {Integer} -> size of response bodies
+            seconds: {Float} -> total wall time of requests
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def calls(self, endpoint=None):
+        """
+        :return: {Integer} -> number of requests to endpoint, or to all endpoints if not specified
+        """
+        with self.__lock:
+            if endpoint is not None:
+                return self.__stats[endpoint].calls if endpoint in self.__stats else 0
+            return sum(item.calls for item in self.__stats.values())
+
+    def reset(self):
+        with self.__lock:
+            self.__stats.clear()
+
+
+def new_span(parent=None):
+    """
+    :param parent: SpanContext or None to start new trace
+    :return: SpanContext -> child of parent with random ids in W3C trace context format
+    """
+    span_id = "{0:016x}".format(random.getrandbits(64))
+    if parent is None:
+        return SpanContext("{0:032x}".format(random.getrandbits(128)), span_id, None)
+    return SpanContext(parent.trace_id, span_id, parent.span_id)
+
+
+def current_span():
+    """
+    :return: SpanContext set by innermost use_span or None
+    """
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def use_span(span=None):
+    """
+    Make span (new root span if not specified) parent of spans of requests made inside with block.
+    Context is kept per thread and per asyncio task, worker threads of *_many methods do not inherit it.
+    """
+    span = new_span() if span is None else span
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def traceparent(span):
+    """
+    :return: {String} -> W3C traceparent header value for span
+    """
+    return "00-{0}-{1}-01".format(span.trace_id, span.span_id)
+
+
+class RequestTrace:
+    """
+    One call of OHT endpoint as seen by RequestHooks. before_request gets method, endpoint and span filled,
+    after_request gets the rest. Timings are in seconds, None if unknown:
+        dns, connect - of new connection, measured only by AsyncOhtTransport(trace=True)
+        ttfb - from sending request till response headers (includes dns and connect)
+        download - reading of response body, None for streamed response (body is read by caller)
+        seconds - wall time of HTTP request
+        decode - parsing of answer (json_to_ntuple or json_to_view), None for raw answers
+        total - from before_request till after_request: rate limiting, retries and decoding included
+    Network fields describe the last attempt, attempts is number of sent requests.
+    """
+    __slots__ = ("method", "endpoint", "span", "url", "attempts", "http_status", "oht_code", "bytes_sent",
+                 "bytes_received", "dns", "connect", "ttfb", "download", "seconds", "decode", "total", "error",
+                 "_start")
+
+    def __init__(self, method, endpoint, span=None):
+        self.method = method
+        self.endpoint = endpoint
+        self.span = span
+        self.url = None
+        self.attempts = 0
+        self.http_status = self.oht_code = None
+        self.bytes_sent = self.bytes_received = 0
+        self.dns = self.connect = self.ttfb = self.download = self.seconds = self.decode = self.total = None
+        self.error = None
+        self._start = time.perf_counter()
+
+    def _response(self, response, error, seconds, bytes_sent, bytes_received, stream):
+        self.attempts += 1
+        self.seconds = seconds
+        self.error = error
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.http_status = response.status_code if response is not None else None
+        timings = getattr(response, "timings", None)
+        if timings is not None:
+            self.dns, self.connect, self.ttfb, self.download = timings
+            return
+        self.dns = self.connect = self.ttfb = self.download = None
+        # requests measures elapsed till response headers, body of not streamed response is read after it
+        elapsed = getattr(response, "elapsed", None)
+        if elapsed is not None:
+            self.ttfb = elapsed.total_seconds()
+            if not stream:
+                self.download = max(0.0, seconds - self.ttfb)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if not name.startswith("_")}
+
+    def __repr__(self):
+        return "RequestTrace({0!r})".format(self.as_dict())
+
+
+class RequestHooks:
+    """
+    Base class of instrumentation hooks of OhtApi (see OhtApi.add_hook). Both methods are called in thread
+    (or event loop) of request, so they should be fast. Exceptions of hooks are propagated to caller of API method.
+    """
+
+    def before_request(self, trace):
+        """
+        :param trace: RequestTrace with method, endpoint and span
+        """
+
+    def after_request(self, trace):
+        """
+        :param trace: completed RequestTrace, error is set if request or decoding failed
+        """
+
+
+class HistogramExporter(RequestHooks):
+    """
+    Thread-safe in-memory histograms of RequestTrace timings per endpoint (key of OhtApi._apiUrl)
+    and counts of answers per endpoint, HTTP status and OHT status code
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS, timings=TRACE_TIMINGS):
+        """
+        :param buckets: {Iterable} -> upper bounds of buckets in seconds
+        :param timings: {Iterable} -> names of RequestTrace timings to collect
+        """
+        self.__bounds = tuple(sorted(buckets))
+        self.__timings = tuple(timings)
+        self.__lock = threading.Lock()
+        # (endpoint, timing): [counts per bucket, count, sum]
+        self.__histograms = {}
+        self.__statuses = {}
+
+    def after_request(self, trace):
+        with self.__lock:
+            for name in self.__timings:
+                value = getattr(trace, name)
+                if value is None:
+                    continue
+                histogram = self.__histograms.get((trace.endpoint, name))
+                if histogram is None:
+                    histogram = self.__histograms[(trace.endpoint, name)] = [[0] * (len(self.__bounds) + 1), 0, 0.0]
+                histogram[0][bisect.bisect_left(self.__bounds, value)] += 1
+                histogram[1] += 1
+                histogram[2] += value
+            key = (trace.endpoint, trace.http_status, trace.oht_code)
+            self.__statuses[key] = self.__statuses.get(key, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: {Dict} -> (endpoint, timing): HistogramSnapshot namedtuple with fields:
+            count: {Integer} -> number of samples
+            sum: {Float} -> sum of samples in seconds
+            buckets: {Tuple} -> (upper bound, number of samples <= bound) pairs, the last bound is float("inf")
+        """
+        bounds = self.__bounds + (float("inf"),)
+        with self.__lock:
+            histograms = {key: (list(counts), count, total) for key, (counts, count, total) in self.__histograms.items()}
+        snapshot = {}
+        for key, (counts, count, total) in histograms.items():
+            cumulative, buckets = 0, []
+            for bound, number in zip(bounds, counts):
+                cumulative += number
+                buckets.append((bound, cumulative))
+            snapshot[key] = HistogramSnapshot(count, total, tuple(buckets))
+        return snapshot
+
+    def percentile(self, endpoint, timing, part):
+        """
+        :param part: {Float} -> 0..1, e.g. 0.99 for p99
+        :return: {Float} -> estimation of percentile in seconds (linear inside bucket), None if there are no samples
+        """
+        with self.__lock:
+            histogram = self.__histograms.get((endpoint, timing))
+            if histogram is None:
+                return None
+            counts, count = list(histogram[0]), histogram[1]
+        rank, seen = part * count, 0
+        for index, number in enumerate(counts):
+            if number and seen + number >= rank:
+                lower = self.__bounds[index - 1] if index else 0.0
+                if index == len(self.__bounds):
+                    return lower
+                return lower + (self.__bounds[index] - lower) * max(0.0, rank - seen) / number
+            seen += number
+        return self.__bounds[-1]
+
+    def statuses(self):
+        """
+        :return: {Dict} -> (endpoint, HTTP status, OHT status code): number of calls,
+            statuses are None for failed requests and raw answers
+        """
+        with self.__lock:
+            return dict(self.__statuses)
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms.clear()
+            self.__statuses.clear()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Request is rejected without sending, because OHT server failed too many times in a row (see ResiliencePolicy)
+    """
+
+
+# exceptions which mean that request did not reach server or server did not answer in time,
+# other errors (invalid URL, bad header, ...) are not retried and are not failures of server
+_TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, asyncio.TimeoutError) + (
+    (aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError) if aiohttp is not None else ())
+# exceptions which mean that request surely did not leave client
+_NOT_SENT_ERRORS = (CircuitOpenError, requests.exceptions.ConnectTimeout) + (
+    (aiohttp.ClientConnectorError,) + ((aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, "ConnectionTimeoutError")
+                                       else ()) if aiohttp is not None else ())
+
+
+def _not_sent(error):
+    """
+    :return: {Boolean} -> True if request failed before reaching server: rejected by circuit breaker,
+        connection refused, host not resolved or connect timeout
+    """
+    if isinstance(error, _NOT_SENT_ERRORS):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # requests wraps urllib3 MaxRetryError, its reason is the original error
+        reason = error.args[0] if error.args else None
+        return isinstance(getattr(reason, "reason", reason), urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class ResiliencePolicy:
+    """
+    Timeouts, retries and circuit breaker for requests of OhtApi (thread-safe, can be shared between instances).
+    Only GET requests to retry_endpoints are retried: on connection error, timeout or status from retry_statuses.
+    Circuit breaker counts consecutive failures (connection errors, timeouts, 5xx answers) of all endpoints:
+    after failure_threshold of them requests fail fast with CircuitOpenError for reset_timeout seconds,
+    then one trial request is let through, its success closes the breaker.
+    """
+
+    def __init__(self, connect_timeout=10, read_timeout=60, timeouts=None, retries=3, backoff=0.5, max_backoff=30,
+                 jitter=1.0, retry_endpoints=RETRY_ENDPOINTS, retry_statuses=RETRY_STATUSES, failure_threshold=5,
+                 reset_timeout=30, clock=time.monotonic, sleep=time.sleep, random=random.random):
+        """
+        :param connect_timeout: {Float} -> seconds to establish connection, None - wait forever
+        :param read_timeout: {Float} -> seconds to wait for answer data, None - wait forever
+        :param timeouts: {Dict} -> (optional) endpoint: (connect_timeout, read_timeout) overrides
+        :param retries: {Integer} -> maximum number of retries of one request
+        :param backoff: {Float} -> delay before first retry in seconds, doubled for every next retry
+        :param max_backoff: {Float} -> maximum delay between retries in seconds
+        :param jitter: {Float} -> 0..1, part of delay which is random (1 - delay is uniform in [0, backoff])
+        :param retry_endpoints: {Iterable} -> keys of OhtApi._apiUrl which can be retried
+        :param retry_statuses: {Iterable} -> HTTP codes to retry
+        :param failure_threshold: {Integer} -> consecutive failures to open circuit breaker, None - no breaker
+        :param reset_timeout: {Float} -> seconds circuit breaker stays open
+        :param clock: monotonic time function
+        :param sleep: function used to wait between retries
+        :param random: function returning float in [0, 1) used for jitter
+        """
+        self.__timeout = (connect_timeout, read_timeout)
+        self.__timeouts = dict(timeouts or {})
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__maxBackoff = max_backoff
+        self.__jitter = jitter
+        self.__retryEndpoints = frozenset(retry_endpoints)
+        self.__retryStatuses = frozenset(retry_statuses)
+        self.__failureThreshold = failure_threshold
+        self.__resetTimeout = reset_timeout
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__random = random
+        self.__lock = threading.Lock()
+        self.__state = BREAKER_CLOSED
+        self.__failures = 0
+        self.__openedAt = 0.0
+        self.__trialInFlight = False
+        self.__opened = 0
+        self.__rejected = 0
+        self.__retryCounts = {}
+
+    @classmethod
+    def disabled(cls, **kwargs):
+        """
+        :return: ResiliencePolicy without timeouts, retries and circuit breaker (default of OhtApi),
+            kwargs override it, e.g. disabled(connect_timeout=10) for connect timeout only
+        """
+        params = dict(connect_timeout=None, read_timeout=None, retries=0, failure_threshold=None)
+        params.update(kwargs)
+        return cls(**params)
+
+    def timeout(self, endpoint):
+        """
+        :return: {Tuple} -> (connect_timeout, read_timeout) for endpoint
+        """
+        return self.__timeouts.get(endpoint, self.__timeout)
+
+    def sleep(self, seconds):
+        self.__sleep(seconds)
+
+    def before_request(self, endpoint):
+        """
+        :return: {Boolean} -> True if request is trial of half-open circuit breaker, pass it to after_request
+        :raise CircuitOpenError if circuit breaker does not let request through
+        """
+        with self.__lock:
+            if self.__state == BREAKER_CLOSED:
+                return False
+            if self.__state == BREAKER_OPEN and self.__clock() - self.__openedAt >= self.__resetTimeout:
+                self.__state = BREAKER_HALF_OPEN
+            if self.__state == BREAKER_HALF_OPEN and not self.__trialInFlight:
+                self.__trialInFlight = True
+                return True
+            self.__rejected += 1
+        raise CircuitOpenError("OHT server is unavailable, {0} failed requests in a row".format(self.__failures))
+
+    def after_request(self, method, endpoint, attempt, status=None, error=None, trial=False):
+        """
+        Account result of request and decide about retry.
+        Only result of trial request changes state of half-open breaker, requests started before breaker
+        was opened do not close it. Non-transient errors do not change state of breaker.
+        :param attempt: {Integer} -> 0 for first attempt, 1 for first retry, ...
+        :param status: {Integer} -> HTTP code of answer, None if request failed with error
+        :param error: exception raised by transport
+        :param trial: {Boolean} -> result of before_request
+        :return: {Float} -> delay before retry in seconds, None if request should not be retried
+        """
+        transient = isinstance(error, _TRANSIENT_ERRORS) if error is not None else status in self.__retryStatuses
+        failed = (error is not None and transient) or (status is not None and status >= 500)
+        with self.__lock:
+            if trial:
+                self.__trialInFlight = False
+            if failed:
+                self.__failures += 1
+                if trial or (self.__failureThreshold is not None and self.__state == BREAKER_CLOSED and
+                             self.__failures >= self.__failureThreshold):
+                    self.__state = BREAKER_OPEN
+                    self.__openedAt = self.__clock()
+                    self.__opened += 1
+            elif error is None and (trial or self.__state == BREAKER_CLOSED):
+                self.__failures = 0
+                self.__state = BREAKER_CLOSED
+            if not transient or attempt >= self.__retries or method.lower() != "get" \
+                    or endpoint not in self.__retryEndpoints:
+                return None
+            self.__retryCounts[endpoint] = self.__retryCounts.get(endpoint, 0) + 1
+        delay = min(self.__maxBackoff, self.__backoff * (2 ** attempt))
+        return delay * (1 - self.__jitter * self.__random())
+
+    def stats(self):
+        """
+        :return: ResilienceStats namedtuple with fields:
+            retries: {Dict} -> endpoint: number of retries
+            state: {String} -> BREAKER_CLOSED, BREAKER_OPEN or BREAKER_HALF_OPEN
+            failures: {Integer} -> current number of consecutive failures
+            opened: {Integer} -> how many times circuit breaker was opened
+            rejected: {Integer} -> number of requests rejected by open circuit breaker
+        """
+        with self.__lock:
+            state = self.__state
+            if state == BREAKER_OPEN and self.__clock() - self.__openedAt >= self.__resetTimeout:
+                state = BREAKER_HALF_OPEN
+            return ResilienceStats(dict(self.__retryCounts), state, self.__failures, self.__opened, self.__rejected)
+
+    def reset(self):
+        """
+        Close circuit breaker and clear counters
+        """
+        with self.__lock:
+            self.__state = BREAKER_CLOSED
+            self.__failures = self.__opened = self.__rejected = 0
+            self.__trialInFlight = False
+            self.__retryCounts.clear()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: rate tokens per second, at most burst tokens are accumulated.
+    Tokens are reserved in advance, so concurrent callers are queued fairly instead of polling.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        """
+        :param rate: {Float} -> tokens per second (target QPS)
+        :param burst: {Float} -> bucket size, rate (but at least 1) if not specified
+        :param clock: monotonic time function
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(1.0, self.rate)
+        self._clock = clock
+        self.__lock = threading.Lock()
+        self.__state = None
+
+    def _refill(self, state, tokens):
+        """
+        :param state: {Tuple} -> (tokens, timestamp) or None for full bucket
+        :return: {Tuple} -> (new state, seconds to wait for reserved tokens)
+        """
+        now = self._clock()
+        available, last = state if state is not None else (self.burst, now)
+        if now < last:
+            # timestamp of other clock (previous boot, other host): do not wait for it, drop old debt
+            available = max(0.0, available)
+        available = min(self.burst, available + max(0.0, now - last) * self.rate) - tokens
+        return (available, now), max(0.0, -available / self.rate)
+
+    def reserve(self, tokens=1):
+        """
+        Take tokens from bucket, going into debt if there are not enough of them
+        :return: {Float} -> seconds caller has to wait before sending request
+        """
+        with self.__lock:
+            self.__state, delay = self._refill(self.__state, tokens)
+        return delay
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    TokenBucket with state in local file, shared by all processes on the host which use the same path
+    (put file to /dev/shm to keep it in shared memory). Access is serialized with fcntl.flock.
+    Timestamps in file are wall time: monotonic clock differs between processes of containers and boots.
+    """
+    _format = struct.Struct("dd")
+
+    def __init__(self, path, rate, burst=None, clock=time.time):
+        """
+        :param path: {String} -> state file, created if it does not exist
+        :param clock: wall time function, the same for all processes using the file
+        other params - see TokenBucket
+        """
+        if fcntl is None:
+            raise ImportError("FileTokenBucket requires fcntl module (POSIX)")
+        super().__init__(rate, burst, clock)
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__fd = None
+        self.__pid = None
+
+    def _file(self):
+        # descriptor is not inherited by forked processes, otherwise they would share one flock
+        if self.__pid != os.getpid():
+            self.__fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.__pid = os.getpid()
+        return self.__fd
+
+    def reserve(self, tokens=1):
+        with self.__lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, self._format.size, 0)
+                state = self._format.unpack(raw) if len(raw) == self._format.size else None
+                state, delay = self._refill(state, tokens)
+                os.pwrite(fd, self._format.pack(*state), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        return delay
+
+    def close(self):
+        with self.__lock:
+            if self.__fd is not None and self.__pid == os.getpid():
+                os.close(self.__fd)
+            self.__fd = self.__pid = None
+
+
+class RateLimiter:
+    """
+    Client-side pacing of OhtApi requests by endpoint class:
+        RATE_MT - machine-translate, machine-detect-lang
+        RATE_READ - other GET requests
+        RATE_WRITE - POST and DELETE requests
+    Every request (including retries) takes one token from the bucket of its class, classes without bucket are not limited.
+    """
+
+    def __init__(self, read=None, write=None, mt=None, sleep=time.sleep):
+        """
+        :param read: TokenBucket (or FileTokenBucket) or number of requests per second
+        :param write: TokenBucket (or FileTokenBucket) or number of requests per second
+        :param mt: TokenBucket (or FileTokenBucket) or number of requests per second
+        :param sleep: function used to wait for token
+        """
+        self.__buckets = {}
+        for name, bucket in ((RATE_READ, read), (RATE_WRITE, write), (RATE_MT, mt)):
+            if bucket is not None:
+                self.__buckets[name] = bucket if isinstance(bucket, TokenBucket) else TokenBucket(bucket)
+        self.__sleep = sleep
+        self.__lock = threading.Lock()
+        self.__waited = {}
+
+    @staticmethod
+    def endpoint_class(method, endpoint):
+        """
+        :return: {String} -> RATE_READ, RATE_WRITE or RATE_MT
+        """
+        if endpoint in _MT_ENDPOINTS:
+            return RATE_MT
+        return RATE_READ if method.lower() in ("get", "head") else RATE_WRITE
+
+    def bucket(self, endpoint_class):
+        return self.__buckets.get(endpoint_class)
+
+    def reserve(self, method, endpoint):
+        """
+        Take token for request
+        :return: {Float} -> seconds to wait before sending request
+        """
+        name = self.endpoint_class(method, endpoint)
+        bucket = self.__buckets.get(name)
+        if bucket is None:
+            return 0.0
+        delay = bucket.reserve()
+        if delay:
+            with self.__lock:
+                calls, seconds = self.__waited.get(name, (0, 0.0))
+                self.__waited[name] = (calls + 1, seconds + delay)
+        return delay
+
+    def acquire(self, method, endpoint):
+        """
+        Block until request can be sent
+        """
+        delay = self.reserve(method, endpoint)
+        if delay:
+            self.__sleep(delay)
+
+    def stats(self):
+        """
+        :return: {Dict} -> endpoint class: (number of delayed requests, total delay in seconds)
+        """
+        with self.__lock:
+            return dict(self.__waited)
+
+
+class SingleFlight:
+    """
+    Deduplication of concurrent identical calls: while call with some key is in flight, other callers
+    with the same key wait for its result (or exception) instead of doing the same work.
+    Works for threads (do) and for coroutines of one event loop (do_async).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        self.__shared = 0
+
+    def do(self, key, func):
+        """
+        :param key: hashable key of call
+        :param func: {Callable} -> called without arguments if there is no call with key in flight
+        :return: result of func
+        """
+        with self.__lock:
+            future = self.__calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.__calls[key] = concurrent.futures.Future()
+            else:
+                self.__shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+
+    async def do_async(self, key, func):
+        """
+        :param key: hashable key of call
+        :param func: {Callable} -> returns coroutine, called if there is no call with key in flight in running loop
+        :return: result of coroutine
+        """
+        key = (asyncio.get_running_loop(), key)
+        with self.__lock:
+            task = self.__calls.get(key)
+            if task is None:
+                task = self.__calls[key] = asyncio.ensure_future(func())
+                task.add_done_callback(lambda _: self._forget(key))
+            else:
+                self.__shared += 1
+        # cancellation of one waiter does not cancel request for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key):
+        with self.__lock:
+            self.__calls.pop(key, None)
+
+    def shared(self):
+        """
+        :return: {Integer} -> number of calls which got result of other call in flight
+        """
+        with self.__lock:
+            return self.__shared
+
+
+class BudgetError(ValueError):
+    """
+    Order costs more credits than account balance or budget allows, nothing was ordered
+    """
+
+    def __init__(self, required, available):
+        super().__init__("order requires {0} credits, {1} available".format(required, available))
+        self.required = required
+        self.available = available
+
+
+def _lazy_wrap(value):
+    if type(value) is dict:
+        return LazyResponse(value)
+    if type(value) is list:
+        return LazyList(value)
+    return value
+
+
+class LazyResponse:
+    """
+    Read-only view over parsed json object: fields are available as attributes (like namedtuple in
+    json_to_ntuple result), nested objects and lists are wrapped only when accessed.
+    Keys which are not identifiers (e.g. resource_binding) are available as view[key].
+    """
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        try:
+            return _lazy_wrap(self._data[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, key):
+        return _lazy_wrap(self._data[key])
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyResponse):
+            other = other._data
+        return self._data == other
+
+    def __repr__(self):
+        return "LazyResponse({0!r})".format(self._data)
+
+    @property
+    def _fields(self):
+        return tuple(self._data)
+
+    def _asdict(self):
+        return dict(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return ((key, _lazy_wrap(val)) for key, val in self._data.items())
+
+    def get(self, key, default=None):
+        return _lazy_wrap(self._data.get(key, default))
+
+
+class LazyList:
+    """
+    Read-only view over parsed json list, items are wrapped only when accessed
+    """
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyList(self._data[index])
+        return _lazy_wrap(self._data[index])
+
+    def __iter__(self):
+        return map(_lazy_wrap, self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyList):
+            other = other._data
+        return self._data == other
+
+    def __repr__(self):
+        return "LazyList({0!r})".format(self._data)
+
+
+class OhtTransport:
+    """
+    HTTP transport for OhtApi: one requests.Session with persistent (keep-alive) connection pool.
+    Any object with the same request(method, url, **kwargs) -> requests.Response signature can be passed
+    to OhtApi instead of it.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, session=None):
+        """
+        :param pool_connections: {Integer} -> number of per-host connection pools to cache
+        :param pool_maxsize: {Integer} -> maximum number of kept-alive connections per host
+        :param pool_block: {Boolean} -> block when pool_maxsize connections per host are busy instead of opening extra ones
+        :param keep_alive: {Boolean} -> if False, send "Connection: close" and do not reuse connections
+        :param session: {requests.Session} -> (optional) ready session to use instead of creating new one
+        """
+        self.session = session if session is not None else requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
 
 class OhtApi:
 
@@ -30,30 +1885,192 @@ class OhtApi:
                 "supported-expertises": "/discover/expertise"
                 }
 
-    def __init__(self, public_key, private_key, sandbox=False, time_out=10):
+    def __init__(self, public_key, private_key, sandbox=False, time_out=10, transport=None, response_mode=RESPONSE_NTUPLE,
+                 discovery_cache=None, language_index=None, request_stats=None, url_check=URL_CHECK_EAGER,
+                 resilience=None, rate_limiter=None, mt_cache=None, single_flight=None, journal=None, hooks=None):
         """
         time_out param use only for check URL availability
+        transport param - (optional) OhtTransport or compatible object, all requests go through it.
+            If not specified, new OhtTransport with default pool settings is created (and closed by close())
+        response_mode param - RESPONSE_NTUPLE (default) - API methods return namedtuple (see json_to_ntuple),
+            RESPONSE_LAZY - API methods return LazyResponse (see json_to_view)
+        discovery_cache param - (optional) TTLCache for answers of supported_languages, supported_language_pairs and
+            expertises. Can be shared between instances. Only answers with status code 0 are cached.
+        language_index param - (optional) LanguageIndex, if set quote, create_translation_project and
+            create_proof_translated_project check languages and expertise locally and raise ValueError without request
+        request_stats param - (optional) RequestStats to share between instances, new one is created if not specified
+        url_check param - when URL availability is checked:
+            URL_CHECK_EAGER (default) - in constructor, set_base_url and set_sandbox_url (blocking, up to time_out seconds)
+            URL_CHECK_LAZY - before first request
+            URL_CHECK_BACKGROUND - in background thread, first request waits for its result
+            For lazy and background modes result is cached and shared by all instances with the same URL.
+        resilience param - (optional) ResiliencePolicy (timeouts, retries, circuit breaker) to share between instances,
+            if not specified, requests have no timeouts, retries and circuit breaker (see ResiliencePolicy.disabled)
+        rate_limiter param - (optional) RateLimiter to pace requests, share it between instances to keep total QPS
+        mt_cache param - (optional) MtCache for answers of machine_translate, machine_translate_many and
+            machine_detect_lang. Can be shared between instances. Only answers with status code 0 are cached.
+        single_flight param - (optional) SingleFlight: concurrent project_detail, get_resource and word_count calls
+            with the same arguments share one request. Share it to deduplicate calls of many instances,
+            new one is created if not specified.
+        journal param - (optional) SubmissionJournal, if set create_*_project methods never submit the same project twice
+        hooks param - (optional) RequestHooks (e.g. HistogramExporter) or list of them to instrument every request,
+            see add_hook
         """
         self.__askTimeOut = time_out
         self.__publicKey = public_key
         self.__privateKey = private_key
         self.__sandbox = sandbox
+        self.__responseMode = self._check_response_mode(response_mode)
+        self.__discoveryCache = discovery_cache
+        self.__languageIndex = language_index
+        self.__requestStats = RequestStats() if request_stats is None else request_stats
+        if url_check not in (URL_CHECK_EAGER, URL_CHECK_LAZY, URL_CHECK_BACKGROUND):
+            raise ValueError("unknown url check mode: {0}".format(url_check))
+        self.__urlCheck = url_check
+        self.__urlChecked = False
+        self.__resilience = ResiliencePolicy.disabled() if resilience is None else resilience
+        self.__rateLimiter = rate_limiter
+        self.__mtCache = mt_cache
+        self.__singleFlight = SingleFlight() if single_flight is None else single_flight
+        self.__journal = journal
+        if hooks is None:
+            hooks = ()
+        self.__hooks = (hooks,) if hasattr(hooks, "after_request") else tuple(hooks)
+
+        self.__ownTransport = transport is None
+        self.__transport = OhtTransport() if transport is None else transport
 
         self.__baseUrl = "http://www.onehourtranslation.com/api/2"
         self.__sandboxUrl = "http://sandbox.onehourtranslation.com/api/2"
 
         self._renew_work_url()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Release pooled connections of own transport. Transport passed to constructor stays untouched.
+        """
+        if self.__ownTransport:
+            self.__transport.close()
+
+    def transport(self):
+        return self.__transport
+
+    def response_mode(self):
+        return self.__responseMode
+
+    def discovery_cache(self):
+        return self.__discoveryCache
+
+    def language_index(self):
+        return self.__languageIndex
+
+    def mt_cache(self):
+        return self.__mtCache
+
+    def single_flight(self):
+        return self.__singleFlight
+
+    def journal(self):
+        return self.__journal
+
+    def rate_limiter(self):
+        """
+        :return: RateLimiter of this instance or None
+        """
+        return self.__rateLimiter
+
+    def resilience(self):
+        """
+        :return: ResiliencePolicy of this instance, see its stats() for retry and circuit breaker metrics
+        """
+        return self.__resilience
+
+    def request_stats(self):
+        """
+        :return: RequestStats -> number of HTTP calls, bytes sent/received and wall time per endpoint (key of _apiUrl)
+        """
+        return self.__requestStats
+
+    def hooks(self):
+        """
+        :return: {Tuple} -> registered RequestHooks
+        """
+        return self.__hooks
+
+    def add_hook(self, hook):
+        """
+        Register instrumentation hook: hook.before_request(trace) is called before every call of OHT endpoint,
+        hook.after_request(trace) - after it with completed RequestTrace. Without hooks requests are not traced.
+        :param hook: RequestHooks or object with the same methods
+        """
+        self.__hooks = self.__hooks + (hook,)
+
+    def remove_hook(self, hook):
+        self.__hooks = tuple(item for item in self.__hooks if item is not hook)
+
+    def set_language_index(self, language_index):
+        """
+        :param language_index: LanguageIndex or None to switch local checks off
+        """
+        self.__languageIndex = language_index
+
+    def _check_languages(self, source_lang, target_lang, expertise=""):
+        if self.__languageIndex is not None:
+            self.__languageIndex.check(source_lang, target_lang, expertise)
+
+    def invalidate_discovery_cache(self):
+        """
+        Drop all cached answers of discovery endpoints
+        """
+        if self.__discoveryCache is not None:
+            self.__discoveryCache.invalidate()
+
+    def with_response_mode(self, response_mode):
+        """
+        Shallow copy of this instance (same keys, URLs and transport) with other response mode, e.g. for single call:
+            api.with_response_mode(RESPONSE_LAZY).project_detail(project_id).status.code
+        :param response_mode: RESPONSE_NTUPLE | RESPONSE_LAZY
+        :return: OhtApi
+        """
+        clone = copy.copy(self)
+        clone.__responseMode = self._check_response_mode(response_mode)
+        clone.__ownTransport = False
+        return clone
+
+    @staticmethod
+    def _check_response_mode(response_mode):
+        if response_mode not in (RESPONSE_NTUPLE, RESPONSE_LAZY):
+            raise ValueError("unknown response mode: {0}".format(response_mode))
+        return response_mode
+
     def _renew_work_url(self):
         """
         Check availability self.__workUrl
-        :return: Boolean
+        :return: Boolean, None if check is deferred (see url_check param of constructor)
 
         """
         self.__workUrl = self.__sandboxUrl if self.__sandbox else self.__baseUrl
 
+        if self.__urlCheck != URL_CHECK_EAGER:
+            if "://" not in self.__workUrl:
+                if self.__sandbox:
+                    self.__sandboxUrl = "https://" + self.__sandboxUrl
+                else:
+                    self.__baseUrl = "https://" + self.__baseUrl
+                self.__workUrl = "https://" + self.__workUrl
+            self.__urlChecked = False
+            if self.__urlCheck == URL_CHECK_BACKGROUND:
+                _check_url(self.__transport, self.__workUrl, self.__askTimeOut, background=True)
+            return None
+
         try:
-            rez = requests.head(self.__workUrl, timeout=self.__askTimeOut).status_code == requests.codes.ok
+            rez = self.__transport.request("head", self.__workUrl, timeout=self.__askTimeOut).status_code == requests.codes.ok
         except requests.exceptions.MissingSchema:
             if self.__sandbox:
                 self.__sandboxUrl = "https://" + self.__sandboxUrl
@@ -64,6 +2081,293 @@ class OhtApi:
 
         return rez
 
+    def _url_check_pending(self):
+        return not self.__urlChecked and self.__urlCheck != URL_CHECK_EAGER
+
+    def _wait_url_check(self):
+        """
+        Wait for deferred URL availability check (see url_check param of constructor)
+        :raise requests.exceptions.ConnectionError if URl is unavailable
+        """
+        if self._url_check_pending():
+            _check_url(self.__transport, self.__workUrl, self.__askTimeOut).result()
+            self.__urlChecked = True
+
+    def _request(self, method, endpoint, *url_args, **kwargs):
+        """
+        Single entry point for all HTTP calls to OHT server
+        :param method: {String} -> HTTP method
+        :param endpoint: {String} -> key in _apiUrl
+        :param url_args: values for placeholders in endpoint URL
+        :param kwargs: passed to transport as is (params, files, stream, ...)
+        :return: requests.Response
+        :raise CircuitOpenError if server is degraded (see ResiliencePolicy)
+
+        """
+        return self._send(method, endpoint, url_args, kwargs, self._trace(method, endpoint))
+
+    def _send(self, method, endpoint, url_args, kwargs, trace, finish=True):
+        """
+        _request with RequestTrace (None if there are no hooks), if finish is False caller completes successful trace
+        """
+        try:
+            response = self._send_attempts(method, endpoint, url_args, kwargs, trace)
+        except Exception as exc:
+            if trace is not None:
+                trace.error = exc
+                self._finish_trace(trace)
+            raise
+        if trace is not None and finish:
+            self._finish_trace(trace)
+        return response
+
+    def _send_attempts(self, method, endpoint, url_args, kwargs, trace):
+        self._wait_url_check()
+        policy = self.__resilience
+        kwargs.setdefault("timeout", policy.timeout(endpoint))
+        url = self._url(endpoint, *url_args)
+        attempt = 0
+        while True:
+            trial = policy.before_request(endpoint)
+            if self.__rateLimiter is not None:
+                self.__rateLimiter.acquire(method, endpoint)
+            start = time.perf_counter()
+            response = error = None
+            try:
+                response = self.__transport.request(method, url, **kwargs)
+            except Exception as exc:
+                error = exc
+            seconds = time.perf_counter() - start
+            sent = _request_size(kwargs)
+            received = _response_size(response, kwargs.get("stream")) if response is not None else 0
+            self.__requestStats.record(endpoint, sent, received, seconds, response is None)
+            if trace is not None:
+                trace.url = url
+                trace._response(response, error, seconds, sent, received, kwargs.get("stream"))
+            delay = policy.after_request(method, endpoint, attempt,
+                                         response.status_code if response is not None else None, error, trial)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None and hasattr(response, "close"):
+                response.close()
+            attempt += 1
+            policy.sleep(delay)
+
+    def _url(self, endpoint, *url_args):
+        return self.__workUrl + self._apiUrl[endpoint].format(*url_args)
+
+    def _call(self, method, endpoint, *url_args, **kwargs):
+        """
+        Same as _request, but return parsed response (see json_to_ntuple)
+        """
+        return self._call_with(self._decode, method, endpoint, *url_args, **kwargs)
+
+    def _call_with(self, decode, method, endpoint, *url_args, **kwargs):
+        """
+        Same as _call, but answer text is parsed by decode(text) (e.g. parse and cache), its time is decode
+        of RequestTrace. decode returns parsed answer, or other result and raises OhtError for non zero status code.
+        """
+        trace = self._trace(method, endpoint)
+        if trace is None:
+            return decode(self._request(method, endpoint, *url_args, **kwargs).text)
+        return self._traced_decode(trace, self._send(method, endpoint, url_args, kwargs, trace, False).text, decode)
+
+    def _trace(self, method, endpoint):
+        """
+        :return: RequestTrace passed to before_request of hooks, None if there are no hooks
+        """
+        hooks = self.__hooks
+        if not hooks:
+            return None
+        trace = RequestTrace(method, endpoint, new_span(_current_span.get()))
+        for hook in hooks:
+            hook.before_request(trace)
+        return trace
+
+    def _finish_trace(self, trace):
+        trace.total = time.perf_counter() - trace._start
+        for hook in self.__hooks:
+            hook.after_request(trace)
+
+    def _traced_decode(self, trace, data, decode):
+        start = time.perf_counter()
+        try:
+            answer = decode(data)
+        except Exception as exc:
+            trace.error = exc
+            if isinstance(exc, OhtError):
+                trace.oht_code = exc.answer.status.code
+            raise
+        else:
+            status = getattr(answer, "status", None)
+            trace.oht_code = status.code if status is not None else 0
+            return answer
+        finally:
+            trace.decode = time.perf_counter() - start
+            self._finish_trace(trace)
+
+    def _cached_call(self, endpoint, params):
+        """
+        GET request with answer from discovery cache (if set)
+        """
+        key, answer = self._cache_lookup(endpoint, params)
+        if answer is None:
+            answer = self._call_with(functools.partial(self._cache_store, key), "get", endpoint, params=params)
+        return answer
+
+    def _submit(self, endpoint, params):
+        """
+        POST project creation request, recorded in journal (if set):
+        submission with the same fingerprint returns stored answer, submission with unknown outcome raises
+        PendingSubmissionError, submission rejected by server is forgotten and can be sent again
+        """
+        if self.__journal is None:
+            return self._call("post", endpoint, params=params)
+        self._wait_url_check()
+        fingerprint, previous = self._journal_begin(endpoint, params)
+        if previous is not None:
+            return previous
+        try:
+            return self._call_with(functools.partial(self._journal_end, fingerprint), "post", endpoint, params=params)
+        except Exception as error:
+            self._journal_failed(fingerprint, error)
+            raise
+
+    def _journal_begin(self, endpoint, params):
+        """
+        :return: {Tuple} -> (fingerprint, stored answer of the same submission or None)
+        :raise PendingSubmissionError
+        """
+        fingerprint = SubmissionJournal.fingerprint(endpoint, params)
+        entry = self.__journal.begin(fingerprint, endpoint, params)
+        if entry is None:
+            return fingerprint, None
+        if entry.state != SUBMISSION_DONE:
+            raise PendingSubmissionError(entry)
+        if entry.answer:
+            return fingerprint, self._decode(entry.answer)
+        return fingerprint, self._decode(json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [],
+                                                     "results": {"project_id": entry.project_id}}))
+
+    def _journal_failed(self, fingerprint, error):
+        """
+        Forget submission which surely did not reach server, others stay pending (outcome is unknown)
+        """
+        if _not_sent(error):
+            self.__journal.forget(fingerprint)
+
+    def _journal_end(self, fingerprint, raw):
+        answer = self._decode(raw)
+        if answer.status.code == 0:
+            self.__journal.resolve(fingerprint, answer.results.project_id, raw)
+        else:
+            self.__journal.forget(fingerprint)
+        return answer
+
+    def _flight_key(self, endpoint, url_args, params):
+        return (self.__workUrl, self.__responseMode, endpoint, url_args,
+                tuple(sorted((name, str(val)) for name, val in params.items())))
+
+    def _shared_call(self, endpoint, *url_args, params):
+        """
+        GET _call, concurrent calls with the same arguments share one request (see SingleFlight)
+        """
+        return self.__singleFlight.do(self._flight_key(endpoint, url_args, params),
+                                      lambda: self._call("get", endpoint, *url_args, params=params))
+
+    def _memo_call(self, method, endpoint, key, **kwargs):
+        """
+        Same as _call, but with answer from machine translation cache (if set)
+        """
+        raw = self.__mtCache.get(key) if self.__mtCache is not None else None
+        if raw is None:
+            return self._call_with(functools.partial(self._memo_store, key), method, endpoint, **kwargs)
+        return self._decode(raw)
+
+    def _memo_store(self, key, raw):
+        """
+        :return: parsed answer, raw answer is stored in machine translation cache if status code is 0
+        """
+        answer = self._decode(raw)
+        if self.__mtCache is not None and answer.status.code == 0:
+            self.__mtCache.set(key, raw)
+        return answer
+
+    def _mt_lookup(self, from_lang, to_lang, texts):
+        """
+        :return: {Dict} -> text: (translation, None) for texts found in machine translation cache
+        """
+        found = {}
+        if self.__mtCache is not None:
+            for text in dict.fromkeys(texts):
+                raw = self.__mtCache.get(MtCache.key("translate", from_lang, to_lang, text))
+                if raw is not None:
+                    found[text] = (self._decode(raw).results.TranslatedText, None)
+        return found
+
+    def _mt_store(self, from_lang, to_lang, batch, results):
+        if self.__mtCache is not None:
+            for text, (translation, error) in zip(batch, results):
+                if error is None:
+                    self.__mtCache.set(MtCache.key("translate", from_lang, to_lang, text), _mt_answer(translation))
+
+    def _cache_lookup(self, endpoint, params):
+        """
+        :return: {Tuple} -> (cache key, cached answer or None)
+        """
+        if self.__discoveryCache is None:
+            return None, None
+        key = (self.__workUrl, self.__responseMode, endpoint,
+               tuple(sorted((name, str(val)) for name, val in params.items() if name != "secret_key")))
+        return key, self.__discoveryCache.get(key, self._decode)
+
+    def _cache_store(self, key, text):
+        answer = self._decode(text)
+        if key is not None and answer.status.code == 0:
+            self.__discoveryCache.set(key, answer, text)
+        return answer
+
+    def _download(self, endpoint, url_args, params, path_to_save, chunk_size, resume=False):
+        """
+        Fetch raw (non json) content, see download_resource
+        """
+        if not path_to_save:
+            return self._request("get", endpoint, *url_args, params=params).text
+
+        offset = _range_start(path_to_save, resume)
+        part = path_to_save + PARTIAL_SUFFIX
+        with self._request("get", endpoint, *url_args, params=params, headers=_range_headers(offset), stream=True) as req:
+            if offset and req.status_code == requests.codes.requested_range_not_satisfiable:
+                os.remove(part)
+                return self._download(endpoint, url_args, params, path_to_save, chunk_size)
+            if req.status_code == requests.codes.partial_content and offset:
+                mode = "ab"
+            elif req.status_code == requests.codes.ok:
+                mode = "wb"
+            else:
+                return ""
+            req.raw.decode_content = True
+            with open(part, mode) as file:
+                _copy_stream(req.raw, file, chunk_size)
+        os.replace(part, path_to_save)
+        return path_to_save
+
+    def _upload(self, endpoint, params, body):
+        """
+        Send MultipartEncoder body, files opened by encoder are closed when request is done
+        """
+        with body:
+            return self._call("post", endpoint, params=params, data=body, headers=body.headers())
+
+    def _resource_params(self, project_id):
+        params = {"public_key": self.__publicKey,
+                  "secret_key": self.__privateKey}
+        if project_id != -1:
+            params["project_id"] = project_id
+        return params
+
     def _param_injection_helper(self, target, custom=None, **kwargs):
 
         for key, val in kwargs.items():
@@ -77,12 +2381,7 @@ class OhtApi:
                 if index >= 10:
                     break
 
-    def _json_to_object_hook(self, data):
-        d = {}
-        for key in data.keys():
-            if not key.isidentifier():
-                d[key] = data[key]
-        return d if d else namedtuple("oht_response", data.keys())(*data.values())
+    _json_to_object_hook = staticmethod(_json_to_object_hook)
 
     def json_to_ntuple(self, data):
         """
@@ -91,13 +2390,28 @@ class OhtApi:
         :raise ValueError if data contain invalid json string
 
         """
-        return json.loads(data, object_hook=self._json_to_object_hook)
+        return json.loads(data, object_hook=self._json_to_object_hook)
+
+    def json_to_view(self, data):
+        """
+        Parse response with fastest available json parser (orjson if installed) without building namedtuples
+        :param data: response json from OHT server
+        :return LazyResponse
+        :raise ValueError if data contain invalid json string
+
+        """
+        return _lazy_wrap(_json_loads(data))
+
+    def _decode(self, data):
+        if self.__responseMode == RESPONSE_LAZY:
+            return self.json_to_view(data)
+        return self.json_to_ntuple(data)
 
     def set_base_url(self, new_url):
         """
         Set new URL for product. If URL come without 'http[s]:\\' prefix - it will be add.
         :param new_url:
-        :return {Boolean} True if ok, False if server return non 200 code
+        :return {Boolean} True if ok, False if server return non 200 code, None if check is deferred (see url_check param of constructor)
         :raise requests.exceptions.ConnectionError if URl is unavailable
 
         """
@@ -114,7 +2428,7 @@ class OhtApi:
         """
         Set new URL for sandbox. If URL come without 'http[s]:\\' prefix - it will be add.
         :param new_url:
-        :return {Boolean} True if ok, False if server return non 200 code
+        :return {Boolean} True if ok, False if server return non 200 code, None if check is deferred (see url_check param of constructor)
         :raise requests.exceptions.ConnectionError if URl is unavailable
 
         """
@@ -141,10 +2455,9 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["account-details"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._call("get", "account-details", params=params)
 
     def create_file_resource(self, upload=None, file_name="", file_mime="", file_content=""):
         """
@@ -152,9 +2465,11 @@ class OhtApi:
         After the resource entity is created, it can be used on job requests such as translation, proofreading, etc.
         More info: https://www.onehourtranslation.com/translation/api-documentation-v2/content-formats
         :param upload: {String} -> (optional, see file_content) Path to file, witch content will be upload (submitted via multipart/form-data request)
+            Also can be binary file-like object (left open), bytes, bytearray or memoryview. Content is streamed, see MultipartEncoder
         :param file_name: {String} -> (optional) Replace the original file's name on One Hour Translation
         :param file_mime: {String} -> (optional) Replace the default mime value for the file
         :param file_content: {String} -> Content of the new file, works only with "file_name" not empty. If used, actual upload is skipped.
+            Sent in request body.
         :return: namedtuple with fields:
             status -> status with fields:
                 code: {Integer} -> request status code, 0 for OK.  More info: https://www.onehourtranslation.com/translation/api-documentation-v2/general-instructions#status-and-error-codes
@@ -163,17 +2478,50 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["create-file-resource"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "file_name": file_name,
-                  "file_mime": file_mime,
-                  "file_content": file_content}
+                  "file_mime": file_mime}
         if upload:
-            file = {"file": open(upload, 'rb')}
-            return self.json_to_ntuple(requests.post(api, params=params, files=file).text)
+            return self._upload("create-file-resource", params, MultipartEncoder(files={"file": (upload, file_name, file_mime)}))
         else:
-            return self.json_to_ntuple(requests.post(api, params=params).text)
+            return self._call("post", "create-file-resource", params=params, data={"file_content": file_content})
+
+    def upload_many(self, sources, max_workers=8, progress=None):
+        """
+        Upload many files concurrently (see create_file_resource), all uploads share transport connection pool
+        :param sources: {List} -> items: path | binary file-like object | bytes | memoryview,
+            or tuple (source, file_name, file_mime)
+        :param max_workers: {Integer} -> number of parallel uploads, keep it <= transport pool_maxsize to reuse connections
+        :param progress: {Callable} -> (optional) called with UploadProgress namedtuple after each finished upload:
+            done, failed, total: {Integer} -> number of finished, failed and all uploads
+            bytes_sent: {Integer} -> size of successfully uploaded sources
+            elapsed: {Float} -> seconds since start
+            bytes_per_second: {Float} -> throughput
+        :return: generator of UploadResult namedtuple (in order of completion) with fields:
+            index: {Integer} -> position of source in sources
+            source: source as passed
+            resources: {List} -> uuid of created resources, empty on failure
+            answer: create_file_resource answer, None if request failed
+            error: None on success, exception if request failed, OhtError if server return non zero status code.
+                Failed upload does not stop the others.
+        """
+        specs = [_upload_spec(source) for source in sources]
+        tracker = _UploadTracker(specs, progress)
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = {executor.submit(self.create_file_resource, *spec): index for index, spec in enumerate(specs)}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    index = futures[future]
+                    try:
+                        answer = future.result()
+                    except Exception as error:
+                        yield tracker.result(index, specs[index], error=error)
+                    else:
+                        yield tracker.result(index, specs[index], answer)
+            finally:
+                for future in futures:
+                    future.cancel()
 
     def get_resource(self, resource_uuid, project_id=-1, fetch=""):
         """
@@ -195,7 +2543,6 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["get-resource"].format(resource_uuid)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey}
         if project_id != -1:
@@ -204,36 +2551,104 @@ class OhtApi:
         if fetch:
             params["fetch"] = fetch
 
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._shared_call("get-resource", resource_uuid, params=params)
 
-    def download_resource(self, resource_uuid, path_to_save="", chunk_size=128, project_id=-1):
+    def download_resource(self, resource_uuid, path_to_save="", chunk_size=DOWNLOAD_BUFFER_SIZE, project_id=-1, resume=False):
         """
         Download resource
+        Content is streamed to path_to_save + PARTIAL_SUFFIX through one buffer of chunk_size bytes, file is renamed
+        to path_to_save only when download is complete.
         :param resource_uuid: {String} -> resource uuid
         :param path_to_save: {String} -> (optional) path to file to save resource
-        :param chunk_size: {Integer} -> (optional) chunk size for fetch content
+        :param chunk_size: {Integer} -> (optional) buffer size for fetch content
         :param project_id:  {Integer} -> (optional) (optional) Project ID, needed when requesting a resource that was uploaded by another user - e.g. as a project’s translation
+        :param resume: {Boolean} -> (optional) continue previous interrupted download of path_to_save (HTTP Range request)
         :return: depends of 'path_to_save' option:
-            if not specified: function return downloaded text
+            if not specified: function return downloaded text (whole resource in memory, see iter_resource for big files)
             if specified: function return file path on success, otherwise empty string
 
         """
-        api = self.__workUrl + self._apiUrl["download-resource"].format(resource_uuid)
-        params = {"public_key": self.__publicKey,
-                  "secret_key": self.__privateKey}
-        if project_id != -1:
-            params["project_id"] = project_id
+        params = self._resource_params(project_id)
+        return self._download("download-resource", (resource_uuid,), params, path_to_save, chunk_size, resume)
 
-        if not path_to_save:
-            return requests.get(api, params=params).text
-        else:
-            req = requests.get(api, params=params, stream=True)
-            if req.status_code == requests.codes.ok:
-                with open(path_to_save, "wb") as file:
-                    for chunk in req.iter_content(chunk_size):
-                        file.write(chunk)
-                return path_to_save
-            return ""
+    def iter_resource(self, resource_uuid, chunk_size=DOWNLOAD_BUFFER_SIZE, project_id=-1, offset=0):
+        """
+        Download resource as generator of bytes chunks, memory use does not depend on resource size
+        :param resource_uuid: {String} -> resource uuid
+        :param chunk_size: {Integer} -> (optional) max size of one chunk
+        :param project_id: {Integer} -> (optional) see download_resource
+        :param offset: {Integer} -> (optional) start from this byte (HTTP Range request)
+        :raise requests.exceptions.HTTPError if server return error code
+        """
+        params = self._resource_params(project_id)
+        with self._request("get", "download-resource", resource_uuid, params=params,
+                           headers=_range_headers(offset), stream=True) as req:
+            req.raise_for_status()
+            for chunk in req.iter_content(chunk_size):
+                yield chunk
+
+    def open_resource(self, resource_uuid, project_id=-1, offset=0):
+        """
+        Download resource as readonly binary file-like object (supports read/readinto), it must be closed after use
+        :param resource_uuid: {String} -> resource uuid
+        :param project_id: {Integer} -> (optional) see download_resource
+        :param offset: {Integer} -> (optional) start from this byte (HTTP Range request)
+        :raise requests.exceptions.HTTPError if server return error code
+        """
+        params = self._resource_params(project_id)
+        req = self._request("get", "download-resource", resource_uuid, params=params,
+                            headers=_range_headers(offset), stream=True)
+        try:
+            req.raise_for_status()
+        except requests.exceptions.HTTPError:
+            req.close()
+            raise
+        req.raw.decode_content = True
+        return req.raw
+
+    def download_project_outputs(self, project_id, dest_dir, max_workers=8):
+        """
+        Download all translations/proofs/transcriptions of project concurrently (see download_resource),
+        files are saved as dest_dir/<source uuid>/<file name>, targets without source binding - as dest_dir/<file name>.
+        Existing file with the same length as resource is not downloaded again.
+        :param project_id: {Integer} -> project id
+        :param dest_dir: {String} -> folder to save files, created if not exist
+        :param max_workers: {Integer} -> number of parallel requests
+        :return: {List} -> ProjectOutput namedtuple for each target resource with fields:
+            source: {String} -> source resource uuid, None if target is not bound
+            resource: {String} -> target resource uuid
+            path: {String} -> path of saved file, empty on error
+            skipped: {Boolean} -> True if file was already downloaded
+            error: None on success, exception otherwise
+        :raise OhtError if project_detail return non zero status code
+        """
+        targets = _project_targets(self.project_detail(project_id))
+        os.makedirs(dest_dir, exist_ok=True)
+
+        def call(func, *args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                return error
+
+        def save(item):
+            source, target, path, skip, error = item
+            return error or skip or call(self.download_resource, target, path, project_id=project_id, resume=True)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            metas = list(executor.map(lambda item: call(self.get_resource, item[1], project_id), targets))
+            plan = _output_plan(dest_dir, targets, metas)
+            for folder in {os.path.dirname(path) for source, target, path, skip, error in plan if path}:
+                os.makedirs(folder, exist_ok=True)
+            saved = list(executor.map(save, plan))
+        return [self._project_output(item, result) for item, result in zip(plan, saved)]
+
+    @staticmethod
+    def _project_output(item, result):
+        source, target, path, skip, error = item
+        if error is None and not skip and result != path:
+            error = result if isinstance(result, Exception) else IOError("download of {0} failed".format(target))
+        return ProjectOutput(source, target, path if error is None else "", skip, error)
 
     def quote(self, resources, source_lang, target_lang, wordcount=0, service="", expertise="", proofreading="", currency=""):
         """
@@ -265,9 +2680,11 @@ class OhtApi:
                     price: {Integer} -> total price in selected currency, based on net price and transaction fee.
                 currency: {String} -> USD | EUR
             errors: {List} -> list of errors
+        :raise ValueError if languages or expertise are not supported (only with language_index, see constructor)
 
         """
-        api = self.__workUrl + self._apiUrl["quote"]
+        if service in ("", "translation", "transproof"):
+            self._check_languages(source_lang, target_lang, expertise)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "resources": ",".join(resources),
@@ -275,7 +2692,7 @@ class OhtApi:
                   "source_language": source_lang,
                   "target_language": target_lang}
         self._param_injection_helper(params, service=service, expertise=expertise, proofreading=proofreading, currency=currency)
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._call("get", "quote", params=params)
 
     def word_count(self, resources):
         """
@@ -293,11 +2710,10 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["word-count"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "resources": ",".join(resources)}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._shared_call("word-count", params=params)
 
     def create_translation_project(self, source_lang, target_lang, sources, word_count=0, notes="", expertise="", callback_url="", custom=None, name=""):
         """
@@ -320,16 +2736,89 @@ class OhtApi:
                 wordcount: {Integer} -> total word count of the newly project
                 credits: {Integer} -> total credit worth of the newly project
             errors: {List} -> list of errors
+        :raise ValueError if languages or expertise are not supported (only with language_index, see constructor)
 
         """
-        api = self.__workUrl + self._apiUrl["new-translation-project"]
+        self._check_languages(source_lang, target_lang, expertise)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_language": source_lang,
                   "target_language": target_lang,
                   "sources": ",".join(sources)}
         self._param_injection_helper(params, custom=custom, wordCount=word_count, notes=notes, expertise=expertise, callbackUrl=callback_url, name=name)
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._submit("new-translation-project", params)
+
+    def order_translations(self, sources, source_lang, targets, resources=(), budget=None, max_workers=8,
+                           expertise="", notes="", callback_url="", custom=None, name="", planner=None):
+        """
+        Order translation of the same sources to many languages: sources are uploaded once (concurrently),
+        every target is quoted (concurrently, together with account_details), total credits are checked against
+        account balance and budget, then projects are created concurrently.
+        :param sources: {List} -> sources to upload, see upload_many
+        :param source_lang: {String} -> language code
+        :param targets: {List} -> target language codes
+        :param resources: {List} -> (optional) uuid of already uploaded sources
+        :param budget: {Float} -> (optional) max credits to spend, account balance is checked anyway
+        :param max_workers: {Integer} -> number of parallel requests
+        :param expertise, notes, callback_url, custom, name: see create_translation_project
+        :param planner: QuotePlanner (optional) to reuse cached quotes
+        :return: {List} -> OrderReport namedtuple for each target in the same order, with fields:
+            target_lang: {String} -> target language code
+            resources: {List} -> uuid of sources
+            credits: {Float} -> quoted credits, None if quote failed
+            project_id: project id, None if project was not created
+            answer: create_translation_project answer, None if project was not created
+            error: None on success, exception if quote or creation failed, OhtError if server return
+                non zero status code. Targets which could not be quoted are not ordered.
+        :raise BudgetError if quoted targets cost more than account balance or budget, nothing is ordered then
+        :raise exception of first failed upload (nothing is ordered) or of account_details
+        """
+        resources = list(resources)
+        for result in sorted(self.upload_many(sources, max_workers), key=lambda result: result.index):
+            if result.error is not None:
+                raise result.error
+            resources.extend(result.resources)
+        planner = QuotePlanner(self, max_workers) if planner is None else planner
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            account = executor.submit(self.account_details)
+            table = planner.plan(resources, source_lang, targets, expertises=(expertise,))
+            account = account.result()
+        self._check_budget(account, table.credits, budget)
+
+        def create(index):
+            if table.error[index] is not None:
+                return None, table.error[index]
+            try:
+                answer = self.create_translation_project(source_lang, targets[index], resources, notes=notes,
+                                                         expertise=expertise, callback_url=callback_url,
+                                                         custom=custom, name=name)
+            except Exception as error:
+                return None, error
+            return answer, None if answer.status.code == 0 else OhtError(answer)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            created = list(executor.map(create, range(len(targets))))
+        return self._order_reports(targets, resources, table.credits, created)
+
+    @staticmethod
+    def _check_budget(account, credits, budget):
+        """
+        :raise OhtError if account_details failed, BudgetError if credits of quotes exceed balance or budget
+        """
+        if account.status.code != 0:
+            raise OhtError(account)
+        required = sum(item for item in credits if item is not None)
+        available = float(account.results.credits)
+        if budget is not None:
+            available = min(available, budget)
+        if required > available:
+            raise BudgetError(required, available)
+
+    @staticmethod
+    def _order_reports(targets, resources, credits, created):
+        return [OrderReport(target, resources, target_credits,
+                            answer.results.project_id if answer is not None and error is None else None, answer, error)
+                for target, target_credits, (answer, error) in zip(targets, credits, created)]
 
     def create_proof_reading_project(self, source_lang, sources, word_count=0, notes="", expertise="", callback_url="", custom=None, name=""):
         """
@@ -353,13 +2842,12 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["new-proofreading-project-single"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_language": source_lang,
                   "sources": ",".join(sources)}
         self._param_injection_helper(params, custom=custom, wordCount=word_count, notes=notes, expertise=expertise, callbackUrl=callback_url, name=name)
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._submit("new-proofreading-project-single", params)
 
     def create_proof_translated_project(self, source_lang, target_lang, sources, translations, word_count=0, notes="", expertise="", callback_url="", custom=None, name=""):
         """
@@ -383,9 +2871,10 @@ class OhtApi:
                 wordcount: {Integer} -> total word count of the newly project
                 credits: {Integer} -> total credit worth of the newly project
             errors: {List} -> list of errors
+        :raise ValueError if languages or expertise are not supported (only with language_index, see constructor)
 
         """
-        api = self.__workUrl + self._apiUrl["new-proofreading-project-advanced"]
+        self._check_languages(source_lang, target_lang, expertise)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_language": source_lang,
@@ -393,8 +2882,7 @@ class OhtApi:
                   "sources": ",".join(sources),
                   "translations": ",".join(translations)}
         self._param_injection_helper(params, custom=custom, wordCount=word_count, notes=notes, expertise=expertise, callbackUrl=callback_url, name=name)
-        print(requests.post(api, params=params).url)
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._submit("new-proofreading-project-advanced", params)
 
     def create_transcription_project(self, source_lang, sources, length=0, notes="", callback_url="", custom=None, name=""):
         """
@@ -417,13 +2905,12 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["new-transcription-project"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_language": source_lang,
                   "sources": ",".join(sources)}
         self._param_injection_helper(params, custom=custom, length=length, notes=notes, callbackUrl=callback_url, name=name)
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._submit("new-transcription-project", params)
 
     def project_detail(self, project_id):
         """
@@ -457,10 +2944,9 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["project-details"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._shared_call("project-details", project_id, params=params)
 
     def cancel_project(self, project_id):
         """
@@ -475,11 +2961,10 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["cancel-project"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey}
 
-        return self.json_to_ntuple(requests.request('delete', api, params=params).text)
+        return self._call("delete", "cancel-project", project_id, params=params)
 
     def project_comments(self, project_id):
         """
@@ -501,10 +2986,35 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["project-comments"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._call("get", "project-comments", project_id, params=params)
+
+    def _comments_params(self):
+        return {"public_key": self.__publicKey,
+                "secret_key": self.__privateKey}
+
+    def sync_comments(self, store, project_ids, max_workers=8):
+        """
+        Fetch comments of many projects concurrently and keep them in store
+        :param store: CommentStore
+        :param project_ids: {List} -> project ids
+        :param max_workers: {Integer} -> number of parallel requests
+        :return: {List} -> CommentSync namedtuple for each project in the same order, with fields:
+            project_id: project id as passed
+            comments: {List} -> comments which were not in store (see project_comments), empty on failure
+            error: None on success, exception if request failed, OhtError if server return non zero status code
+        """
+        def sync(project_id):
+            try:
+                return CommentSync(project_id, self._call_with(functools.partial(store.update, project_id), "get",
+                                                               "project-comments", project_id,
+                                                               params=self._comments_params()), None)
+            except Exception as error:
+                return CommentSync(project_id, [], error)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(sync, project_ids))
 
     def post_comment(self, project_id, text):
         """
@@ -519,12 +3029,11 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["new-comment"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "content": text}
 
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._call("post", "new-comment", project_id, params=params)
 
     def project_ratings(self, project_id):
         """
@@ -543,11 +3052,10 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["retrieve-project-ratings"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "project_id": project_id}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._call("get", "retrieve-project-ratings", project_id, params=params)
 
     def post_project_ratings(self, project_id, comment_type, rate, remarks=""):
         """
@@ -564,7 +3072,6 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["post-project-ratings"].format(project_id)
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "project_id": project_id,
@@ -574,7 +3081,7 @@ class OhtApi:
         if(remarks):
             params["remarks"] = remarks
 
-        return self.json_to_ntuple(requests.post(api, params=params).text)
+        return self._call("post", "post-project-ratings", project_id, params=params)
 
     def machine_translate(self, from_lang, to_lang, text):
         """
@@ -591,13 +3098,71 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["machine-translate"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_language": from_lang,
                   "target_language": to_lang,
                   "source_content": text}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._memo_call("get", "machine-translate", MtCache.key("translate", from_lang, to_lang, text),
+                               params=params)
+
+    def _machine_translate(self, from_lang, to_lang, text, post=False):
+        """
+        machine_translate of joined batch, content is sent in request body if post is True.
+        Answer is not stored in machine translation cache, texts of batch are stored one by one (_mt_store)
+        """
+        params = {"public_key": self.__publicKey,
+                  "secret_key": self.__privateKey}
+        content = {"source_language": from_lang,
+                   "target_language": to_lang,
+                   "source_content": text}
+        if post:
+            return self._call("post", "machine-translate", params=params, data=content)
+        params.update(content)
+        return self._call("get", "machine-translate", params=params)
+
+    def _translate_batch(self, from_lang, to_lang, batch, post):
+        """
+        :return: {List} -> (translation, error) for each text of batch
+        """
+        try:
+            translations = _mt_split(self._machine_translate(from_lang, to_lang, MT_SEPARATOR.join(batch), post), batch)
+        except Exception as error:
+            return [(None, error)] * len(batch)
+        if translations is not None:
+            return [(translation, None) for translation in translations]
+        # server did not keep segments apart, translate them one by one
+        return [self._translate_batch(from_lang, to_lang, [text], post)[0] for text in batch]
+
+    def machine_translate_many(self, pairs_or_texts, from_lang, to_lang, max_size=None, max_workers=8, post=False):
+        """
+        Translate many texts via machine translation with as few requests as possible:
+        equal texts are translated once, texts are joined by MT_SEPARATOR into batches of max_size,
+        batches are sent concurrently. Batch which server answers with other number of segments is
+        retranslated text by text.
+        :param pairs_or_texts: {List} -> texts or (key, text) pairs
+        :param from_lang: language code, see machine_translate
+        :param to_lang: language code, see machine_translate
+        :param max_size: {Integer} -> (optional) batch size limit in characters, MT_GET_BATCH_SIZE (url encoded)
+            or MT_POST_BATCH_SIZE (utf-8 bytes) if not specified
+        :param max_workers: {Integer} -> number of parallel requests
+        :param post: {Boolean} -> send content in request body (POST) instead of URL, for servers which accept it
+        :return: {List} -> MtResult namedtuple for each input item in the same order, with fields:
+            key: key of pair, or position of text in pairs_or_texts
+            source: {String} -> text
+            translation: {String} -> translated text, None on failure
+            error: None on success, exception if request failed, OhtError if server return non zero status code
+        """
+        items = _mt_items(pairs_or_texts)
+        translated = self._mt_lookup(from_lang, to_lang, [text for key, text in items])
+        batches = _mt_batches([text for key, text in items if text not in translated],
+                              max_size or (MT_POST_BATCH_SIZE if post else MT_GET_BATCH_SIZE), post)
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for batch, results in zip(batches, executor.map(
+                    lambda batch: self._translate_batch(from_lang, to_lang, batch, post), batches)):
+                translated.update(zip(batch, results))
+                self._mt_store(from_lang, to_lang, batch, results)
+        return _mt_results(items, translated)
 
     def machine_detect_lang(self, text):
         """
@@ -612,11 +3177,10 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["machine-detect-lang"]
         params = {"public_key": self.__publicKey,
                   "secret_key": self.__privateKey,
                   "source_content": text}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._memo_call("get", "machine-detect-lang", MtCache.key("detect", text), params=params)
 
     def supported_languages(self):
         """
@@ -631,9 +3195,8 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["discover-langs"]
         params = {"public_key": self.__publicKey}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._cached_call("discover-langs", params)
 
     def supported_language_pairs(self):
         """
@@ -656,9 +3219,8 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["discover-langs_pairs"]
         params = {"public_key": self.__publicKey}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._cached_call("discover-langs_pairs", params)
 
     def expertises(self, source_lang="", target_lang=""):
         """
@@ -674,8 +3236,1063 @@ class OhtApi:
             errors: {List} -> list of errors
 
         """
-        api = self.__workUrl + self._apiUrl["supported-expertises"]
         params = {"public_key": self.__publicKey,
                   "source_language": source_lang,
                   "target_language": target_lang}
-        return self.json_to_ntuple(requests.get(api, params=params).text)
+        return self._cached_call("supported-expertises", params)
+
+
+AsyncOhtResponse = namedtuple("AsyncOhtResponse", ["status_code", "text", "url", "content", "timings"],
+                              defaults=(None,))
+
+
+def _query_params(params):
+    """ aiohttp accept only str/int/float query values, requests skip None values """
+    if not params:
+        return None
+    return {key: val if isinstance(val, str) else str(val) for key, val in params.items() if val is not None}
+
+
+def _timing_trace_config():
+    """
+    aiohttp.TraceConfig which puts durations of DNS resolution and connection creation (without DNS)
+    into dict passed as trace_request_ctx
+    """
+    async def mark(session, context, params, name):
+        context.trace_request_ctx[name] = time.perf_counter()
+
+    async def connected(session, context, params):
+        marks = context.trace_request_ctx
+        marks["connect"] = time.perf_counter() - marks.pop("connect_start") - marks.get("dns", 0.0)
+
+    async def resolved(session, context, params):
+        marks = context.trace_request_ctx
+        marks["dns"] = time.perf_counter() - marks.pop("dns_start")
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_create_start.append(functools.partial(mark, name="connect_start"))
+    config.on_connection_create_end.append(connected)
+    config.on_dns_resolvehost_start.append(functools.partial(mark, name="dns_start"))
+    config.on_dns_resolvehost_end.append(resolved)
+    return config
+
+
+class AsyncOhtTransport:
+    """
+    Non-blocking HTTP transport for AsyncOhtApi: one aiohttp.ClientSession with keep-alive connection pool.
+    Session is created on first request, inside running event loop.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0, keepalive_timeout=15, timeout=None, trace=False):
+        """
+        :param limit: {Integer} -> total number of simultaneous connections
+        :param limit_per_host: {Integer} -> number of simultaneous connections to one host, 0 - no limit
+        :param keepalive_timeout: {Float} -> seconds to keep idle connection in pool
+        :param timeout: {Float} -> (optional) total timeout for one request in seconds
+        :param trace: {Boolean} -> measure DNS resolution and connection time of requests (see RequestTimings)
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncOhtTransport requires aiohttp package")
+        self.__limit = limit
+        self.__limitPerHost = limit_per_host
+        self.__keepAliveTimeout = keepalive_timeout
+        self.__timeout = timeout
+        self.__trace = trace
+        self.__session = None
+
+    def _session(self):
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__limit,
+                                             limit_per_host=self.__limitPerHost,
+                                             keepalive_timeout=self.__keepAliveTimeout)
+            self.__session = aiohttp.ClientSession(connector=connector,
+                                                   timeout=aiohttp.ClientTimeout(total=self.__timeout),
+                                                   trace_configs=[_timing_trace_config()] if self.__trace else None)
+        return self.__session
+
+    async def request(self, method, url, params=None, files=None, **kwargs):
+        """
+        Same as OhtTransport.request, but response is read completely and returned as AsyncOhtResponse
+        with RequestTimings
+        """
+        if files:
+            data = aiohttp.FormData()
+            for name, file in files.items():
+                data.add_field(name, file, filename=os.path.basename(getattr(file, "name", name)))
+            kwargs["data"] = data
+        if isinstance(kwargs.get("timeout"), tuple):
+            kwargs["timeout"] = self._client_timeout(kwargs["timeout"])
+        marks = {}
+        if self.__trace:
+            kwargs["trace_request_ctx"] = marks
+        start = time.perf_counter()
+        async with self._session().request(method, url, params=_query_params(params), **kwargs) as resp:
+            headers = time.perf_counter()
+            content = await resp.read()
+            timings = RequestTimings(marks.get("dns"), marks.get("connect"), headers - start,
+                                     time.perf_counter() - headers)
+            return AsyncOhtResponse(resp.status, content.decode(resp.get_encoding()), str(resp.url), content, timings)
+
+    def _client_timeout(self, timeout):
+        """
+        :param timeout: {Tuple} -> (connect_timeout, read_timeout) or None for total timeout of transport only
+        """
+        if timeout is None:
+            return aiohttp.ClientTimeout(total=self.__timeout)
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=self.__timeout, sock_connect=connect, sock_read=read)
+
+    async def download(self, url, params, path_to_save, chunk_size, resume=False, timeout=None):
+        """
+        See OhtApi.download_resource
+        :param timeout: {Tuple} -> (optional) (connect_timeout, read_timeout)
+        :return: {Tuple} -> (HTTP status, result of download_resource)
+        """
+        offset = _range_start(path_to_save, resume) if path_to_save else 0
+        part = path_to_save + PARTIAL_SUFFIX
+        async with self._session().get(url, params=_query_params(params), headers=_range_headers(offset),
+                                       timeout=self._client_timeout(timeout)) as resp:
+            if not path_to_save:
+                return resp.status, await resp.text()
+            if offset and resp.status == requests.codes.requested_range_not_satisfiable:
+                os.remove(part)
+                return await self.download(url, params, path_to_save, chunk_size, timeout=timeout)
+            if resp.status == requests.codes.partial_content and offset:
+                mode = "ab"
+            elif resp.status == requests.codes.ok:
+                mode = "wb"
+            else:
+                return resp.status, ""
+            with open(part, mode) as file:
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    file.write(chunk)
+        os.replace(part, path_to_save)
+        return resp.status, path_to_save
+
+    async def iter_content(self, url, params, chunk_size, offset=0, timeout=None):
+        """
+        See OhtApi.iter_resource
+        :param timeout: {Tuple} -> (optional) (connect_timeout, read_timeout)
+        """
+        async with self._session().get(url, params=_query_params(params), headers=_range_headers(offset),
+                                       timeout=self._client_timeout(timeout)) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+
+class AsyncResourceReader:
+    """
+    Readonly binary file-like object over async iterator of chunks (see AsyncOhtApi.open_resource)
+    """
+
+    def __init__(self, chunks):
+        self.__chunks = chunks
+        self.__buffer = bytearray()
+        self.__eof = False
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _fill(self, size):
+        while not self.__eof and (size < 0 or len(self.__buffer) < size):
+            try:
+                self.__buffer += await self.__chunks.__anext__()
+            except StopAsyncIteration:
+                self.__eof = True
+
+    async def read(self, size=-1):
+        """
+        :param size: {Integer} -> maximum number of bytes, -1 - till the end of resource
+        :return: {bytes} -> empty at the end of resource
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        await self._fill(size)
+        size = len(self.__buffer) if size < 0 else size
+        data = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        return data
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self.__buffer.clear()
+            await self.__chunks.aclose()
+
+
+class AsyncOhtApi(OhtApi):
+    """
+    asyncio version of OhtApi: every API method is coroutine with the same parameters and result.
+    URL building and response parsing are shared with OhtApi, URL availability check
+    (constructor, set_base_url, set_sandbox_url) stays synchronous.
+    """
+
+    def __init__(self, public_key, private_key, sandbox=False, time_out=10, transport=None,
+                 async_transport=None, max_concurrency=100, **kwargs):
+        """
+        transport param - (optional) synchronous transport, used for URL availability check only
+        async_transport param - (optional) AsyncOhtTransport or compatible object.
+            If not specified, new AsyncOhtTransport with pool limit max_concurrency is created (and closed by aclose())
+        max_concurrency param - maximum number of requests in flight for this instance
+        other params - see OhtApi
+        """
+        self.__ownAsyncTransport = async_transport is None
+        self.__asyncTransport = AsyncOhtTransport(limit=max_concurrency) if async_transport is None else async_transport
+        self.__limiter = asyncio.Semaphore(max_concurrency)
+        OhtApi.__init__(self, public_key, private_key, sandbox, time_out, transport, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """
+        Release pooled connections of own transports
+        """
+        self.close()
+        if self.__ownAsyncTransport:
+            await self.__asyncTransport.close()
+
+    def async_transport(self):
+        return self.__asyncTransport
+
+    async def _async_wait_url_check(self):
+        if self._url_check_pending():
+            await asyncio.get_running_loop().run_in_executor(None, self._wait_url_check)
+
+    async def _async_rate_limit(self, method, endpoint):
+        if self.rate_limiter() is not None:
+            delay = self.rate_limiter().reserve(method, endpoint)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _request(self, method, endpoint, *url_args, **kwargs):
+        return await self._send(method, endpoint, url_args, kwargs, self._trace(method, endpoint))
+
+    async def _send(self, method, endpoint, url_args, kwargs, trace, finish=True):
+        return await self._traced(trace, self._send_attempts(method, endpoint, url_args, kwargs, trace), finish)
+
+    async def _traced(self, trace, coroutine, finish=True):
+        """
+        :return: result of coroutine, trace (if not None) is completed on error or if finish is True
+        """
+        try:
+            result = await coroutine
+        except Exception as exc:
+            if trace is not None:
+                trace.error = exc
+                self._finish_trace(trace)
+            raise
+        if trace is not None and finish:
+            self._finish_trace(trace)
+        return result
+
+    async def _send_attempts(self, method, endpoint, url_args, kwargs, trace):
+        await self._async_wait_url_check()
+        policy = self.resilience()
+        kwargs.setdefault("timeout", policy.timeout(endpoint))
+        url = self._url(endpoint, *url_args)
+        attempt = 0
+        while True:
+            trial = policy.before_request(endpoint)
+            await self._async_rate_limit(method, endpoint)
+            async with self.__limiter:
+                start = time.perf_counter()
+                response = error = None
+                try:
+                    response = await self.__asyncTransport.request(method, url, **kwargs)
+                except Exception as exc:
+                    error = exc
+                seconds = time.perf_counter() - start
+                sent = _request_size(kwargs)
+                received = len(response.content) if response is not None else 0
+                self.request_stats().record(endpoint, sent, received, seconds, response is None)
+            if trace is not None:
+                trace.url = url
+                trace._response(response, error, seconds, sent, received, False)
+            delay = policy.after_request(method, endpoint, attempt,
+                                         response.status_code if response is not None else None, error, trial)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _call(self, method, endpoint, *url_args, **kwargs):
+        return await self._call_with(self._decode, method, endpoint, *url_args, **kwargs)
+
+    async def _call_with(self, decode, method, endpoint, *url_args, **kwargs):
+        trace = self._trace(method, endpoint)
+        if trace is None:
+            return decode((await self._request(method, endpoint, *url_args, **kwargs)).text)
+        return self._traced_decode(trace, (await self._send(method, endpoint, url_args, kwargs, trace, False)).text,
+                                   decode)
+
+    async def _cached_call(self, endpoint, params):
+        key, answer = self._cache_lookup(endpoint, params)
+        if answer is None:
+            answer = await self._call_with(functools.partial(self._cache_store, key), "get", endpoint, params=params)
+        return answer
+
+    async def _submit(self, endpoint, params):
+        if self.journal() is None:
+            return await self._call("post", endpoint, params=params)
+        await self._async_wait_url_check()
+        fingerprint, previous = self._journal_begin(endpoint, params)
+        if previous is not None:
+            return previous
+        try:
+            return await self._call_with(functools.partial(self._journal_end, fingerprint), "post", endpoint,
+                                         params=params)
+        except Exception as error:
+            self._journal_failed(fingerprint, error)
+            raise
+
+    async def sync_comments(self, store, project_ids, max_workers=8):
+        """
+        Coroutine version of OhtApi.sync_comments
+        """
+        workers = asyncio.Semaphore(max_workers)
+
+        async def sync(project_id):
+            async with workers:
+                try:
+                    return CommentSync(project_id, await self._call_with(functools.partial(store.update, project_id),
+                                                                         "get", "project-comments", project_id,
+                                                                         params=self._comments_params()), None)
+                except Exception as error:
+                    return CommentSync(project_id, [], error)
+
+        return list(await asyncio.gather(*[sync(project_id) for project_id in project_ids]))
+
+    async def _shared_call(self, endpoint, *url_args, params):
+        return await self.single_flight().do_async(self._flight_key(endpoint, url_args, params),
+                                                   lambda: self._call("get", endpoint, *url_args, params=params))
+
+    async def _memo_call(self, method, endpoint, key, **kwargs):
+        raw = self.mt_cache().get(key) if self.mt_cache() is not None else None
+        if raw is None:
+            return await self._call_with(functools.partial(self._memo_store, key), method, endpoint, **kwargs)
+        return self._decode(raw)
+
+    async def _upload(self, endpoint, params, body):
+        with body:
+            return await self._call("post", endpoint, params=params, data=body, headers=body.headers())
+
+    async def _download(self, endpoint, url_args, params, path_to_save, chunk_size, resume=False):
+        trace = self._trace("get", endpoint)
+        return await self._traced(trace, self._download_attempts(endpoint, url_args, params, path_to_save, chunk_size,
+                                                                 resume, trace))
+
+    async def _download_attempts(self, endpoint, url_args, params, path_to_save, chunk_size, resume, trace):
+        await self._async_wait_url_check()
+        policy = self.resilience()
+        url = self._url(endpoint, *url_args)
+        attempt = 0
+        while True:
+            trial = policy.before_request(endpoint)
+            await self._async_rate_limit("get", endpoint)
+            async with self.__limiter:
+                start = time.perf_counter()
+                status = result = error = None
+                try:
+                    status, result = await self.__asyncTransport.download(url, params, path_to_save, chunk_size, resume,
+                                                                          timeout=policy.timeout(endpoint))
+                except Exception as exc:
+                    error = exc
+                seconds = time.perf_counter() - start
+                received = len(result) if result and not path_to_save else 0
+                self.request_stats().record(endpoint, 0, received, seconds, error is not None)
+            if trace is not None:
+                trace.url = url
+                trace._response(None, error, seconds, 0, received, True)
+                trace.http_status = status
+            delay = policy.after_request("get", endpoint, attempt, status, error, trial)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def iter_resource(self, resource_uuid, chunk_size=DOWNLOAD_BUFFER_SIZE, project_id=-1, offset=0):
+        """
+        Async generator version of OhtApi.iter_resource, request is not retried (chunks are already consumed)
+        :raise aiohttp.ClientResponseError if server return error code
+        """
+        endpoint = "download-resource"
+        trace = self._trace("get", endpoint)
+        policy = self.resilience()
+        url = self._url(endpoint, resource_uuid)
+        received = 0
+        status = error = seconds = None
+        try:
+            await self._async_wait_url_check()
+            trial = policy.before_request(endpoint)
+            try:
+                await self._async_rate_limit("get", endpoint)
+                async with self.__limiter:
+                    start = time.perf_counter()
+                    try:
+                        async for chunk in self.__asyncTransport.iter_content(url, self._resource_params(project_id),
+                                                                              chunk_size, offset,
+                                                                              timeout=policy.timeout(endpoint)):
+                            received += len(chunk)
+                            yield chunk
+                        status = requests.codes.ok
+                    except Exception as exc:
+                        error = exc
+                        status = getattr(exc, "status", None)
+                        raise
+                    finally:
+                        seconds = time.perf_counter() - start
+                        self.request_stats().record(endpoint, 0, received, seconds, error is not None)
+            finally:
+                policy.after_request("get", endpoint, 0, status, error, trial)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if trace is not None:
+                trace.url = url
+                trace._response(None, error, seconds, 0, received, True)
+                trace.http_status = status
+                self._finish_trace(trace)
+
+    async def open_resource(self, resource_uuid, project_id=-1, offset=0):
+        """
+        Coroutine version of OhtApi.open_resource, returns AsyncResourceReader (async read), it must be closed after use
+        :raise aiohttp.ClientResponseError if server return error code
+        """
+        reader = AsyncResourceReader(self.iter_resource(resource_uuid, project_id=project_id, offset=offset))
+        try:
+            await reader._fill(1)
+        except BaseException:
+            await reader.close()
+            raise
+        return reader
+
+    async def order_translations(self, sources, source_lang, targets, resources=(), budget=None, max_workers=8,
+                                 expertise="", notes="", callback_url="", custom=None, name=""):
+        """
+        Coroutine version of OhtApi.order_translations, quotes are asked directly (QuotePlanner is synchronous)
+        """
+        resources = list(resources)
+        uploads = [result async for result in self.upload_many(sources, max_workers)]
+        for result in sorted(uploads, key=lambda result: result.index):
+            if result.error is not None:
+                raise result.error
+            resources.extend(result.resources)
+        workers = asyncio.Semaphore(max_workers)
+
+        async def call(func, *args, **kwargs):
+            async with workers:
+                try:
+                    answer = await func(*args, **kwargs)
+                except Exception as error:
+                    return None, error
+            return answer, None if answer.status.code == 0 else OhtError(answer)
+
+        count, error = await call(self.word_count, resources)
+        # without word count server counts words in every quote
+        total = count.results.total if error is None else 0
+        wordcount = int(getattr(total, "wordcount", total) or 0)
+        account, *quotes = await asyncio.gather(self.account_details(),
+                                                *[call(self.quote, resources, source_lang, target, wordcount, "",
+                                                       expertise) for target in targets])
+        credits = [_number(getattr(answer.results.total, "credits", None)) if error is None else None
+                   for answer, error in quotes]
+        self._check_budget(account, credits, budget)
+
+        async def create(target, quote_error):
+            if quote_error is not None:
+                return None, quote_error
+            return await call(self.create_translation_project, source_lang, target, resources, notes=notes,
+                              expertise=expertise, callback_url=callback_url, custom=custom, name=name)
+
+        created = await asyncio.gather(*[create(target, error) for target, (answer, error) in zip(targets, quotes)])
+        return self._order_reports(targets, resources, credits, created)
+
+    async def download_project_outputs(self, project_id, dest_dir, max_workers=8):
+        """
+        Coroutine version of OhtApi.download_project_outputs
+        """
+        targets = _project_targets(await self.project_detail(project_id))
+        os.makedirs(dest_dir, exist_ok=True)
+        workers = asyncio.Semaphore(max_workers)
+
+        async def call(func, *args, **kwargs):
+            async with workers:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as error:
+                    return error
+
+        metas = await asyncio.gather(*[call(self.get_resource, target, project_id) for source, target in targets])
+        plan = _output_plan(dest_dir, targets, metas)
+        for folder in {os.path.dirname(path) for source, target, path, skip, error in plan if path}:
+            os.makedirs(folder, exist_ok=True)
+
+        async def save(item):
+            source, target, path, skip, error = item
+            return error or skip or await call(self.download_resource, target, path, project_id=project_id, resume=True)
+
+        saved = await asyncio.gather(*[save(item) for item in plan])
+        return [self._project_output(item, result) for item, result in zip(plan, saved)]
+
+    async def _translate_batch(self, from_lang, to_lang, batch, post):
+        try:
+            translations = _mt_split(await self._machine_translate(from_lang, to_lang, MT_SEPARATOR.join(batch), post),
+                                     batch)
+        except Exception as error:
+            return [(None, error)] * len(batch)
+        if translations is not None:
+            return [(translation, None) for translation in translations]
+        return [(await self._translate_batch(from_lang, to_lang, [text], post))[0] for text in batch]
+
+    async def machine_translate_many(self, pairs_or_texts, from_lang, to_lang, max_size=None, max_workers=8, post=False):
+        """
+        Coroutine version of OhtApi.machine_translate_many, max_workers limits requests of this call in flight
+        """
+        items = _mt_items(pairs_or_texts)
+        translated = self._mt_lookup(from_lang, to_lang, [text for key, text in items])
+        batches = _mt_batches([text for key, text in items if text not in translated],
+                              max_size or (MT_POST_BATCH_SIZE if post else MT_GET_BATCH_SIZE), post)
+        workers = asyncio.Semaphore(max_workers)
+
+        async def translate(batch):
+            async with workers:
+                return await self._translate_batch(from_lang, to_lang, batch, post)
+
+        for batch, results in zip(batches, await asyncio.gather(*[translate(batch) for batch in batches])):
+            translated.update(zip(batch, results))
+            self._mt_store(from_lang, to_lang, batch, results)
+        return _mt_results(items, translated)
+
+    async def upload_many(self, sources, max_workers=8, progress=None):
+        """
+        Async generator version of OhtApi.upload_many, max_workers limits uploads of this call in flight
+        """
+        specs = [_upload_spec(source) for source in sources]
+        tracker = _UploadTracker(specs, progress)
+        workers = asyncio.Semaphore(max_workers)
+
+        async def upload(index, spec):
+            async with workers:
+                try:
+                    return index, await self.create_file_resource(*spec), None
+                except Exception as error:
+                    return index, None, error
+
+        tasks = [asyncio.ensure_future(upload(index, spec)) for index, spec in enumerate(specs)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                index, answer, error = await task
+                yield tracker.result(index, specs[index], answer, error)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _project_state(answer):
+    """
+    :param answer: project_detail answer
+    :return: {Tuple} -> (status, frozenset of resources uuid)
+    :raise OhtError if server return non zero status code
+    """
+    if answer.status.code != 0:
+        raise OhtError(answer)
+    results = answer.results
+    status = getattr(results, "project_status_code", "") or getattr(results, "project_status", "")
+    resources = set()
+    for kind in ("sources", "translations", "proofs", "transcriptions"):
+        resources.update(_resource_list(getattr(getattr(results, "resources", None), kind, "")))
+    return status.lower(), frozenset(resources)
+
+
+class ProjectWatcher:
+    """
+    Poll project_detail of many projects and report changes of their status and resources.
+    Projects due for poll are polled concurrently, at most qps requests per second. Interval of project
+    depends on its status (intervals) and grows with time since its last change, up to max_interval.
+    Project in final status (completed, canceled) is reported and not polled anymore.
+    """
+
+    def __init__(self, api, qps=5, max_workers=8, intervals=None, max_interval=3600, age_scale=3600,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        :param api: OhtApi instance
+        :param qps: {Float} -> maximum number of project_detail requests per second
+        :param max_workers: {Integer} -> number of parallel requests
+        :param intervals: {Dict} -> (optional) status: seconds between polls, POLL_INTERVALS if not specified
+        :param max_interval: {Float} -> maximum seconds between polls of one project
+        :param age_scale: {Float} -> interval is doubled for every age_scale seconds without changes
+        :param clock: monotonic time function
+        :param sleep: function used to wait for request budget
+        """
+        self.api = api
+        self.max_workers = max_workers
+        self.intervals = dict(POLL_INTERVALS if intervals is None else intervals)
+        self.max_interval = max_interval
+        self.age_scale = age_scale
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__budget = TokenBucket(qps, clock=clock)
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        # project_id: [status, resources, last change time, next poll time]
+        self.__projects = {}
+
+    def __len__(self):
+        return len(self.__projects)
+
+    def watch(self, *project_ids):
+        """
+        Start tracking projects, they are polled on next poll()
+        """
+        now = self.__clock()
+        with self.__lock:
+            for project_id in project_ids:
+                self.__projects.setdefault(project_id, [None, None, now, now])
+
+    def unwatch(self, project_id):
+        with self.__lock:
+            self.__projects.pop(project_id, None)
+
+    def watched(self):
+        """
+        :return: {Dict} -> project_id: last known status (None before first poll)
+        """
+        with self.__lock:
+            return {project_id: state[0] for project_id, state in self.__projects.items()}
+
+    def interval(self, status, unchanged):
+        """
+        :param status: {String} -> project status
+        :param unchanged: {Float} -> seconds since last change of project
+        :return: {Float} -> seconds to next poll
+        """
+        base = self.intervals.get(status, POLL_INTERVAL)
+        return min(self.max_interval, base * 2 ** (unchanged / self.age_scale))
+
+    def next_poll(self):
+        """
+        :return: {Float} -> seconds to next due project, None if nothing is watched
+        """
+        with self.__lock:
+            if not self.__projects:
+                return None
+            return max(0.0, min(state[3] for state in self.__projects.values()) - self.__clock())
+
+    def _fetch(self, project_id):
+        delay = self.__budget.reserve()
+        if delay:
+            self.__sleep(delay)
+        try:
+            return self.api.project_detail(project_id), None
+        except Exception as error:
+            return None, error
+
+    def poll(self):
+        """
+        Poll all due projects
+        :return: {List} -> ProjectEvent namedtuple for every changed project, with fields:
+            project_id: project id as passed to watch
+            kind: {String} -> EVENT_STATUS (first poll, status changed), EVENT_RESOURCES (resources changed) or
+                EVENT_ERROR (request failed, project stays watched)
+            status, previous_status: {String} -> project status now and before this event (None before first poll)
+            resources: {frozenset} -> uuid of all project resources
+            new_resources: {frozenset} -> resources which appeared since previous event
+            answer: project_detail answer, None if request failed
+            error: None on success, exception if request failed, OhtError if server return non zero status code
+        """
+        now = self.__clock()
+        with self.__lock:
+            due = [project_id for project_id, state in self.__projects.items() if state[3] <= now]
+        if not due:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(min(self.max_workers, len(due))) as executor:
+            fetched = list(executor.map(self._fetch, due))
+        events = []
+        now = self.__clock()
+        with self.__lock:
+            for project_id, (answer, error) in zip(due, fetched):
+                state = self.__projects.get(project_id)
+                if state is None:
+                    continue
+                event = self._update(project_id, state, answer, error, now)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def _update(self, project_id, state, answer, error, now):
+        previous_status, previous_resources = state[0], state[1]
+        if error is None:
+            try:
+                status, resources = _project_state(answer)
+            except OhtError as exc:
+                error = exc
+        if error is not None:
+            state[3] = now + self.interval(previous_status, now - state[2])
+            return ProjectEvent(project_id, EVENT_ERROR, previous_status, previous_status, previous_resources,
+                                frozenset(), answer, error)
+        if status in FINAL_STATUSES:
+            del self.__projects[project_id]
+        kind = None
+        if status != previous_status:
+            kind = EVENT_STATUS
+        elif resources != previous_resources:
+            kind = EVENT_RESOURCES
+        if kind is not None:
+            state[0], state[1], state[2] = status, resources, now
+        state[3] = now + self.interval(status, now - state[2])
+        if kind is None:
+            return None
+        return ProjectEvent(project_id, kind, status, previous_status, resources,
+                            resources - (previous_resources or frozenset()), answer, None)
+
+    def events(self):
+        """
+        Poll projects until all of them reach final status or stop() is called
+        :return: generator of ProjectEvent, see poll
+        """
+        self.__stop.clear()
+        while not self.__stop.is_set():
+            for event in self.poll():
+                yield event
+            wait = self.next_poll()
+            if wait is None:
+                return
+            self.__stop.wait(wait)
+
+    def run(self, callback):
+        """
+        Same as events, but each event is passed to callback
+        """
+        for event in self.events():
+            callback(event)
+
+    def stop(self):
+        """
+        Stop events (and run) loop, can be called from other thread or callback
+        """
+        self.__stop.set()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class QuotePlanner:
+    """
+    Quote resources for every combination of target languages, services and expertises concurrently.
+    Word count of resources is asked once and passed to every quote, answers are cached for ttl seconds
+    by resources and quote parameters.
+    """
+
+    def __init__(self, api, max_workers=8, ttl=300, maxsize=1024, clock=time.monotonic):
+        """
+        :param api: OhtApi instance
+        :param max_workers: {Integer} -> number of parallel requests
+        :param ttl: {Float} -> seconds quote and word count answers are valid
+        :param maxsize: {Integer} -> max number of cached answers
+        :param clock: {Callable} -> (optional) monotonic time source
+        """
+        self.api = api
+        self.max_workers = max_workers
+        self.cache = TTLCache(ttl=ttl, maxsize=maxsize, clock=clock)
+
+    def _cached(self, key, call):
+        answer = self.cache.get(key)
+        if answer is None:
+            answer = call()
+            if answer.status.code != 0:
+                raise OhtError(answer)
+            self.cache.set(key, answer)
+        return answer
+
+    def word_count(self, resources):
+        """
+        :return: {Integer} -> total word count of resources (cached)
+        """
+        key = ("word-count", tuple(sorted(resources)))
+        total = self._cached(key, lambda: self.api.word_count(resources)).results.total
+        return int(getattr(total, "wordcount", total))
+
+    def _quote(self, resources, source_lang, wordcount, target_lang, service, expertise, proofreading, currency):
+        key = ("quote", tuple(sorted(resources)), source_lang, target_lang, wordcount, service, expertise,
+               proofreading, currency)
+        return self._cached(key, lambda: self.api.quote(resources, source_lang, target_lang, wordcount, service,
+                                                        expertise, proofreading, currency))
+
+    def plan(self, resources, source_lang, targets, services=("",), expertises=("",), proofreading="", currency=""):
+        """
+        :param resources: {List} -> list of resource_uuid
+        :param source_lang: {String} -> language code
+        :param targets: {List} -> target language codes
+        :param services: {List} -> services, see OhtApi.quote ("" - default service)
+        :param expertises: {List} -> expertise codes ("" - no expertise)
+        :param proofreading: {String} -> see OhtApi.quote
+        :param currency: {String} -> see OhtApi.quote
+        :return: QuoteTable namedtuple of columns (lists), one row for each (target, service, expertise):
+            target_lang, service, expertise: {String} -> quote parameters
+            wordcount: {Integer} -> total word count
+            credits, net_price, transaction_fee, price: {Float} -> total of quote, None on failure
+            currency: {String} -> currency of prices
+            error: None on success, exception if request failed, OhtError if server return non zero status code,
+                ValueError if languages are not supported (see OhtApi language_index)
+        """
+        try:
+            wordcount = self.word_count(resources)
+        except Exception:
+            # server counts words in every quote
+            wordcount = 0
+        cells = [(target, service, expertise) for target in targets for service in services for expertise in expertises]
+
+        def quote(cell):
+            try:
+                return self._quote(resources, source_lang, wordcount, cell[0], cell[1], cell[2], proofreading,
+                                   currency), None
+            except Exception as error:
+                return None, error
+
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            answers = list(executor.map(quote, cells))
+        columns = QuoteTable(*[[] for _ in QuoteTable._fields])
+        for (target, service, expertise), (answer, error) in zip(cells, answers):
+            total = answer.results.total if answer is not None else None
+            row = (target, service, expertise, int(getattr(total, "wordcount", wordcount) or wordcount),
+                   _number(getattr(total, "credits", None)), _number(getattr(total, "net_price", None)),
+                   _number(getattr(total, "transaction_fee", None)), _number(getattr(total, "price", None)),
+                   getattr(answer.results, "currency", currency) if answer is not None else currency, error)
+            for column, value in zip(columns, row):
+                column.append(value)
+        return columns
+
+    @staticmethod
+    def cheapest(table, target_lang=None):
+        """
+        :param table: QuoteTable
+        :param target_lang: {String} -> (optional) consider only rows of this target language
+        :return: {Integer} -> index of row with the lowest price, None if there is no successful quote
+        """
+        rows = [index for index, price in enumerate(table.price)
+                if price is not None and (target_lang is None or table.target_lang[index] == target_lang)]
+        return min(rows, key=table.price.__getitem__) if rows else None
+
+
+def parse_callback(body, content_type="", response_mode=RESPONSE_NTUPLE):
+    """
+    Parse OHT callback request body (json or application/x-www-form-urlencoded)
+    :param body: {bytes} -> request body
+    :param content_type: {String} -> Content-Type header
+    :param response_mode: RESPONSE_NTUPLE or RESPONSE_LAZY, see OhtApi
+    :return: {Tuple} -> (payload namedtuple or LazyResponse like OhtApi.json_to_ntuple / json_to_view result,
+        canonical json text of payload)
+    :raise ValueError if body is not valid json or form
+    """
+    text = body.decode("utf-8")
+    if "json" in content_type or text.lstrip().startswith("{"):
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("callback payload is not json object")
+    else:
+        data = {name: values[0] if len(values) == 1 else values
+                for name, values in urllib.parse.parse_qs(text, keep_blank_values=True, strict_parsing=True).items()}
+    canonical = json.dumps(data, sort_keys=True)
+    if response_mode == RESPONSE_LAZY:
+        return _lazy_wrap(data), canonical
+    return json.loads(canonical, object_hook=_json_to_object_hook), canonical
+
+
+class CallbackServer:
+    """
+    Minimal asyncio HTTP server for OHT callbacks (callback_url of create_*_project methods).
+    Every POST to path is parsed (see parse_callback), repeated deliveries of the same payload are answered
+    but dropped, new ones are passed to handlers and put to queue as CallbackEvent namedtuple:
+        event: {String} -> "event" field of payload ("" if there is no such field)
+        project_id: "project_id" field of payload (None if there is no such field)
+        payload: parsed payload
+        key: {String} -> "event_id" field or sha256 of payload, used for deduplication
+    Server runs in caller's event loop (start/stop) or in its own thread (serve_in_thread/shutdown).
+    """
+    MAX_BODY = 1 << 20
+
+    def __init__(self, host="127.0.0.1", port=0, path="/", events=None, handlers=None, dedupe_size=4096,
+                 response_mode=RESPONSE_NTUPLE):
+        """
+        :param host: {String} -> interface to listen
+        :param port: {Integer} -> port to listen, 0 - any free port
+        :param path: {String} -> path of callback URL, other paths are answered with 404
+        :param events: (optional) queue for events, object with put_nowait method. queue.Queue if not specified,
+            pass asyncio.Queue to consume events in the loop server runs in
+        :param handlers: {Dict} -> (optional) event name ("*" for all events): list of handlers, see add_handler
+        :param dedupe_size: {Integer} -> number of last payload keys remembered for deduplication
+        :param response_mode: RESPONSE_NTUPLE or RESPONSE_LAZY, see OhtApi
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.events = queue.Queue() if events is None else events
+        self.dedupe_size = dedupe_size
+        self.response_mode = response_mode
+        self.__handlers = {}
+        for event, funcs in (handlers or {}).items():
+            for func in funcs:
+                self.add_handler(event, func)
+        self.__seen = OrderedDict()
+        self.__stats = [0, 0, 0, 0]
+        self.__server = None
+        self.__loop = None
+        self.__thread = None
+
+    def add_handler(self, event, func):
+        """
+        :param event: {String} -> event name, "*" for all events
+        :param func: {Callable} -> called with CallbackEvent, can be coroutine function.
+            Exceptions of handlers are counted (stats) and do not affect answer to OHT server.
+        """
+        self.__handlers.setdefault(event, []).append(func)
+
+    def url(self):
+        """
+        :return: {String} -> callback URL for create_*_project methods
+        """
+        return "http://{0}:{1}{2}".format(self.host, self.port, self.path)
+
+    def stats(self):
+        """
+        :return: CallbackStats namedtuple with fields:
+            received: {Integer} -> new events
+            duplicates: {Integer} -> dropped repeated deliveries
+            invalid: {Integer} -> rejected requests (wrong path, method or payload)
+            handler_errors: {Integer} -> exceptions raised by handlers
+        """
+        return CallbackStats(*self.__stats)
+
+    async def dispatch(self, body, content_type=""):
+        """
+        Process one callback payload as if it was received by server
+        :return: CallbackEvent, None for repeated delivery
+        :raise ValueError if payload is invalid
+        """
+        payload, canonical = parse_callback(body, content_type, self.response_mode)
+        key = str(getattr(payload, "event_id", "") or hashlib.sha256(canonical.encode("utf-8")).hexdigest())
+        if key in self.__seen:
+            self.__seen.move_to_end(key)
+            self.__stats[1] += 1
+            return None
+        self.__seen[key] = True
+        while len(self.__seen) > self.dedupe_size:
+            self.__seen.popitem(last=False)
+        self.__stats[0] += 1
+        event = CallbackEvent(str(getattr(payload, "event", "") or ""), getattr(payload, "project_id", None), payload, key)
+        for func in self.__handlers.get(event.event, []) + self.__handlers.get("*", []):
+            try:
+                result = func(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                self.__stats[3] += 1
+        self.events.put_nowait(event)
+        return event
+
+    async def _handle(self, reader, writer):
+        status = 200
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, target = lines[0].split(" ")[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if urllib.parse.urlsplit(target).path != self.path:
+                status = 404
+            elif method != "POST":
+                status = 405
+            elif length > self.MAX_BODY:
+                status = 413
+            else:
+                try:
+                    await self.dispatch(await reader.readexactly(length), headers.get("content-type", ""))
+                except ValueError:
+                    status = 400
+            if status != 200:
+                self.__stats[2] += 1
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status = 400
+            self.__stats[2] += 1
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  413: "Payload Too Large"}[status]
+        writer.write("HTTP/1.1 {0} {1}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".format(
+            status, reason).encode("latin-1"))
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self):
+        """
+        Start listening in running event loop
+        :return: {String} -> callback URL
+        """
+        self.__server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.__server.sockets[0].getsockname()[1]
+        return self.url()
+
+    async def stop(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    def serve_in_thread(self):
+        """
+        Start server with its own event loop in daemon thread
+        :return: {String} -> callback URL
+        """
+        started = concurrent.futures.Future()
+        self.__loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self.__loop)
+            try:
+                started.set_result(self.__loop.run_until_complete(self.start()))
+            except Exception as error:
+                started.set_exception(error)
+                return
+            self.__loop.run_forever()
+            self.__loop.run_until_complete(self.stop())
+            self.__loop.close()
+
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+        return started.result()
+
+    def shutdown(self):
+        """
+        Stop server started by serve_in_thread
+        """
+        if self.__thread is not None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__thread = self.__loop = None
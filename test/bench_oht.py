@@ -0,0 +1,236 @@
+"""
+Micro-benchmarks for OhtApi, run as:
+    python test/bench_oht.py - json_to_ntuple decoding, discovery cache
+    python test/bench_oht.py upload [size in MB ...] - create_file_resource throughput and peak RSS
+    python test/bench_oht.py e2e [--out FILE] [...] - latency percentiles and throughput of every public method
+        against local OhtStubServer in sync, concurrent and streaming modes, written as json (see --help)
+"""
+__author__ = 'svyrydenko'
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OhtApi2
+import requests
+from oht_stub import OhtStubServer, StubServer
+from test_oht import PROJECT_DETAIL_ANSWER, FakeTransport, public_calls, stub_api
+
+UPLOAD_SIZES = [1 << 20, 16 << 20, 128 << 20, 1 << 30]
+
+
+def language_pairs_answer(sources=60, targets=40):
+    results = [{"source": {"code": "l{0}".format(src), "name": "Language {0}".format(src)},
+                "targets": [{"code": "l{0}".format(tgt), "name": "Language {0}".format(tgt), "availability": "high"}
+                            for tgt in range(targets)]}
+               for src in range(sources)]
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "results": results, "errors": []})
+
+
+def comments_answer(count=2000):
+    results = [{"id": str(index), "date": "2015-10-01 10:00:00", "commenter_name": "name {0}".format(index),
+                "commenter_role": "customer", "comment_content": "comment {0}".format(index)}
+               for index in range(count)]
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "results": results, "errors": []})
+
+
+def uncached_hook(data):
+    """ json_to_ntuple object hook before record types caching """
+    d = {}
+    for key in data.keys():
+        if not key.isidentifier():
+            d[key] = data[key]
+    return d if d else namedtuple("oht_response", data.keys())(*data.values())
+
+
+def best_of(func, number, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_json_to_ntuple():
+    api = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport())
+    payloads = [("project_detail", PROJECT_DETAIL_ANSWER, 2000),
+                ("supported_language_pairs", language_pairs_answer(), 5),
+                ("project_comments", comments_answer(), 5)]
+    for name, payload, number in payloads:
+        old = best_of(lambda: json.loads(payload, object_hook=uncached_hook), number)
+        new = best_of(lambda: api.json_to_ntuple(payload), number)
+        lazy = best_of(lambda: api.json_to_view(payload).status.code, number)
+        print("json_to_ntuple {0:<26} uncached {1:10.1f} us  cached {2:10.1f} us  x{3:.1f}  lazy {4:10.1f} us".format(
+            name, old * 1e6, new * 1e6, old / new, lazy * 1e6))
+
+
+def bench_discovery_cache():
+    api = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport(language_pairs_answer()),
+                         discovery_cache=OhtApi2.TTLCache())
+    api.supported_language_pairs()
+    print("supported_language_pairs cached call {0:10.2f} us".format(best_of(api.supported_language_pairs, 100000) * 1e6))
+
+
+def upload_once(size, mode):
+    """
+    Upload file of given size to local stub server, print json with throughput and peak RSS of this process
+    """
+    server = StubServer('{"status":{"code":0,"msg":"ok"},"results":["rsc-1"],"errors":[]}', keep_payload=False)
+    server.start()
+    api = stub_api(server)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "upload.bin")
+        with open(path, "wb") as file:
+            file.truncate(size)
+        start = time.perf_counter()
+        if mode == "streaming":
+            api.create_file_resource(path)
+        else:
+            # body built by requests in memory, as create_file_resource did before MultipartEncoder
+            with open(path, "rb") as file:
+                requests.post(server.url() + "/resources/file", files={"file": file})
+        elapsed = time.perf_counter() - start
+    api.close()
+    server.stop()
+    print(json.dumps({"size": size, "mode": mode, "seconds": elapsed, "mb_per_s": size / elapsed / (1 << 20),
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def bench_upload(sizes=UPLOAD_SIZES):
+    """ each upload runs in separate process, so peak RSS is not affected by previous runs """
+    for size in sizes:
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "upload-once", str(size), mode],
+                                 stdout=subprocess.PIPE, check=True).stdout
+            result = json.loads(out.decode().splitlines()[-1])
+            print("upload {0:>6} MB {1:<10} {2:8.1f} MB/s  peak RSS {3:8.1f} MB".format(
+                size >> 20, mode, result["mb_per_s"], result["peak_rss_mb"]))
+
+
+def percentile(samples, part):
+    """ nearest-rank percentile of sorted samples """
+    return samples[min(len(samples) - 1, max(0, int(round(part * len(samples))) - 1))]
+
+
+def measure(name, mode, call, calls, workers=1, size=0):
+    """
+    Run call calls times in workers threads
+    :return: {Dict} -> latency percentiles in ms, throughput in calls (and MB) per second, number of failed calls
+    """
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            call()
+            error = False
+        except Exception:
+            error = True
+        return time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    if workers == 1:
+        samples = [timed(index) for index in range(calls)]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            samples = list(executor.map(timed, range(calls)))
+    wall = time.perf_counter() - start
+    latencies = sorted(latency for latency, error in samples)
+    result = {"name": name, "mode": mode, "calls": calls, "workers": workers,
+              "errors": sum(error for latency, error in samples),
+              "p50_ms": percentile(latencies, 0.5) * 1e3, "p90_ms": percentile(latencies, 0.9) * 1e3,
+              "p99_ms": percentile(latencies, 0.99) * 1e3, "mean_ms": sum(latencies) / len(latencies) * 1e3,
+              "throughput_rps": calls / wall}
+    if size:
+        result["mb_per_s"] = size * calls / wall / (1 << 20)
+    return result
+
+
+def bulk_calls(api, folder):
+    """ public methods which make many requests, by name """
+    texts = ["string {0}".format(index) for index in range(100)]
+    return {"upload_many": lambda: list(api.upload_many([b"content"] * 10)),
+            "download_project_outputs": lambda: api.download_project_outputs(1, folder),
+            "machine_translate_many": lambda: api.machine_translate_many(texts, "en-us", "fr-fr"),
+            "sync_comments": lambda: api.sync_comments(OhtApi2.CommentStore(), range(10)),
+            "quote_planner": lambda: OhtApi2.QuotePlanner(api).plan(["rsc-1"], "en-us", ["fr-fr", "de-de", "it-it"],
+                                                                    services=["translation", "transproof"])}
+
+
+def bench_e2e(args):
+    server = OhtStubServer(latency=args.latency, error_rate=args.error_rate, comments=args.comments,
+                           download_size=args.download_size)
+    server.start()
+    transport = OhtApi2.OhtTransport(pool_maxsize=args.workers)
+    api = stub_api(server, transport=transport, resilience=OhtApi2.ResiliencePolicy(retries=0, failure_threshold=None))
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        # every download goes to its own file, concurrent calls must not share partial file
+        counter = itertools.count()
+        for name, call in sorted(public_calls(api).items()):
+            results.append(measure(name, "sync", call, args.calls))
+            results.append(measure(name, "concurrent", call, args.calls, args.workers))
+            del server.requests[:]
+        for name, call in sorted(bulk_calls(api, folder).items()):
+            results.append(measure(name, "sync", call, max(1, args.calls // 20)))
+            del server.requests[:]
+        size = args.download_size
+        content = b"x" * size
+        streaming = {"download_resource": lambda: api.download_resource(
+                         "rsc-1", os.path.join(folder, "download-{0}.bin".format(next(counter)))),
+                     "iter_resource": lambda: sum(len(chunk) for chunk in api.iter_resource("rsc-1")),
+                     "create_file_resource": lambda: api.create_file_resource(content, file_name="upload.bin")}
+        for name, call in sorted(streaming.items()):
+            results.append(measure(name, "streaming", call, args.calls, size=size))
+            results.append(measure(name, "streaming", call, args.calls, args.workers, size=size))
+            del server.requests[:]
+    api.close()
+    transport.close()
+    server.stop()
+
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "platform": platform.platform(), "latency": args.latency, "error_rate": args.error_rate,
+                       "calls": args.calls, "workers": args.workers, "download_size": args.download_size,
+                       "orjson": OhtApi2.orjson is not None},
+              "results": results}
+    for item in results:
+        print("{name:<34} {mode:<10} x{workers:<3} p50 {p50_ms:8.2f} ms  p99 {p99_ms:8.2f} ms  {throughput_rps:9.1f} rps"
+              .format(**item) + ("  {0:8.1f} MB/s".format(item["mb_per_s"]) if "mb_per_s" in item else "")
+              + ("  {0} errors".format(item["errors"]) if item["errors"] else ""))
+    failed = [item for item in results if item["errors"]]
+    if failed and not args.error_rate:
+        # numbers of broken run are not comparable with other reports
+        sys.exit("{0} results have failed calls without --error-rate, report is not written".format(len(failed)))
+    with open(args.out, "w") as file:
+        json.dump(report, file, indent=1)
+    print("written to", args.out)
+
+
+def e2e_args(argv):
+    parser = argparse.ArgumentParser(prog="bench_oht.py e2e")
+    parser.add_argument("--out", default="bench_e2e.json", help="json report file")
+    parser.add_argument("--calls", type=int, default=200, help="calls of every method in every mode")
+    parser.add_argument("--workers", type=int, default=16, help="threads in concurrent mode")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds stub server waits before answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part of requests answered with 503")
+    parser.add_argument("--comments", type=int, default=20, help="comments in project_comments answer")
+    parser.add_argument("--download-size", type=int, default=1 << 20, help="size of downloaded/uploaded resource")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["upload-once"]:
+        upload_once(int(sys.argv[2]), sys.argv[3])
+    elif sys.argv[1:2] == ["upload"]:
+        bench_upload([int(size) << 20 for size in sys.argv[2:]] or UPLOAD_SIZES)
+    elif sys.argv[1:2] == ["e2e"]:
+        bench_e2e(e2e_args(sys.argv[2:]))
+    else:
+        bench_json_to_ntuple()
+        bench_discovery_cache()
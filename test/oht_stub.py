@@ -0,0 +1,296 @@
+"""
+Local HTTP servers for offline tests and benchmarks:
+    StubServer - answer every request with canned body and record what was asked
+    OhtStubServer - realistic answers for every route of OhtApi._apiUrl
+and sender of OHT callbacks
+"""
+__author__ = 'svyrydenko'
+
+import http.server
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+OK_ANSWER = '{"status":{"code":0,"msg":"ok"},"results":[],"errors":[]}'
+
+
+class StubServer:
+    """
+    body can be str or bytes, Range requests are supported
+    keep_payload - if False, request bodies are read and dropped (for big uploads)
+    routes - answers for particular paths (without /api/2 prefix): path: body or path: (status, body)
+    latency - seconds to wait before every answer
+    error_rate - part of requests (0..1) answered with error_status
+    """
+    prefix = "/api/2"
+
+    def __init__(self, body=OK_ANSWER, status=200, keep_payload=True, latency=0.0, error_rate=0.0, error_status=503,
+                 seed=0):
+        self.body = body
+        self.status = status
+        self.keep_payload = keep_payload
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.routes = {}
+        self.requests = []
+        self.__server = None
+        self.__thread = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # headers and body are written separately, without it every answer waits for delayed ACK
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _answer(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                chunks = self._read_body()
+                payload = b"".join(chunks) if stub.keep_payload else b""
+                for _ in chunks:
+                    pass
+                stub.requests.append((self.command.lower(), parsed.path, urllib.parse.parse_qs(parsed.query), payload,
+                                      dict(self.headers)))
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, body = stub.status, stub.body
+                path = parsed.path[len(stub.prefix):]
+                route = stub.routes.get(path)
+                if route is None:
+                    route = stub.respond(self.command.lower(), path, urllib.parse.parse_qs(parsed.query), payload)
+                if route is not None:
+                    status, body = route if isinstance(route, tuple) else (200, route)
+                if stub.error_rate and stub.random.random() < stub.error_rate:
+                    status, body = stub.error_status, '{"status":{"code":500,"msg":"stub error"},"results":[],"errors":[]}'
+                body = body.encode("utf-8") if isinstance(body, str) else body
+                content_range = None
+                byte_range = self.headers.get("Range")
+                if byte_range and status == 200:
+                    start = int(byte_range.split("=")[1].split("-")[0])
+                    if start >= len(body):
+                        status, content_range, body = 416, "bytes */{0}".format(len(body)), b""
+                    else:
+                        status, content_range = 206, "bytes {0}-{1}/{2}".format(start, len(body) - 1, len(body))
+                        body = body[start:]
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if content_range:
+                    self.send_header("Content-Range", content_range)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _read_body(self):
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    while True:
+                        size = int(self.rfile.readline().split(b";")[0], 16)
+                        if not size:
+                            self.rfile.readline()
+                            return
+                        yield self.rfile.read(size)
+                        self.rfile.readline()
+                length = int(self.headers.get("Content-Length") or 0)
+                while length > 0:
+                    chunk = self.rfile.read(min(length, 1 << 20))
+                    if not chunk:
+                        return
+                    length -= len(chunk)
+                    yield chunk
+
+            do_GET = do_POST = do_DELETE = do_HEAD = _answer
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def respond(self, method, path, query, payload):
+        """
+        Answer for request without route: body, (status, body) or None for default body
+        """
+        return None
+
+    def start(self):
+        """
+        :return: {String} -> base URL of started server
+        """
+        self.__server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self.url()
+
+    def url(self):
+        return "http://127.0.0.1:{0}{1}".format(self.__server.server_address[1], self.prefix)
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+
+def send_callback(url, fields, as_json=False):
+    """
+    Deliver OHT callback like OHT server does: POST of form (or json) fields to callback URL
+    :return: {Integer} -> HTTP status of answer
+    """
+    if as_json:
+        body, content_type = json.dumps(fields).encode("utf-8"), "application/json"
+    else:
+        body, content_type = urllib.parse.urlencode(fields).encode("utf-8"), "application/x-www-form-urlencoded"
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as answer:
+            return answer.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def _answer(results, code=0, msg="ok"):
+    return json.dumps({"status": {"code": code, "msg": msg}, "results": results, "errors": []})
+
+
+class OhtStubServer(StubServer):
+    """
+    Stub of OHT API v2: every route of OhtApi._apiUrl answers with realistic payload.
+    Sizes of answers are configurable:
+        comments - number of comments of every project
+        languages - number of languages (language pairs answer has languages * (languages - 1) pairs)
+        resources - number of sources (and translations) of every project
+        download_size - size of downloaded resource in bytes
+    """
+
+    def __init__(self, comments=20, languages=40, resources=2, download_size=64 << 10, **kwargs):
+        super().__init__(keep_payload=False, **kwargs)
+        self.comments = comments
+        self.languages = languages
+        self.resources = resources
+        self.download = b"x" * download_size
+        self.__counter = 0
+        self.__lock = threading.Lock()
+        self.__routes = [("get", r"/account/?", self.account),
+                         ("post", r"/resources/file", self.create_resource),
+                         ("get", r"/resources/([^/]+)/download", self.download_resource),
+                         ("get", r"/resources/([^/]+)", self.get_resource),
+                         ("get", r"/tools/quote", self.quote),
+                         ("get", r"/tools/wordcount", self.word_count),
+                         ("post", r"/projects/(translation|proof-general|proof-translated|transcription)",
+                          self.new_project),
+                         ("get", r"/projects/(\d+)", self.project_detail),
+                         ("delete", r"/projects/(\d+)", self.ok),
+                         ("get", r"/projects/(\d+)/comments", self.project_comments),
+                         ("post", r"/projects/(\d+)/comments", self.ok),
+                         ("get", r"/projects/(\d+)/rating", self.project_ratings),
+                         ("post", r"/projects/(\d+)/rating", self.ok),
+                         ("get", r"/mt/translate/text", self.machine_translate),
+                         ("post", r"/mt/translate/text", self.machine_translate),
+                         ("get", r"/mt/detect/text", self.machine_detect),
+                         ("get", r"/discover/languages", self.discover_languages),
+                         ("get", r"/discover/language_pairs", self.discover_language_pairs),
+                         ("get", r"/discover/expertise", self.discover_expertise)]
+        self.__routes = [(method, re.compile(pattern + "$"), func) for method, pattern, func in self.__routes]
+        self.__languages = ["l{0}-{1}".format(index // 26, chr(97 + index % 26)) for index in range(languages)]
+        self.__pairs = _answer([{"source": {"code": source, "name": source},
+                                 "targets": [{"code": target, "name": target, "availability": "high"}
+                                             for target in self.__languages if target != source]}
+                                for source in self.__languages])
+
+    def respond(self, method, path, query, payload):
+        for route_method, pattern, func in self.__routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return func(query, *match.groups())
+        return 404, _answer([], 404, "unknown route")
+
+    def _next(self):
+        with self.__lock:
+            self.__counter += 1
+            return self.__counter
+
+    def ok(self, query, *args):
+        return _answer([])
+
+    def account(self, query):
+        return _answer({"account_id": "1", "account_username": "stub", "credits": "98610.5200", "role": "customer"})
+
+    def create_resource(self, query):
+        return _answer(["rsc-stub-{0}".format(self._next())])
+
+    def get_resource(self, query, uuid):
+        return _answer({"type": "file", "length": len(self.download), "file_name": uuid + ".txt",
+                        "file_mime": "text/plain", "download_url": "/resources/{0}/download".format(uuid)})
+
+    def download_resource(self, query, uuid):
+        return self.download
+
+    def _uuids(self, query):
+        return (query.get("resources") or ["rsc-1"])[0].split(",")
+
+    def word_count(self, query):
+        uuids = self._uuids(query)
+        return _answer({"resources": [{"resource": uuid, "wordcount": 100} for uuid in uuids],
+                        "total": {"wordcount": 100 * len(uuids)}})
+
+    def quote(self, query):
+        uuids = self._uuids(query)
+        words = int((query.get("wordcount") or ["0"])[0]) or 100 * len(uuids)
+        credits = words * 0.07
+        return _answer({"currency": (query.get("currency") or ["USD"])[0],
+                        "resources": [{"resource": uuid, "wordcount": 100, "credits": "7.00", "price": 7}
+                                      for uuid in uuids],
+                        "total": {"wordcount": words, "credits": "{0:.2f}".format(credits), "net_price": credits,
+                                  "transaction_fee": 0, "price": credits}})
+
+    def new_project(self, query, kind):
+        return _answer({"project_id": str(800000 + self._next()), "wordcount": 100, "credits": "7.00"})
+
+    def project_detail(self, query, project_id):
+        sources = ["rsc-src-{0}-{1}".format(project_id, index) for index in range(self.resources)]
+        translations = ["rsc-tr-{0}-{1}".format(project_id, index) for index in range(self.resources)]
+        return _answer({"project_id": project_id, "project_type": "Translation", "project_status": "Being translated",
+                        "project_status_code": "in_progress", "source_language": "en-us", "target_language": "fr-fr",
+                        "resources": {"sources": sources, "translations": translations, "proofs": "",
+                                      "transcriptions": ""},
+                        "wordcount": str(100 * self.resources), "custom": "",
+                        "resource_binding": dict(zip(sources, [[uuid] for uuid in translations])),
+                        "linguist_uuid": "70f6df63-9359-4f5b-a7c2-2483123a269a"})
+
+    def project_comments(self, query, project_id):
+        return _answer([{"id": str(index), "date": "2015-10-01 10:00:00", "commenter_name": "name {0}".format(index),
+                         "commenter_role": "provider", "comment_content": "comment {0}".format(index)}
+                        for index in range(self.comments)])
+
+    def project_ratings(self, query, project_id):
+        return _answer([{"type": kind, "rate": rate, "remarks": "", "date": "2015-10-01 10:00:00", "status_approved": "1"}
+                        for kind, rate in (("Customer", "9"), ("Service", "10"))])
+
+    def machine_translate(self, query):
+        return _answer({"TranslatedText": (query.get("source_content") or [""])[0].upper()})
+
+    def machine_detect(self, query):
+        return _answer({"language": "en"})
+
+    def discover_languages(self, query):
+        return _answer([{"code": code, "name": code} for code in self.__languages])
+
+    def discover_language_pairs(self, query):
+        return self.__pairs
+
+    def discover_expertise(self, query):
+        return _answer([{"name": "Automotive / Aerospace", "code": "automotive-aerospace"},
+                        {"name": "Marketing / Consumer / Media", "code": "marketing-consumer-media"}])
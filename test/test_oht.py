@@ -1,18 +1,30 @@
 __author__ = 'svyrydenko'
 
 import datetime
+import io
+import json
 import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
 import unittest.mock
+import urllib.parse
+import asyncio
 import requests.exceptions
 from collections import Counter
+from email.parser import BytesParser
 import OhtApi2
+from oht_stub import OhtStubServer, StubServer, send_callback
 
 class StateHolder:
     pass
 
 holder = StateHolder()
 
+PROJECT_DETAIL_ANSWER = '{"status":{"code":0,"msg":"ok"},"results":{"project_id":"807837","project_type":"Translation","project_status":"Being translated","project_status_code":"signed","source_language":"en-us","target_language":"ru-ru","resources":{"sources":["rsc-560a693ccfbbc2-86754957","rsc-560a6a5524b4a2-38348001"],"translations":["rsc-560abb5ab099b0-90175867","rsc-560abb5ab4ab73-60700513"],"proofs":"","transcriptions":""},"wordcount":"5","custom":"","resource_binding":{"rsc-560a693ccfbbc2-86754957":["rsc-560abb5ab099b0-90175867"],"rsc-560a6a5524b4a2-38348001":["rsc-560abb5ab4ab73-60700513"],"rsc-560abb5ab099b0-90175867":null,"rsc-560abb5ab4ab73-60700513":null},"linguist_uuid":"70f6df63-9359-4f5b-a7c2-2483123a269a"},"errors":[]}'
+
 class Test_URLCheckSandbox(unittest.TestCase):
     def setUp(self):
         self.obj = OhtApi2.OhtApi("a","b", True)
@@ -50,7 +62,7 @@ class Test_JsonToObject(unittest.TestCase):
         del self.obj
 
     def test_jsonToObjectOkAnswer(self):
-        good_answer = '{"status":{"code":0,"msg":"ok"},"results":{"project_id":"807837","project_type":"Translation","project_status":"Being translated","project_status_code":"signed","source_language":"en-us","target_language":"ru-ru","resources":{"sources":["rsc-560a693ccfbbc2-86754957","rsc-560a6a5524b4a2-38348001"],"translations":["rsc-560abb5ab099b0-90175867","rsc-560abb5ab4ab73-60700513"],"proofs":"","transcriptions":""},"wordcount":"5","custom":"","resource_binding":{"rsc-560a693ccfbbc2-86754957":["rsc-560abb5ab099b0-90175867"],"rsc-560a6a5524b4a2-38348001":["rsc-560abb5ab4ab73-60700513"],"rsc-560abb5ab099b0-90175867":null,"rsc-560abb5ab4ab73-60700513":null},"linguist_uuid":"70f6df63-9359-4f5b-a7c2-2483123a269a"},"errors":[]}'
+        good_answer = PROJECT_DETAIL_ANSWER
         res = self.obj.json_to_ntuple(good_answer)
         self.assertTrue(hasattr(res, "status"), "No attribute <status> in result namedtuple" )
         self.assertTrue(hasattr(res, "results"), "No attribute <results> in result namedtuple" )
@@ -62,6 +74,1932 @@ class Test_JsonToObject(unittest.TestCase):
             self.obj.json_to_ntuple(bad_answer)
 
 
+OK_ANSWER = '{"status":{"code":0,"msg":"ok"},"results":[],"errors":[]}'
+
+
+class FakeResponse:
+    def __init__(self, text=OK_ANSWER, status_code=200, url=""):
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = status_code
+        self.url = url
+
+    def iter_content(self, chunk_size=1):
+        for pos in range(0, len(self.content), chunk_size):
+            yield self.content[pos:pos + chunk_size]
+
+
+class FakeTransport:
+    """ Record requests instead of sending them """
+    def __init__(self, text=OK_ANSWER):
+        self.text = text
+        self.calls = []
+        self.closed = False
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(self.text, url=url)
+
+    def close(self):
+        self.closed = True
+
+
+def stub_api(server, cls=OhtApi2.OhtApi, **kwargs):
+    """ API instance working with local stub server """
+    with unittest.mock.patch.object(OhtApi2.OhtApi, "_renew_work_url"):
+        obj = cls("a", "b", True, **kwargs)
+    obj.set_sandbox_url(server.url())
+    return obj
+
+
+class Test_Transport(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        del self.transport.calls[:]
+
+    def tearDown(self):
+        del self.obj
+
+    def test_probe_use_transport(self):
+        OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        self.assertEqual(self.transport.calls[0][0], "head")
+
+    def test_all_methods_use_transport(self):
+        calls = [lambda: self.obj.account_details(),
+                 lambda: self.obj.create_file_resource(file_name="a", file_content="b"),
+                 lambda: self.obj.get_resource("rsc"),
+                 lambda: self.obj.download_resource("rsc"),
+                 lambda: self.obj.quote(["rsc"], "en-us", "fr-fr"),
+                 lambda: self.obj.word_count(["rsc"]),
+                 lambda: self.obj.create_translation_project("en-us", "fr-fr", ["rsc"]),
+                 lambda: self.obj.create_proof_reading_project("en-us", ["rsc"]),
+                 lambda: self.obj.create_transcription_project("en-us", ["rsc"]),
+                 lambda: self.obj.project_detail(1),
+                 lambda: self.obj.cancel_project(1),
+                 lambda: self.obj.project_comments(1),
+                 lambda: self.obj.post_comment(1, "text"),
+                 lambda: self.obj.project_ratings(1),
+                 lambda: self.obj.post_project_ratings(1, "Customer", 1),
+                 lambda: self.obj.machine_translate("en-us", "fr-fr", "text"),
+                 lambda: self.obj.machine_detect_lang("text"),
+                 lambda: self.obj.supported_languages(),
+                 lambda: self.obj.supported_language_pairs(),
+                 lambda: self.obj.expertises()]
+        for call in calls:
+            call()
+        self.assertEqual(len(self.transport.calls), len(calls))
+        for method, url, kwargs in self.transport.calls:
+            self.assertTrue(url.startswith(self.obj.sandbox_url()), msg=url)
+
+    def test_url_building(self):
+        self.obj.project_comments(42)
+        method, url, kwargs = self.transport.calls[0]
+        self.assertEqual(method, "get")
+        self.assertEqual(url, self.obj.sandbox_url() + "/projects/42/comments")
+        self.assertEqual(kwargs["params"]["public_key"], "a")
+
+    def test_close_foreign_transport(self):
+        self.obj.close()
+        self.assertFalse(self.transport.closed)
+
+    def test_pool_settings(self):
+        transport = OhtApi2.OhtTransport(pool_connections=3, pool_maxsize=7, keep_alive=False)
+        adapter = transport.session.get_adapter("https://example.com")
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(transport.session.headers["Connection"], "close")
+        transport.close()
+
+
+class Test_LazyUrlCheck(unittest.TestCase):
+    def setUp(self):
+        OhtApi2._url_checks.clear()
+        self.transport = FakeTransport()
+
+    def tearDown(self):
+        OhtApi2._url_checks.clear()
+
+    def methods(self):
+        return [method for method, url, kwargs in self.transport.calls]
+
+    def test_lazy_construction(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_LAZY)
+        self.assertEqual(self.transport.calls, [])
+        obj.account_details()
+        obj.account_details()
+        self.assertEqual(self.methods(), ["head", "get", "get"])
+
+    def test_check_shared(self):
+        OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_LAZY).account_details()
+        OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_LAZY).account_details()
+        self.assertEqual(self.methods(), ["head", "get", "get"])
+
+    def test_schema_added(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_LAZY)
+        self.assertIsNone(obj.set_sandbox_url("example.com/api/2"))
+        self.assertEqual(obj.sandbox_url(), "https://example.com/api/2")
+        obj.account_details()
+        self.assertEqual(self.transport.calls[0][1], "https://example.com/api/2")
+
+    def test_background(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_BACKGROUND)
+        OhtApi2._url_checks[obj.sandbox_url()].result(timeout=5)
+        self.assertEqual(self.methods(), ["head"])
+        obj.account_details()
+        self.assertEqual(self.methods(), ["head", "get"])
+
+    def test_failed_check_not_cached(self):
+        class Transport(FakeTransport):
+            def request(self, method, url, **kwargs):
+                if method == "head" and not self.calls:
+                    self.calls.append((method, url, kwargs))
+                    raise requests.exceptions.ConnectionError()
+                return super().request(method, url, **kwargs)
+
+        self.transport = Transport()
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, url_check=OhtApi2.URL_CHECK_LAZY)
+        self.assertRaises(requests.exceptions.ConnectionError, obj.account_details)
+        obj.account_details()
+        self.assertEqual(self.methods(), ["head", "head", "get"])
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, OhtApi2.OhtApi, "a", "b", True, transport=self.transport, url_check="never")
+
+
+class ScriptedTransport(FakeTransport):
+    """ Answer with given statuses (or raise given exceptions) one by one, then with 200 """
+    def __init__(self, *script):
+        super().__init__()
+        self.script = list(script)
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        step = self.script.pop(0) if self.script else 200
+        if isinstance(step, Exception):
+            raise step
+        return FakeResponse(status_code=step, url=url)
+
+
+class Test_Resilience(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleeps = []
+        self.policy = OhtApi2.ResiliencePolicy(connect_timeout=2, read_timeout=20, timeouts={"quote": (1, 5)},
+                                               retries=2, backoff=0.5, jitter=0.5, failure_threshold=3,
+                                               reset_timeout=30, clock=self.clock, sleep=self.sleeps.append,
+                                               random=lambda: 0.5)
+
+    def api(self, *script):
+        self.transport = ScriptedTransport()
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, resilience=self.policy)
+        del self.transport.calls[:]
+        self.transport.script = list(script)
+        return obj
+
+    def test_timeouts(self):
+        obj = self.api()
+        obj.project_detail(1)
+        obj.quote(["rsc"], "en-us", "fr-fr")
+        self.assertEqual([kwargs["timeout"] for method, url, kwargs in self.transport.calls], [(2, 20), (1, 5)])
+
+    def test_disabled_by_default(self):
+        transport = ScriptedTransport()
+        obj = OhtApi2.OhtApi("a", "b", True, transport=transport)
+        transport.script = [503] * 10
+        for _ in range(10):
+            obj.project_detail(1)
+        self.assertEqual(len(transport.calls), 11)
+        self.assertEqual(transport.calls[-1][2]["timeout"], (None, None))
+        stats = obj.resilience().stats()
+        self.assertEqual((stats.retries, stats.state, stats.opened), ({}, OhtApi2.BREAKER_CLOSED, 0))
+
+    def test_retry_idempotent_get(self):
+        obj = self.api(503, requests.exceptions.ConnectionError())
+        self.assertEqual(obj.project_detail(1).status.code, 0)
+        self.assertEqual(len(self.transport.calls), 3)
+        self.assertEqual(self.sleeps, [0.375, 0.75])
+        self.assertEqual(self.policy.stats().retries, {"project-details": 2})
+        self.assertEqual(obj.request_stats().calls("project-details"), 3)
+
+    def test_retries_exhausted(self):
+        obj = self.api(requests.exceptions.Timeout(), requests.exceptions.Timeout(), requests.exceptions.Timeout())
+        self.assertRaises(requests.exceptions.Timeout, obj.word_count, ["rsc"])
+        self.assertEqual(len(self.transport.calls), 3)
+
+    def test_no_retry_for_post(self):
+        obj = self.api(503)
+        obj.create_translation_project("en-us", "fr-fr", ["rsc"])
+        obj.account_details()
+        self.assertEqual(len(self.transport.calls), 2)
+        self.assertEqual(self.sleeps, [])
+
+    def test_no_retry_for_client_error(self):
+        obj = self.api(404)
+        obj.project_detail(1)
+        self.assertEqual(len(self.transport.calls), 1)
+
+    def test_circuit_breaker(self):
+        obj = self.api(500, 500, 500)
+        obj.create_transcription_project("en-us", ["rsc"])
+        obj.create_transcription_project("en-us", ["rsc"])
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_CLOSED)
+        obj.create_transcription_project("en-us", ["rsc"])
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_OPEN)
+        self.assertRaises(OhtApi2.CircuitOpenError, obj.account_details)
+        self.assertEqual(len(self.transport.calls), 3)
+
+        self.clock.now += 30
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_HALF_OPEN)
+        obj.account_details()
+        stats = self.policy.stats()
+        self.assertEqual((stats.state, stats.failures, stats.opened, stats.rejected), (OhtApi2.BREAKER_CLOSED, 0, 1, 1))
+
+    def test_failed_trial_reopens(self):
+        obj = self.api(500, 500, 500, requests.exceptions.ConnectionError())
+        for _ in range(3):
+            obj.account_details()
+        self.clock.now += 30
+        self.assertRaises(requests.exceptions.ConnectionError, obj.account_details)
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_OPEN)
+        self.assertRaises(OhtApi2.CircuitOpenError, obj.account_details)
+
+    def test_non_transient_error(self):
+        obj = self.api(*[requests.exceptions.InvalidURL()] * 3)
+        for _ in range(3):
+            self.assertRaises(requests.exceptions.InvalidURL, obj.project_detail, 1)
+        self.assertEqual(len(self.transport.calls), 3)
+        stats = self.policy.stats()
+        self.assertEqual((stats.retries, stats.state, stats.failures), ({}, OhtApi2.BREAKER_CLOSED, 0))
+
+    def test_only_trial_closes_breaker(self):
+        self.assertFalse(self.policy.before_request("project-details"))
+        for _ in range(3):
+            self.policy.after_request("post", "new-comment", 0, 500)
+        self.clock.now += 30
+        self.assertTrue(self.policy.before_request("project-details"))
+        # request started before breaker was opened neither closes it nor releases trial slot
+        self.policy.after_request("get", "project-details", 0, 200)
+        self.assertRaises(OhtApi2.CircuitOpenError, self.policy.before_request, "project-details")
+        self.policy.after_request("get", "project-details", 0, error=requests.exceptions.InvalidURL(), trial=True)
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_HALF_OPEN)
+        self.assertTrue(self.policy.before_request("project-details"))
+        self.policy.after_request("get", "project-details", 0, 200, trial=True)
+        self.assertEqual(self.policy.stats().state, OhtApi2.BREAKER_CLOSED)
+
+
+class Test_RateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_token_bucket(self):
+        bucket = OhtApi2.TokenBucket(2, burst=2, clock=self.clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        self.clock.now += 10
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.5])
+
+    @unittest.skipIf(OhtApi2.fcntl is None, "fcntl is not available")
+    def test_file_bucket_shared(self):
+        path = os.path.join(self.dir.name, "bucket")
+        first = OhtApi2.FileTokenBucket(path, 1, burst=1, clock=self.clock)
+        second = OhtApi2.FileTokenBucket(path, 1, burst=1, clock=self.clock)
+        self.assertEqual([first.reserve(), second.reserve(), first.reserve()], [0.0, 1.0, 2.0])
+        first.close()
+        second.close()
+
+    @unittest.skipIf(OhtApi2.fcntl is None, "fcntl is not available")
+    def test_file_bucket_future_timestamp(self):
+        path = os.path.join(self.dir.name, "bucket")
+        with open(path, "wb") as file:
+            file.write(OhtApi2.FileTokenBucket._format.pack(-5.0, self.clock.now + 86400))
+        bucket = OhtApi2.FileTokenBucket(path, 2, burst=2, clock=self.clock)
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0.5, 1.0])
+        bucket.close()
+        # stale state written with other clock
+        bucket = OhtApi2.FileTokenBucket(path, 1)
+        self.assertEqual(bucket.reserve(), 0.0)
+        bucket.close()
+
+    def test_endpoint_classes(self):
+        self.assertEqual(OhtApi2.RateLimiter.endpoint_class("get", "project-details"), OhtApi2.RATE_READ)
+        self.assertEqual(OhtApi2.RateLimiter.endpoint_class("post", "new-comment"), OhtApi2.RATE_WRITE)
+        self.assertEqual(OhtApi2.RateLimiter.endpoint_class("delete", "cancel-project"), OhtApi2.RATE_WRITE)
+        self.assertEqual(OhtApi2.RateLimiter.endpoint_class("get", "machine-translate"), OhtApi2.RATE_MT)
+
+    def test_api_paced(self):
+        sleeps = []
+        limiter = OhtApi2.RateLimiter(read=OhtApi2.TokenBucket(1, clock=self.clock),
+                                      mt=OhtApi2.TokenBucket(10, burst=1, clock=self.clock), sleep=sleeps.append)
+        transport = FakeTransport()
+        obj = OhtApi2.OhtApi("a", "b", True, transport=transport, rate_limiter=limiter)
+        for _ in range(3):
+            obj.project_detail(1)
+            obj.post_comment(1, "text")
+        obj.machine_translate("en-us", "fr-fr", "a")
+        obj.machine_detect_lang("a")
+        self.assertEqual(sleeps, [1.0, 2.0, 0.1])
+        self.assertEqual(limiter.stats(), {OhtApi2.RATE_READ: (2, 3.0), OhtApi2.RATE_MT: (1, 0.1)})
+
+
+class MtTransport(FakeTransport):
+    """ Machine translation to upper case """
+    def __init__(self, keep_lines=True):
+        super().__init__()
+        self.keep_lines = keep_lines
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        content = (kwargs.get("data") or kwargs.get("params") or {}).get("source_content", "")
+        if not self.keep_lines:
+            content = content.replace("\n", " ")
+        return FakeResponse(json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [],
+                                        "results": {"TranslatedText": content.upper()}}), url=url)
+
+
+class Test_MachineTranslateMany(unittest.TestCase):
+    def api(self, transport):
+        self.transport = transport
+        obj = OhtApi2.OhtApi("a", "b", True, transport=transport)
+        del transport.calls[:]
+        return obj
+
+    def test_one_request(self):
+        obj = self.api(MtTransport())
+        results = obj.machine_translate_many(["a", "b", "a", "c"], "en-us", "fr-fr")
+        self.assertEqual([(result.key, result.translation) for result in results], [(0, "A"), (1, "B"), (2, "A"), (3, "C")])
+        self.assertEqual(len(self.transport.calls), 1)
+        self.assertEqual(self.transport.calls[0][2]["params"]["source_content"], "a\nb\nc")
+
+    def test_batches_in_order(self):
+        obj = self.api(MtTransport())
+        texts = ["text {0}".format(index) for index in range(100)]
+        results = obj.machine_translate_many([("k{0}".format(index), text) for index, text in enumerate(texts)],
+                                             "en-us", "fr-fr", max_size=100)
+        self.assertEqual([result.key for result in results], ["k{0}".format(index) for index in range(100)])
+        self.assertEqual([result.translation for result in results], [text.upper() for text in texts])
+        self.assertEqual(len(self.transport.calls), len(OhtApi2._mt_batches(texts, 100)))
+        for method, url, kwargs in self.transport.calls:
+            self.assertLessEqual(len(urllib.parse.quote_plus(kwargs["params"]["source_content"])), 100)
+
+    def test_multiline_text_alone(self):
+        obj = self.api(MtTransport())
+        results = obj.machine_translate_many(["a", "b\nc", "d"], "en-us", "fr-fr")
+        self.assertEqual([result.translation for result in results], ["A", "B\nC", "D"])
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_post_body(self):
+        obj = self.api(MtTransport())
+        results = obj.machine_translate_many(["a", "b"], "en-us", "fr-fr", post=True)
+        self.assertEqual([result.translation for result in results], ["A", "B"])
+        method, url, kwargs = self.transport.calls[0]
+        self.assertEqual(method, "post")
+        self.assertEqual(kwargs["data"]["source_content"], "a\nb")
+        self.assertNotIn("source_content", kwargs["params"])
+
+    def test_segments_merged_by_server(self):
+        obj = self.api(MtTransport(keep_lines=False))
+        results = obj.machine_translate_many(["a", "b"], "en-us", "fr-fr")
+        self.assertEqual([result.translation for result in results], ["A", "B"])
+        self.assertEqual(len(self.transport.calls), 3)
+
+    def test_error(self):
+        obj = self.api(FakeTransport('{"status":{"code":102,"msg":"bad"},"results":[],"errors":[]}'))
+        results = obj.machine_translate_many(["a", "b"], "en-us", "fr-fr")
+        self.assertIsNone(results[0].translation)
+        self.assertIsInstance(results[1].error, OhtApi2.OhtError)
+
+
+class Test_MtCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "mt.sqlite")
+        self.clock = FakeClock()
+        self.cache = OhtApi2.MtCache(self.path, ttl=100, clock=self.clock)
+        self.transport = MtTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, mt_cache=self.cache)
+        del self.transport.calls[:]
+
+    def tearDown(self):
+        self.cache.close()
+        self.dir.cleanup()
+
+    def test_memory_hit(self):
+        self.assertEqual(self.obj.machine_translate("en-us", "fr-fr", "a").results.TranslatedText, "A")
+        self.assertEqual(self.obj.machine_translate("en-us", "fr-fr", "a").results.TranslatedText, "A")
+        self.obj.machine_translate("en-us", "de-de", "a")
+        self.obj.machine_detect_lang("a")
+        self.obj.machine_detect_lang("a")
+        self.assertEqual(len(self.transport.calls), 3)
+        self.assertEqual(self.cache.stats(), (2, 0, 3, 3))
+
+    def test_disk_tier(self):
+        self.obj.machine_translate("en-us", "fr-fr", "a")
+        other = OhtApi2.MtCache(self.path, ttl=100, clock=self.clock)
+        self.assertEqual(json.loads(other.get(OhtApi2.MtCache.key("translate", "en-us", "fr-fr", "a")))["results"],
+                         {"TranslatedText": "A"})
+        self.assertEqual(other.stats().disk_hits, 1)
+        self.clock.now += 100
+        self.assertIsNone(other.get(OhtApi2.MtCache.key("detect", "a")))
+        other.close()
+        other = OhtApi2.MtCache(self.path, ttl=100, clock=self.clock)
+        self.assertIsNone(other.get(OhtApi2.MtCache.key("translate", "en-us", "fr-fr", "a")))
+        other.close()
+
+    def test_errors_not_cached(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport('{"status":{"code":102,"msg":"bad"},"results":[],"errors":[]}'),
+                             mt_cache=self.cache)
+        obj.machine_detect_lang("a")
+        self.assertEqual(self.cache.stats().stores, 0)
+
+    def test_size_eviction(self):
+        cache = OhtApi2.MtCache(os.path.join(self.dir.name, "small.sqlite"), maxsize=1, max_bytes=1000, clock=self.clock)
+        for index in range(20):
+            self.clock.now += 1
+            cache.set(str(index), "x" * 100)
+        self.assertIsNone(cache.get("0"))
+        self.assertIsNotNone(cache.get("19"))
+        cache.close()
+
+    def test_translate_many(self):
+        self.obj.machine_translate("en-us", "fr-fr", "a")
+        results = self.obj.machine_translate_many(["a", "b", "c"], "en-us", "fr-fr")
+        self.assertEqual([result.translation for result in results], ["A", "B", "C"])
+        self.assertEqual(self.transport.calls[-1][2]["params"]["source_content"], "b\nc")
+        del self.transport.calls[:]
+        self.assertEqual(self.obj.machine_translate("en-us", "fr-fr", "c").results.TranslatedText, "C")
+        self.obj.machine_translate_many(["b", "c"], "en-us", "fr-fr")
+        self.assertEqual(self.transport.calls, [])
+        self.assertEqual(self.cache.stats().stores, 3)
+        self.assertIsNone(self.cache.get(OhtApi2.MtCache.key("translate", "en-us", "fr-fr", "b\nc")))
+
+    def test_disk_hit_keeps_expiry(self):
+        self.cache.set("a", "x")
+        self.clock.now += 60
+        other = OhtApi2.MtCache(self.path, ttl=100, clock=self.clock)
+        self.assertEqual(other.get("a"), "x")
+        self.clock.now += 40
+        self.assertIsNone(other.get("a"))
+        other.close()
+
+    def test_replace_size(self):
+        cache = OhtApi2.MtCache(os.path.join(self.dir.name, "small.sqlite"), max_bytes=1000, clock=self.clock)
+        cache.set("a", "x" * 100)
+        with unittest.mock.patch.object(OhtApi2.MtCache, "_evict") as evict:
+            for index in range(20):
+                cache.set("b", "x" * 100)
+        evict.assert_not_called()
+        cache.close()
+
+
+class BlockingTransport(FakeTransport):
+    """ GET requests wait for release event """
+    def __init__(self, text=OK_ANSWER, error=None):
+        super().__init__(text)
+        self.error = error
+        self.release = threading.Event()
+
+    def request(self, method, url, **kwargs):
+        if method == "get":
+            self.release.wait(5)
+            if self.error is not None:
+                self.calls.append((method, url, kwargs))
+                raise self.error
+        return super().request(method, url, **kwargs)
+
+
+class Test_SingleFlight(unittest.TestCase):
+    def run_threads(self, obj, call, count=5):
+        results = [None] * count
+
+        def worker(index):
+            try:
+                results[index] = call()
+            except Exception as error:
+                results[index] = error
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500):
+            if obj.single_flight().shared() == count - 1:
+                break
+            time.sleep(0.01)
+        obj.transport().release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_threads_share_request(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=BlockingTransport(PROJECT_DETAIL_ANSWER))
+        del obj.transport().calls[:]
+        results = self.run_threads(obj, lambda: obj.project_detail(807837))
+        self.assertEqual(len(obj.transport().calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        obj.project_detail(807837)
+        obj.project_detail(1)
+        self.assertEqual(len(obj.transport().calls), 3)
+
+    def test_error_shared(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=BlockingTransport(error=requests.exceptions.ConnectionError()),
+                             resilience=OhtApi2.ResiliencePolicy(retries=0))
+        del obj.transport().calls[:]
+        results = self.run_threads(obj, lambda: obj.word_count(["rsc"]))
+        self.assertEqual(len(obj.transport().calls), 1)
+        self.assertTrue(all(isinstance(result, requests.exceptions.ConnectionError) for result in results))
+
+    def test_different_arguments(self):
+        transport = FakeTransport()
+        obj = OhtApi2.OhtApi("a", "b", True, transport=transport)
+        del transport.calls[:]
+        obj.get_resource("rsc-1")
+        obj.get_resource("rsc-1", fetch="base64")
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(obj.single_flight().shared(), 0)
+
+
+def project_answer(project_id, status, translations=()):
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [],
+                       "results": {"project_id": str(project_id), "project_status": status.title(),
+                                   "project_status_code": status,
+                                   "resources": {"sources": ["rsc-src"], "translations": list(translations),
+                                                 "proofs": "", "transcriptions": ""}}})
+
+
+class ProjectsTransport(FakeTransport):
+    """ project_detail answers by project id """
+    def __init__(self):
+        super().__init__()
+        self.projects = {}
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(self.projects.get(url.rsplit("/", 1)[-1], OK_ANSWER), url=url)
+
+
+class Test_ProjectWatcher(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleeps = []
+        self.transport = ProjectsTransport()
+        self.api = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        self.watcher = OhtApi2.ProjectWatcher(self.api, qps=100, clock=self.clock, sleep=self.sleeps.append)
+        for project_id in (1, 2):
+            self.transport.projects[str(project_id)] = project_answer(project_id, "pending")
+        self.watcher.watch(1, 2)
+        del self.transport.calls[:]
+
+    def test_first_poll_reports_all(self):
+        events = self.watcher.poll()
+        self.assertEqual(sorted((event.project_id, event.kind, event.status, event.previous_status) for event in events),
+                         [(1, "status", "pending", None), (2, "status", "pending", None)])
+        self.assertEqual(events[0].new_resources, frozenset(["rsc-src"]))
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_changes_only(self):
+        self.watcher.poll()
+        self.transport.projects["1"] = project_answer(1, "in_progress")
+        self.clock.now += OhtApi2.POLL_INTERVALS["pending"]
+        events = self.watcher.poll()
+        self.assertEqual([(event.project_id, event.kind, event.previous_status) for event in events],
+                         [(1, "status", "pending")])
+        self.transport.projects["1"] = project_answer(1, "in_progress", ["rsc-tr"])
+        self.clock.now += OhtApi2.POLL_INTERVALS["in_progress"]
+        events = self.watcher.poll()
+        self.assertEqual([(event.kind, event.new_resources) for event in events], [("resources", frozenset(["rsc-tr"]))])
+
+    def test_final_status_not_polled(self):
+        self.transport.projects["2"] = project_answer(2, "completed")
+        self.watcher.poll()
+        self.assertEqual(self.watcher.watched(), {1: "pending"})
+        self.clock.now += 10 ** 6
+        self.watcher.poll()
+        self.assertEqual([url for method, url, kwargs in self.transport.calls].count(self.api._url("project-details", 2)), 1)
+
+    def test_adaptive_interval(self):
+        self.assertEqual(self.watcher.interval("signed", 0), 30)
+        self.assertEqual(self.watcher.interval("signed", 3600), 60)
+        self.assertEqual(self.watcher.interval("pending", 10 ** 6), 3600)
+        self.watcher.poll()
+        self.assertEqual(self.watcher.next_poll(), 300)
+        self.clock.now += 3600
+        self.watcher.poll()
+        self.assertEqual(self.watcher.next_poll(), 600)
+
+    def test_qps_budget(self):
+        watcher = OhtApi2.ProjectWatcher(self.api, qps=2, clock=self.clock, sleep=self.sleeps.append)
+        watcher.watch(*range(1, 6))
+        watcher.poll()
+        self.assertEqual(sorted(self.sleeps), [0.5, 1.0, 1.5])
+
+    def test_error_event(self):
+        self.transport.projects["2"] = '{"status":{"code":404,"msg":"not found"},"results":[],"errors":[]}'
+        events = {event.project_id: event for event in self.watcher.poll()}
+        self.assertEqual(events[2].kind, OhtApi2.EVENT_ERROR)
+        self.assertIsInstance(events[2].error, OhtApi2.OhtError)
+        self.assertIn(2, self.watcher.watched())
+
+    def test_events_until_final(self):
+        watcher = OhtApi2.ProjectWatcher(self.api, intervals={"pending": 0})
+        watcher.watch(1)
+        seen = []
+
+        def callback(event):
+            seen.append(event.status)
+            self.transport.projects["1"] = project_answer(1, "completed")
+
+        watcher.run(callback)
+        self.assertEqual(seen, ["pending", "completed"])
+        self.assertEqual(len(watcher), 0)
+
+
+class Test_CallbackServer(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.server = OhtApi2.CallbackServer(path="/oht", handlers={"*": [self.handled.append]})
+        self.url = self.server.serve_in_thread()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_form_payload(self):
+        fields = {"event": "project.status.update", "project_id": "807837", "project_status_code": "signed"}
+        self.assertEqual(send_callback(self.url, fields), 200)
+        event = self.server.events.get(timeout=5)
+        self.assertEqual((event.event, event.project_id), ("project.status.update", "807837"))
+        self.assertEqual(event.payload.project_status_code, "signed")
+        self.assertEqual(type(event.payload).__name__, "oht_response")
+        self.assertEqual(self.handled, [event])
+
+    def test_json_payload(self):
+        self.assertEqual(send_callback(self.url, {"event": "project.resources.new", "project_id": 1,
+                                                  "resources": {"translations": ["rsc-1"]}}, as_json=True), 200)
+        event = self.server.events.get(timeout=5)
+        self.assertEqual(event.payload.resources.translations, ["rsc-1"])
+
+    def test_repeated_delivery(self):
+        fields = {"event": "project.comments.new", "project_id": "1"}
+        for _ in range(3):
+            self.assertEqual(send_callback(self.url, fields), 200)
+        send_callback(self.url, {"event": "project.comments.new", "project_id": "2"})
+        self.assertEqual(self.server.events.qsize(), 2)
+        self.assertEqual(self.server.stats(), (2, 2, 0, 0))
+
+    def test_invalid_requests(self):
+        self.assertEqual(send_callback(self.url.replace("/oht", "/other"), {"event": "a"}), 404)
+        self.assertEqual(send_callback(self.url, {"a": 1, "b": [2]}, as_json=True), 200)
+        self.assertEqual(send_callback(self.url, [1, 2], as_json=True), 400)
+        self.assertEqual(self.server.stats().invalid, 2)
+
+    def test_handler_error(self):
+        def fail(event):
+            raise RuntimeError()
+        self.server.add_handler("project.status.update", fail)
+        self.assertEqual(send_callback(self.url, {"event": "project.status.update", "project_id": "1"}), 200)
+        self.assertEqual(self.server.stats().handler_errors, 1)
+        self.assertEqual(self.server.events.qsize(), 1)
+
+    def test_asyncio_queue(self):
+        async def receive():
+            server = OhtApi2.CallbackServer(events=asyncio.Queue())
+            url = await server.start()
+            try:
+                status = await asyncio.get_running_loop().run_in_executor(
+                    None, send_callback, url, {"event": "project.status.update", "project_id": "5"})
+                return status, await asyncio.wait_for(server.events.get(), 5)
+            finally:
+                await server.stop()
+
+        status, event = asyncio.run(receive())
+        self.assertEqual((status, event.project_id), (200, "5"))
+
+
+class QuoteTransport(FakeTransport):
+    """ word count 100, price depends on target language and service """
+    PRICES = {"fr-fr": 10, "de-de": 20}
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        params = kwargs.get("params") or {}
+        if url.endswith("/tools/wordcount"):
+            results = {"resources": [], "total": {"wordcount": 100}}
+        elif params.get("target_language") in self.PRICES:
+            price = self.PRICES[params["target_language"]] * (2 if params.get("service") == "transproof" else 1)
+            results = {"resources": [], "currency": "USD",
+                       "total": {"wordcount": params["wordcount"], "credits": str(price), "net_price": price,
+                                 "transaction_fee": 0, "price": price}}
+        else:
+            return FakeResponse('{"status":{"code":102,"msg":"bad language"},"results":[],"errors":[]}', url=url)
+        return FakeResponse(json.dumps({"status": {"code": 0, "msg": "ok"}, "results": results, "errors": []}), url=url)
+
+
+class Test_QuotePlanner(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.transport = QuoteTransport()
+        self.api = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        self.planner = OhtApi2.QuotePlanner(self.api, ttl=60, clock=self.clock)
+        del self.transport.calls[:]
+
+    def quotes(self):
+        return [kwargs["params"] for method, url, kwargs in self.transport.calls if url.endswith("/tools/quote")]
+
+    def test_matrix(self):
+        table = self.planner.plan(["rsc-1", "rsc-2"], "en-us", ["fr-fr", "de-de"], services=["translation", "transproof"])
+        self.assertEqual(table.target_lang, ["fr-fr", "fr-fr", "de-de", "de-de"])
+        self.assertEqual(table.service, ["translation", "transproof"] * 2)
+        self.assertEqual(table.price, [10.0, 20.0, 20.0, 40.0])
+        self.assertEqual(table.wordcount, [100] * 4)
+        self.assertEqual(table.currency, ["USD"] * 4)
+        self.assertEqual(len(self.transport.calls), 5)
+        self.assertEqual({params["wordcount"] for params in self.quotes()}, {100})
+        self.assertEqual(OhtApi2.QuotePlanner.cheapest(table), 0)
+        self.assertEqual(OhtApi2.QuotePlanner.cheapest(table, "de-de"), 2)
+
+    def test_cached(self):
+        self.planner.plan(["rsc-1"], "en-us", ["fr-fr"])
+        self.planner.plan(["rsc-1"], "en-us", ["fr-fr", "de-de"])
+        self.assertEqual(len(self.quotes()), 2)
+        self.assertEqual(len(self.transport.calls), 3)
+        self.clock.now += 60
+        self.planner.plan(["rsc-1"], "en-us", ["fr-fr"])
+        self.assertEqual(len(self.transport.calls), 5)
+
+    def test_error_cell(self):
+        table = self.planner.plan(["rsc-1"], "en-us", ["fr-fr", "xx-xx"])
+        self.assertEqual(table.price, [10.0, None])
+        self.assertIsNone(table.error[0])
+        self.assertIsInstance(table.error[1], OhtApi2.OhtError)
+        self.planner.plan(["rsc-1"], "en-us", ["xx-xx"])
+        self.assertEqual(len(self.quotes()), 3)
+
+
+class OrderTransport(QuoteTransport):
+    """ QuoteTransport with uploads, account details and project creation """
+    def __init__(self, credits="100.0"):
+        super().__init__()
+        self.credits = credits
+        self.lock = threading.Lock()
+
+    def answer(self, results):
+        return FakeResponse(json.dumps({"status": {"code": 0, "msg": "ok"}, "results": results, "errors": []}))
+
+    def request(self, method, url, **kwargs):
+        if url.endswith("/resources/file"):
+            with self.lock:
+                self.calls.append((method, url, kwargs))
+                return self.answer(["rsc-{0}".format(len(self.calls))])
+        if url.endswith("/account/"):
+            self.calls.append((method, url, kwargs))
+            return self.answer({"account_id": 1, "account_username": "a", "credits": self.credits})
+        if url.endswith("/projects/translation"):
+            self.calls.append((method, url, kwargs))
+            return self.answer({"project_id": "p-" + kwargs["params"]["target_language"]})
+        return super().request(method, url, **kwargs)
+
+
+class Test_OrderTranslations(unittest.TestCase):
+    def api(self, credits="100.0"):
+        self.transport = OrderTransport(credits)
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        del self.transport.calls[:]
+        return obj
+
+    def created(self):
+        return sorted(kwargs["params"]["target_language"] for method, url, kwargs in self.transport.calls
+                      if url.endswith("/projects/translation"))
+
+    def test_order(self):
+        obj = self.api()
+        report = obj.order_translations([b"one", b"two"], "en-us", ["fr-fr", "de-de", "xx-xx"], resources=["rsc-0"])
+        self.assertEqual([item.target_lang for item in report], ["fr-fr", "de-de", "xx-xx"])
+        self.assertEqual([item.project_id for item in report], ["p-fr-fr", "p-de-de", None])
+        self.assertEqual([item.credits for item in report], [10.0, 20.0, None])
+        self.assertIsInstance(report[2].error, OhtApi2.OhtError)
+        self.assertEqual(len(report[0].resources), 3)
+        self.assertEqual(self.created(), ["de-de", "fr-fr"])
+        uploads = [url for method, url, kwargs in self.transport.calls if url.endswith("/resources/file")]
+        self.assertEqual(len(uploads), 2)
+
+    def test_budget(self):
+        obj = self.api("25")
+        with self.assertRaises(OhtApi2.BudgetError) as context:
+            obj.order_translations([], "en-us", ["fr-fr", "de-de"], resources=["rsc-0"])
+        self.assertEqual((context.exception.required, context.exception.available), (30.0, 25.0))
+        self.assertRaises(OhtApi2.BudgetError, obj.order_translations, [], "en-us", ["fr-fr", "de-de"],
+                          resources=["rsc-0"], budget=20)
+        self.assertEqual(self.created(), [])
+
+    @unittest.skipIf(OhtApi2.aiohttp is None, "aiohttp is not installed")
+    def test_async_order(self):
+        server = OhtStubServer()
+        server.start()
+        obj = stub_api(server, OhtApi2.AsyncOhtApi)
+
+        async def order():
+            try:
+                with self.assertRaises(OhtApi2.BudgetError):
+                    await obj.order_translations([], "en-us", ["fr-fr"], resources=["rsc-0"], budget=1)
+                return await obj.order_translations([b"one"], "en-us", ["fr-fr", "de-de"], resources=["rsc-0"])
+            finally:
+                await obj.aclose()
+        try:
+            report = asyncio.run(order())
+        finally:
+            server.stop()
+        self.assertEqual([item.target_lang for item in report], ["fr-fr", "de-de"])
+        self.assertEqual([item.credits for item in report], [14.0, 14.0])
+        self.assertTrue(all(item.project_id and item.error is None for item in report))
+        self.assertEqual(len(report[0].resources), 2)
+        posts = [path for method, path, query, payload, headers in server.requests if method == "post"]
+        self.assertEqual(sorted(posts), ["/api/2/projects/translation"] * 2 + ["/api/2/resources/file"])
+
+
+class Test_SubmissionJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.journal = OhtApi2.SubmissionJournal(os.path.join(self.dir.name, "journal.sqlite"))
+        self.transport = OrderTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, journal=self.journal)
+        del self.transport.calls[:]
+
+    def tearDown(self):
+        self.journal.close()
+        self.dir.cleanup()
+
+    def test_replay(self):
+        first = self.obj.create_translation_project("en-us", "fr-fr", ["rsc-1"], name="job")
+        second = self.obj.create_translation_project("en-us", "fr-fr", ["rsc-1"], name="job")
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.transport.calls), 1)
+        self.obj.create_translation_project("en-us", "de-de", ["rsc-1"], name="job")
+        self.assertEqual(len(self.transport.calls), 2)
+        entry = self.journal.entries(OhtApi2.SUBMISSION_DONE)[0]
+        self.assertEqual((entry.endpoint, entry.project_id), ("new-translation-project", "p-fr-fr"))
+        self.assertNotIn("secret_key", json.loads(entry.params))
+
+    def test_shared_between_instances(self):
+        self.obj.create_translation_project("en-us", "fr-fr", ["rsc-1"])
+        journal = OhtApi2.SubmissionJournal(self.journal.path)
+        other = OhtApi2.OhtApi("a", "c", True, transport=self.transport, journal=journal)
+        self.assertEqual(other.create_translation_project("en-us", "fr-fr", ["rsc-1"]).results.project_id, "p-fr-fr")
+        self.assertEqual(len([call for call in self.transport.calls if call[0] == "post"]), 1)
+        journal.close()
+
+    def test_unknown_outcome(self):
+        class Transport(FakeTransport):
+            def request(self, method, url, **kwargs):
+                if method == "post":
+                    raise requests.exceptions.ReadTimeout()
+                return super().request(method, url, **kwargs)
+
+        obj = OhtApi2.OhtApi("a", "b", True, transport=Transport(), journal=self.journal)
+        self.assertRaises(requests.exceptions.ReadTimeout, obj.create_transcription_project, "en-us", ["rsc-1"])
+        with self.assertRaises(OhtApi2.PendingSubmissionError) as context:
+            self.obj.create_transcription_project("en-us", ["rsc-1"])
+        self.assertEqual(self.transport.calls, [])
+        self.journal.resolve(context.exception.entry.fingerprint, "123")
+        answer = self.obj.create_transcription_project("en-us", ["rsc-1"])
+        self.assertEqual((answer.status.code, answer.results.project_id), (0, "123"))
+
+    def test_not_sent_forgotten(self):
+        class Transport(OrderTransport):
+            def request(self, method, url, **kwargs):
+                if method == "post" and self.failures:
+                    self.failures -= 1
+                    raise requests.exceptions.ConnectTimeout()
+                return super().request(method, url, **kwargs)
+
+        transport = Transport()
+        transport.failures = 1
+        policy = OhtApi2.ResiliencePolicy(retries=0, failure_threshold=1, reset_timeout=30)
+        obj = OhtApi2.OhtApi("a", "b", True, transport=transport, resilience=policy, journal=self.journal)
+        self.assertRaises(requests.exceptions.ConnectTimeout, obj.create_translation_project, "en-us", "fr-fr", ["rsc-1"])
+        self.assertEqual(policy.stats().state, OhtApi2.BREAKER_OPEN)
+        self.assertRaises(OhtApi2.CircuitOpenError, obj.create_translation_project, "en-us", "fr-fr", ["rsc-1"])
+        self.assertEqual(self.journal.entries(), [])
+        policy.reset()
+        answer = obj.create_translation_project("en-us", "fr-fr", ["rsc-1"])
+        self.assertEqual(answer.results.project_id, "p-fr-fr")
+        self.assertEqual(self.journal.entries()[0].state, OhtApi2.SUBMISSION_DONE)
+
+    def test_connection_refused_forgotten(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        obj = OhtApi2.OhtApi("a", "b", True, url_check=OhtApi2.URL_CHECK_LAZY, journal=self.journal,
+                             resilience=OhtApi2.ResiliencePolicy(retries=0, failure_threshold=None))
+        obj.set_sandbox_url("http://127.0.0.1:{0}/api/2".format(port))
+        self.assertRaises(requests.exceptions.ConnectionError, obj.create_transcription_project, "en-us", ["rsc-1"])
+        obj.set_sandbox_url("http://127.0.0.1:{0}/api/3".format(port))
+        with unittest.mock.patch.object(OhtApi2, "_check_url"):
+            self.assertRaises(requests.exceptions.ConnectionError, obj.create_transcription_project, "en-us", ["rsc-1"])
+        self.assertEqual(self.journal.entries(), [])
+        obj.close()
+
+    def test_rejected_forgotten(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport('{"status":{"code":102,"msg":"bad"},"results":[],"errors":[]}'),
+                             journal=self.journal)
+        obj.create_proof_reading_project("en-us", ["rsc-1"])
+        self.assertEqual(self.journal.entries(), [])
+        self.obj.create_proof_reading_project("en-us", ["rsc-1"])
+        self.assertEqual(len(self.transport.calls), 1)
+
+
+def comments_answer(*ids):
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [],
+                       "results": [{"id": str(index), "date": "2015-10-01 10:00:00", "commenter_name": "name",
+                                    "commenter_role": "provider", "comment_content": "text {0}".format(index)}
+                                   for index in ids]})
+
+
+class CommentsTransport(FakeTransport):
+    """ project_comments answers by project id """
+    def __init__(self):
+        super().__init__()
+        self.projects = {}
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(self.projects.get(url.split("/")[-2], OK_ANSWER), url=url)
+
+
+class Test_CommentSync(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "comments.jsonl")
+        self.store = OhtApi2.CommentStore(self.path)
+        self.transport = CommentsTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        self.transport.projects = {"1": comments_answer(1, 2), "2": comments_answer(3)}
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def new_ids(self, synced):
+        return [[comment.id for comment in item.comments] for item in synced]
+
+    def test_only_new(self):
+        self.assertEqual(self.new_ids(self.obj.sync_comments(self.store, [1, 2])), [["1", "2"], ["3"]])
+        self.assertEqual(self.new_ids(self.obj.sync_comments(self.store, [1, 2])), [[], []])
+        self.transport.projects["1"] = comments_answer(1, 2, 4)
+        synced = self.obj.sync_comments(self.store, [1, 2])
+        self.assertEqual(self.new_ids(synced), [["4"], []])
+        self.assertEqual(synced[0].comments[0].comment_content, "text 4")
+        self.assertEqual([comment.id for comment in self.store.comments(1)], ["1", "2", "4"])
+        self.assertEqual(len(self.store), 4)
+
+    def test_unchanged_answer_not_parsed(self):
+        self.obj.sync_comments(self.store, [1])
+        with unittest.mock.patch.object(OhtApi2, "_json_loads", side_effect=AssertionError):
+            self.assertEqual(self.obj.sync_comments(self.store, [1])[0], (1, [], None))
+
+    def test_cold_start(self):
+        self.obj.sync_comments(self.store, [1, 2])
+        store = OhtApi2.CommentStore(self.path)
+        self.assertEqual(sorted(store.projects()), ["1", "2"])
+        self.assertEqual(store.comments(2)[0].comment_content, "text 3")
+        self.assertEqual(self.new_ids(self.obj.sync_comments(store, [1, 2])), [[], []])
+        with open(self.path) as file:
+            self.assertEqual(len(file.readlines()), 3)
+
+    def test_error(self):
+        self.transport.projects["2"] = '{"status":{"code":404,"msg":"not found"},"results":[],"errors":[]}'
+        synced = self.obj.sync_comments(self.store, [1, 2])
+        self.assertIsNone(synced[0].error)
+        self.assertIsInstance(synced[1].error, OhtApi2.OhtError)
+
+
+@unittest.skipIf(OhtApi2.aiohttp is None, "aiohttp is not installed")
+class RecordingHooks(OhtApi2.RequestHooks):
+    def __init__(self):
+        self.before = []
+        self.after = []
+
+    def before_request(self, trace):
+        self.before.append((trace.endpoint, trace.http_status))
+
+    def after_request(self, trace):
+        self.after.append(trace)
+
+
+class Test_RequestHooks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer()
+        cls.server.routes["/projects/807837"] = PROJECT_DETAIL_ANSWER
+        cls.server.routes["/resources/rsc/download"] = "content"
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.hooks = RecordingHooks()
+        self.exporter = OhtApi2.HistogramExporter()
+        self.obj = stub_api(self.server, hooks=[self.hooks, self.exporter])
+
+    def tearDown(self):
+        self.obj.close()
+
+    def test_no_hooks(self):
+        obj = stub_api(self.server)
+        self.assertEqual(obj.hooks(), ())
+        self.assertIsNone(obj._trace("get", "project-details"))
+        self.assertEqual(obj.project_detail(807837).status.code, 0)
+
+    def test_decoded_call(self):
+        self.obj.project_detail(807837)
+        self.assertEqual(self.hooks.before, [("project-details", None)])
+        trace, = self.hooks.after
+        self.assertEqual((trace.method, trace.endpoint, trace.http_status, trace.oht_code, trace.attempts),
+                         ("get", "project-details", 200, 0, 1))
+        self.assertTrue(trace.url.endswith("/projects/807837"))
+        self.assertEqual(trace.bytes_received, len(PROJECT_DETAIL_ANSWER))
+        for name in ("ttfb", "download", "seconds", "decode", "total"):
+            self.assertGreaterEqual(getattr(trace, name), 0, name)
+        self.assertGreaterEqual(trace.total, trace.seconds + trace.decode)
+        self.assertIsNone(trace.error)
+        self.assertEqual(len(trace.span.trace_id), 32)
+        self.assertIsNone(trace.span.parent_id)
+
+    def test_single_hook(self):
+        obj = stub_api(self.server, hooks=self.exporter)
+        self.assertEqual(obj.hooks(), (self.exporter,))
+        obj.project_detail(807837)
+        self.assertEqual(self.exporter.statuses(), {("project-details", 200, 0): 1})
+
+    def test_cached_and_memo_calls(self):
+        obj = stub_api(self.server, hooks=self.hooks, discovery_cache=OhtApi2.TTLCache(), mt_cache=OhtApi2.MtCache())
+        obj.supported_languages()
+        obj.supported_languages()
+        obj.machine_detect_lang("text")
+        obj.sync_comments(OhtApi2.CommentStore(), [1])
+        self.assertEqual([(trace.endpoint, trace.http_status, trace.oht_code) for trace in self.hooks.after],
+                         [("discover-langs", 200, 0), ("machine-detect-lang", 200, 0), ("project-comments", 200, 0)])
+        self.assertTrue(all(trace.decode is not None for trace in self.hooks.after))
+        obj.close()
+
+    def test_raw_call(self):
+        self.assertEqual(self.obj.download_resource("rsc"), "content")
+        trace, = self.hooks.after
+        self.assertEqual((trace.endpoint, trace.http_status, trace.oht_code, trace.decode),
+                         ("download-resource", 200, None, None))
+
+    def test_span_context(self):
+        with OhtApi2.use_span() as parent:
+            self.assertIs(OhtApi2.current_span(), parent)
+            self.obj.project_detail(807837)
+        self.assertIsNone(OhtApi2.current_span())
+        span = self.hooks.after[0].span
+        self.assertEqual((span.trace_id, span.parent_id), (parent.trace_id, parent.span_id))
+        self.assertEqual(OhtApi2.traceparent(span), "00-{0}-{1}-01".format(span.trace_id, span.span_id))
+
+    def test_failed_request(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=ScriptedTransport(),
+                             resilience=OhtApi2.ResiliencePolicy(retries=1, backoff=0, jitter=0),
+                             hooks=[self.hooks, self.exporter])
+        obj.transport().script = [503, requests.exceptions.ConnectionError("down")]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            obj.word_count(["rsc"])
+        trace, = self.hooks.after
+        self.assertEqual((trace.attempts, trace.http_status, trace.oht_code), (2, None, None))
+        self.assertIsInstance(trace.error, requests.exceptions.ConnectionError)
+        self.assertEqual(self.exporter.statuses(), {("word-count", None, None): 1})
+
+    def test_add_remove_hook(self):
+        self.obj.remove_hook(self.hooks)
+        self.obj.project_detail(807837)
+        self.assertEqual(self.hooks.after, [])
+        self.obj.add_hook(self.hooks)
+        self.obj.project_detail(807837)
+        self.assertEqual(len(self.hooks.after), 1)
+        self.assertEqual(self.obj.hooks(), (self.exporter, self.hooks))
+
+    def test_exporter(self):
+        for index in range(3):
+            self.obj.project_detail(807837)
+        snapshot = self.exporter.snapshot()
+        self.assertEqual(snapshot[("project-details", "decode")].count, 3)
+        self.assertEqual(snapshot[("project-details", "total")].buckets[-1], (float("inf"), 3))
+        self.assertNotIn(("project-details", "dns"), snapshot)
+        self.assertEqual(self.exporter.statuses(), {("project-details", 200, 0): 3})
+        self.exporter.reset()
+        self.assertEqual(self.exporter.snapshot(), {})
+
+    def test_exporter_percentile(self):
+        exporter = OhtApi2.HistogramExporter(buckets=(0.1, 0.2, 0.4), timings=("seconds",))
+        for seconds in (0.05, 0.15, 0.15, 0.3, 1.0):
+            trace = OhtApi2.RequestTrace("get", "quote")
+            trace.seconds = seconds
+            exporter.after_request(trace)
+        histogram = exporter.snapshot()[("quote", "seconds")]
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 1.65)
+        self.assertEqual(histogram.buckets, ((0.1, 1), (0.2, 3), (0.4, 4), (float("inf"), 5)))
+        self.assertAlmostEqual(exporter.percentile("quote", "seconds", 0.5), 0.175)
+        self.assertEqual(exporter.percentile("quote", "seconds", 0.99), 0.4)
+        self.assertIsNone(exporter.percentile("quote", "decode", 0.5))
+
+
+class Test_AsyncApi(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer('{"status":{"code":0,"msg":"ok"},"results":{"project_id":"1"},"errors":[]}')
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        del self.server.requests[:]
+        self.obj = OhtApi2.AsyncOhtApi("a", "b", True, transport=FakeTransport(), max_concurrency=5)
+        self.obj.set_sandbox_url(self.server.url())
+
+    def run_async(self, coroutine):
+        async def wrapper():
+            try:
+                return await coroutine
+            finally:
+                await self.obj.aclose()
+        return asyncio.run(wrapper())
+
+    def test_same_result(self):
+        answer = self.run_async(self.obj.project_detail(1))
+        self.assertEqual(answer.status.code, 0)
+        self.assertEqual(answer.results.project_id, "1")
+        self.assertEqual(self.server.requests[0][:2], ("get", "/api/2/projects/1"))
+
+    def test_many_in_flight(self):
+        async def many():
+            return await asyncio.gather(*[self.obj.quote(["rsc"], "en-us", "fr-fr", wordcount=i) for i in range(20)])
+        answers = self.run_async(many())
+        self.assertEqual(len(answers), 20)
+        self.assertEqual(sorted(int(req[2]["wordcount"][0]) for req in self.server.requests), list(range(20)))
+
+    def test_machine_translate_many(self):
+        self.server.routes["/mt/translate/text"] = '{"status":{"code":0,"msg":"ok"},"results":{"TranslatedText":"A\\nB"},"errors":[]}'
+        try:
+            results = self.run_async(self.obj.machine_translate_many(["a", "b", "a"], "en-us", "fr-fr"))
+        finally:
+            del self.server.routes["/mt/translate/text"]
+        self.assertEqual([result.translation for result in results], ["A", "B", "A"])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_single_flight(self):
+        async def many():
+            return await asyncio.gather(*[self.obj.project_detail(1) for _ in range(10)])
+        answers = self.run_async(many())
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual({answer.results.project_id for answer in answers}, {"1"})
+        self.assertEqual(self.obj.single_flight().shared(), 9)
+
+    def test_download(self):
+        answer = self.run_async(self.obj.download_resource("rsc"))
+        self.assertEqual(answer, self.server.body)
+        self.assertEqual(self.server.requests[0][1], "/api/2/resources/rsc/download")
+
+    def test_download_to_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "resource.json")
+            with open(path + OhtApi2.PARTIAL_SUFFIX, "w") as file:
+                file.write(self.server.body[:10])
+            self.assertEqual(self.run_async(self.obj.download_resource("rsc", path, resume=True)), path)
+            with open(path) as file:
+                self.assertEqual(file.read(), self.server.body)
+
+    def test_download_resilience(self):
+        hooks = RecordingHooks()
+        policy = OhtApi2.ResiliencePolicy(retries=0, failure_threshold=2)
+        self.obj = stub_api(self.server, OhtApi2.AsyncOhtApi, resilience=policy, hooks=[hooks])
+        self.server.routes["/resources/bad/download"] = (503, "down")
+
+        async def calls():
+            self.assertEqual(await self.obj.download_resource("bad"), "down")
+            with self.assertRaises(OhtApi2.aiohttp.ClientResponseError):
+                async for _ in self.obj.iter_resource("bad"):
+                    pass
+            with self.assertRaises(OhtApi2.CircuitOpenError):
+                await self.obj.download_resource("rsc")
+        try:
+            self.run_async(calls())
+        finally:
+            del self.server.routes["/resources/bad/download"]
+        self.assertEqual(policy.stats().state, OhtApi2.BREAKER_OPEN)
+        self.assertEqual([(trace.http_status, type(trace.error)) for trace in hooks.after],
+                         [(503, type(None)), (503, OhtApi2.aiohttp.ClientResponseError), (None, OhtApi2.CircuitOpenError)])
+
+    def test_open_resource(self):
+        async def read():
+            async with await self.obj.open_resource("rsc", offset=2) as file:
+                return [await file.read(3), await file.read(), await file.read()]
+        first, rest, end = self.run_async(read())
+        self.assertEqual((first + rest, end), (self.server.body[2:].encode("utf-8"), b""))
+
+    def test_open_resource_error(self):
+        self.server.routes["/resources/bad/download"] = (404, "missing")
+        try:
+            with self.assertRaises(OhtApi2.aiohttp.ClientResponseError):
+                self.run_async(self.obj.open_resource("bad"))
+        finally:
+            del self.server.routes["/resources/bad/download"]
+
+    def test_download_read_timeout(self):
+        policy = OhtApi2.ResiliencePolicy(retries=0, timeouts={"download-resource": (1, 0.1)})
+        self.obj = stub_api(self.server, OhtApi2.AsyncOhtApi, resilience=policy)
+        self.server.latency = 0.5
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                self.run_async(self.obj.download_resource("rsc"))
+        finally:
+            self.server.latency = 0.0
+        self.assertEqual(policy.stats().failures, 1)
+
+    def test_streaming_upload(self):
+        self.run_async(self.obj.create_file_resource(io.BytesIO(b"x" * 100000), file_name="a.txt"))
+        method, path, query, payload, headers = self.server.requests[0]
+        self.assertEqual(int(headers["Content-Length"]), len(payload))
+        self.assertIn(b"x" * 100000, payload)
+
+    def test_upload_many(self):
+        async def upload():
+            return [result async for result in self.obj.upload_many([b"a", b"b", b"c"], max_workers=2)]
+        results = self.run_async(upload())
+        self.assertEqual(sorted(result.index for result in results), [0, 1, 2])
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_hooks(self):
+        hooks = RecordingHooks()
+        transport = OhtApi2.AsyncOhtTransport(trace=True)
+        self.obj = OhtApi2.AsyncOhtApi("a", "b", True, transport=FakeTransport(), async_transport=transport,
+                                       hooks=[hooks])
+        self.obj.set_sandbox_url(self.server.url())
+
+        async def calls():
+            await self.obj.project_detail(1)
+            await self.obj.project_detail(1)
+            await transport.close()
+        self.run_async(calls())
+        first, second = hooks.after
+        self.assertEqual((first.endpoint, first.http_status, first.oht_code), ("project-details", 200, 0))
+        self.assertGreaterEqual(first.connect, 0)
+        self.assertIsNone(second.connect)
+        for name in ("ttfb", "download", "decode", "total"):
+            self.assertGreaterEqual(getattr(second, name), 0, name)
+
+    def test_methods_are_coroutines(self):
+        coroutine = self.obj.cancel_project(1)
+        self.assertTrue(asyncio.iscoroutine(coroutine))
+        self.run_async(coroutine)
+        self.assertEqual(self.server.requests[0][0], "delete")
+
+
+class Test_ResponseTypeCache(unittest.TestCase):
+    def setUp(self):
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport())
+
+    def test_same_type_for_same_fields(self):
+        first = self.obj.json_to_ntuple(PROJECT_DETAIL_ANSWER)
+        second = self.obj.json_to_ntuple(PROJECT_DETAIL_ANSWER)
+        self.assertIs(type(first), type(second))
+        self.assertIs(type(first.status), type(second.status))
+        self.assertEqual(type(first.results).__name__, "oht_response")
+
+    def test_answer_shape(self):
+        res = self.obj.json_to_ntuple(PROJECT_DETAIL_ANSWER)
+        self.assertEqual(res.results.resources.sources[1], "rsc-560a6a5524b4a2-38348001")
+        self.assertEqual(res.results.resource_binding["rsc-560a693ccfbbc2-86754957"], ["rsc-560abb5ab099b0-90175867"])
+        self.assertEqual(res.results._fields[:2], ("project_id", "project_type"))
+        self.assertEqual(res.errors, [])
+
+    def test_mixed_keys_keep_only_non_identifiers(self):
+        res = self.obj.json_to_ntuple('{"a-b": 1, "c": 2}')
+        self.assertEqual(res, {"a-b": 1})
+
+    def test_cache_is_bounded(self):
+        for index in range(OhtApi2.RESPONSE_TYPE_CACHE_SIZE + 10):
+            self.obj.json_to_ntuple('{"field%d": 1}' % index)
+        self.assertEqual(OhtApi2._response_type.cache_info().currsize, OhtApi2.RESPONSE_TYPE_CACHE_SIZE)
+
+
+class Test_LazyResponse(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport(PROJECT_DETAIL_ANSWER)
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, response_mode=OhtApi2.RESPONSE_LAZY)
+
+    def test_attribute_access(self):
+        res = self.obj.project_detail(807837)
+        self.assertIsInstance(res, OhtApi2.LazyResponse)
+        self.assertEqual(res.status.code, 0)
+        self.assertEqual(res.results.resources.translations[1], "rsc-560abb5ab4ab73-60700513")
+        self.assertEqual(res.results.resource_binding["rsc-560a693ccfbbc2-86754957"], ["rsc-560abb5ab099b0-90175867"])
+        self.assertFalse(res.errors)
+        with self.assertRaises(AttributeError):
+            res.results.no_such_field
+
+    def test_per_call_mode(self):
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport)
+        self.assertEqual(type(obj.project_detail(1)).__name__, "oht_response")
+        lazy = obj.with_response_mode(OhtApi2.RESPONSE_LAZY)
+        self.assertIsInstance(lazy.project_detail(1), OhtApi2.LazyResponse)
+        self.assertEqual(obj.response_mode(), OhtApi2.RESPONSE_NTUPLE)
+        self.assertIs(lazy.transport(), obj.transport())
+
+    def test_same_values_as_ntuple(self):
+        ntuple = self.obj.json_to_ntuple(PROJECT_DETAIL_ANSWER)
+        view = self.obj.json_to_view(PROJECT_DETAIL_ANSWER)
+        self.assertEqual(view.results._fields, ntuple.results._fields)
+        self.assertEqual(list(view.results.resources.sources), ntuple.results.resources.sources)
+
+    def test_invalid_json(self):
+        with self.assertRaises(ValueError):
+            self.obj.json_to_view('{sdfsdf:{"sd":8}')
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.obj.with_response_mode("dict")
+
+
+class Test_StreamingDownload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer(bytes(range(256)) * 4096)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server)
+        del self.server.requests[:]
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "resource.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self.obj.close()
+
+    def read(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+    def test_download_to_file(self):
+        self.assertEqual(self.obj.download_resource("rsc", self.path, chunk_size=1000), self.path)
+        self.assertEqual(self.read(self.path), self.server.body)
+        self.assertFalse(os.path.exists(self.path + OhtApi2.PARTIAL_SUFFIX))
+
+    def test_resume(self):
+        with open(self.path + OhtApi2.PARTIAL_SUFFIX, "wb") as file:
+            file.write(self.server.body[:1000])
+        self.obj.download_resource("rsc", self.path, resume=True)
+        self.assertEqual(self.server.requests[0][4]["Range"], "bytes=1000-")
+        self.assertEqual(self.read(self.path), self.server.body)
+
+    def test_resume_complete_part(self):
+        with open(self.path + OhtApi2.PARTIAL_SUFFIX, "wb") as file:
+            file.write(self.server.body)
+        self.obj.download_resource("rsc", self.path, resume=True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.read(self.path), self.server.body)
+
+    def test_failed_download_keep_target(self):
+        self.server.status = 404
+        try:
+            self.assertEqual(self.obj.download_resource("rsc", self.path), "")
+        finally:
+            self.server.status = 200
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_iter_resource(self):
+        chunks = list(self.obj.iter_resource("rsc", chunk_size=4096, offset=10))
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), self.server.body[10:])
+
+    def test_open_resource(self):
+        with self.obj.open_resource("rsc") as file:
+            self.assertEqual(file.read(), self.server.body)
+
+
+class Test_StreamingUpload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer('{"status":{"code":0,"msg":"ok"},"results":["rsc-1"],"errors":[]}')
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server)
+        del self.server.requests[:]
+
+    def tearDown(self):
+        self.obj.close()
+
+    def uploaded_parts(self):
+        method, path, query, payload, headers = self.server.requests[-1]
+        message = BytesParser().parsebytes(b"Content-Type: " + headers["Content-Type"].encode() + b"\r\n\r\n" + payload)
+        return {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+
+    def test_upload_path_closes_file(self):
+        content = os.urandom(3 * OhtApi2.UPLOAD_CHUNK_SIZE + 17)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "source.txt")
+            with open(path, "wb") as file:
+                file.write(content)
+            opened = []
+            real_open = open
+
+            def tracking_open(*args, **kwargs):
+                opened.append(real_open(*args, **kwargs))
+                return opened[-1]
+
+            with unittest.mock.patch("builtins.open", tracking_open):
+                answer = self.obj.create_file_resource(path)
+        self.assertEqual(answer.results, ["rsc-1"])
+        self.assertTrue(opened and all(file.closed for file in opened))
+        part = self.uploaded_parts()["file"]
+        self.assertEqual(part.get_filename(), "source.txt")
+        self.assertEqual(part.get_payload(decode=True), content)
+        self.assertEqual(int(self.server.requests[-1][4]["Content-Length"]), len(self.server.requests[-1][3]))
+
+    def test_upload_file_object_left_open(self):
+        file = io.BytesIO(b"The sun is shining brightly")
+        self.obj.create_file_resource(file, file_name="sun.txt", file_mime="text/plain")
+        self.assertFalse(file.closed)
+        part = self.uploaded_parts()["file"]
+        self.assertEqual(part.get_filename(), "sun.txt")
+        self.assertEqual(part.get_content_type(), "text/plain")
+        self.assertEqual(part.get_payload(decode=True), b"The sun is shining brightly")
+
+    def test_upload_bytes_like(self):
+        for source in (b"bytes content", bytearray(b"bytes content"), memoryview(b"bytes content")):
+            self.obj.create_file_resource(source, file_name="a.txt")
+            self.assertEqual(self.uploaded_parts()["file"].get_payload(decode=True), b"bytes content")
+
+    def test_file_content_in_body(self):
+        self.obj.create_file_resource(file_name="a.txt", file_content="x" * 10000)
+        method, path, query, payload, headers = self.server.requests[-1]
+        self.assertNotIn("file_content", query)
+        self.assertEqual(urllib.parse.parse_qs(payload.decode())["file_content"], ["x" * 10000])
+
+    def test_unknown_size_is_chunked(self):
+        class Stream:
+            def __init__(self):
+                self.data = io.BytesIO(b"streamed")
+
+            def read(self, size=-1):
+                return self.data.read(size)
+
+        self.obj.create_file_resource(Stream(), file_name="a.txt")
+        self.assertEqual(self.server.requests[-1][4]["Transfer-Encoding"], "chunked")
+        self.assertEqual(self.uploaded_parts()["file"].get_payload(decode=True), b"streamed")
+
+
+class Test_UploadMany(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer('{"status":{"code":0,"msg":"ok"},"results":["rsc-1"],"errors":[]}')
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server)
+        del self.server.requests[:]
+
+    def tearDown(self):
+        self.obj.close()
+
+    def test_upload_many(self):
+        sources = [b"x" * size for size in range(1, 11)] + [("missing/file.txt",), (io.BytesIO(b"abc"), "abc.txt")]
+        progress = []
+        results = list(self.obj.upload_many(sources, max_workers=4, progress=progress.append))
+        self.assertEqual(sorted(result.index for result in results), list(range(len(sources))))
+        by_index = {result.index: result for result in results}
+        self.assertIsInstance(by_index[10].error, FileNotFoundError)
+        self.assertEqual(by_index[10].resources, [])
+        self.assertEqual(by_index[11].resources, ["rsc-1"])
+        self.assertIsNone(by_index[0].error)
+        self.assertEqual(len(self.server.requests), len(sources) - 1)
+        self.assertEqual([item.done for item in progress], list(range(1, len(sources) + 1)))
+        self.assertEqual(progress[-1].failed, 1)
+        self.assertEqual(progress[-1].bytes_sent, sum(range(1, 11)) + 3)
+
+    def test_error_answer(self):
+        self.server.body = '{"status":{"code":102,"msg":"forbidden"},"results":[],"errors":["forbidden"]}'
+        try:
+            results = list(self.obj.upload_many([b"a", b"b"]))
+        finally:
+            self.server.body = '{"status":{"code":0,"msg":"ok"},"results":["rsc-1"],"errors":[]}'
+        self.assertTrue(all(isinstance(result.error, OhtApi2.OhtError) for result in results))
+        self.assertEqual(results[0].error.answer.status.code, 102)
+
+
+def resource_answer(file_name, content):
+    return json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [],
+                       "results": {"type": "file", "length": len(content), "file_name": file_name,
+                                   "file_mime": "text/plain", "download_url": ""}})
+
+
+def bound_project_answer(binding):
+    answer = json.loads(PROJECT_DETAIL_ANSWER)
+    answer["results"]["resource_binding"] = binding
+    answer["results"]["resources"]["translations"] = [target for targets in binding.values() for target in targets]
+    return json.dumps(answer)
+
+
+class Test_DownloadProjectOutputs(unittest.TestCase):
+    translations = {"rsc-560abb5ab099b0-90175867": b"Le soleil brille",
+                    "rsc-560abb5ab4ab73-60700513": b"de mille feux"}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer()
+        cls.server.routes["/projects/807837"] = PROJECT_DETAIL_ANSWER
+        cls.server.routes["/projects/1"] = '{"status":{"code":102,"msg":"forbidden"},"results":[],"errors":[]}'
+        cls.server.routes["/projects/2"] = bound_project_answer({})
+        cls.server.routes["/projects/3"] = bound_project_answer({"..": ["rsc-a"], "../../up": ["rsc-b"]})
+        for uuid, content in cls.translations.items():
+            cls.server.routes["/resources/" + uuid] = resource_answer("sun.txt", content)
+            cls.server.routes["/resources/{0}/download".format(uuid)] = content
+        for uuid in ("rsc-a", "rsc-b"):
+            cls.server.routes["/resources/" + uuid] = resource_answer("../x.txt", b"x")
+            cls.server.routes["/resources/{0}/download".format(uuid)] = b"x"
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server)
+        del self.server.requests[:]
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self.obj.close()
+
+    def downloads(self):
+        return [req for req in self.server.requests if req[1].endswith("/download")]
+
+    def check_outputs(self, outputs, skipped):
+        self.assertEqual(len(outputs), 2)
+        by_resource = {output.resource: output for output in outputs}
+        for source, target in (("rsc-560a693ccfbbc2-86754957", "rsc-560abb5ab099b0-90175867"),
+                               ("rsc-560a6a5524b4a2-38348001", "rsc-560abb5ab4ab73-60700513")):
+            output = by_resource[target]
+            self.assertIsNone(output.error)
+            self.assertEqual(output.source, source)
+            self.assertEqual(output.skipped, skipped)
+            self.assertEqual(output.path, os.path.join(self.dir.name, source, "sun.txt"))
+            with open(output.path, "rb") as file:
+                self.assertEqual(file.read(), self.translations[target])
+
+    def test_download_and_skip(self):
+        self.check_outputs(self.obj.download_project_outputs(807837, self.dir.name, max_workers=2), False)
+        self.assertEqual(len(self.downloads()), 2)
+        self.assertEqual(self.downloads()[0][2]["project_id"], ["807837"])
+        del self.server.requests[:]
+        self.check_outputs(self.obj.download_project_outputs(807837, self.dir.name), True)
+        self.assertEqual(len(self.downloads()), 0)
+
+    def test_project_error(self):
+        with self.assertRaises(OhtApi2.OhtError):
+            self.obj.download_project_outputs(1, self.dir.name)
+
+    def test_nothing_to_download(self):
+        dest_dir = os.path.join(self.dir.name, "new")
+        self.assertEqual(self.obj.download_project_outputs(2, dest_dir), [])
+        self.assertTrue(os.path.isdir(dest_dir))
+
+    def test_server_names_stay_inside(self):
+        dest_dir = os.path.join(self.dir.name, "out")
+        outputs = {output.resource: output for output in self.obj.download_project_outputs(3, dest_dir)}
+        self.assertIsInstance(outputs["rsc-a"].error, ValueError)
+        self.assertEqual(outputs["rsc-a"].path, "")
+        self.assertIsNone(outputs["rsc-b"].error)
+        self.assertEqual(outputs["rsc-b"].path, os.path.join(dest_dir, "up", "x.txt"))
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ["out"])
+
+    @unittest.skipIf(OhtApi2.aiohttp is None, "aiohttp is not installed")
+    def test_async(self):
+        obj = stub_api(self.server, OhtApi2.AsyncOhtApi)
+
+        async def download():
+            try:
+                return await obj.download_project_outputs(807837, self.dir.name)
+            finally:
+                await obj.aclose()
+        self.check_outputs(asyncio.run(download()), False)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test_DiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = OhtApi2.TTLCache(ttl=60, maxsize=2, clock=self.clock)
+        self.transport = FakeTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, discovery_cache=self.cache)
+        del self.transport.calls[:]
+
+    def test_cached(self):
+        first = self.obj.supported_language_pairs()
+        second = self.obj.supported_language_pairs()
+        self.assertIs(first, second)
+        self.assertEqual(len(self.transport.calls), 1)
+
+    def test_keyed_by_arguments(self):
+        self.obj.expertises("en-us", "fr-fr")
+        self.obj.expertises("en-us", "de-de")
+        self.obj.expertises("en-us", "fr-fr")
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_ttl(self):
+        self.obj.supported_languages()
+        self.clock.now += 61
+        self.obj.supported_languages()
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_lru(self):
+        self.obj.supported_languages()
+        self.obj.supported_language_pairs()
+        self.obj.supported_languages()
+        self.obj.expertises()
+        self.assertEqual(len(self.cache), 2)
+        self.obj.supported_languages()
+        self.assertEqual(len(self.transport.calls), 3)
+
+    def test_invalidate(self):
+        self.obj.supported_languages()
+        self.obj.invalidate_discovery_cache()
+        self.obj.supported_languages()
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_error_answer_not_cached(self):
+        self.transport.text = '{"status":{"code":102,"msg":"forbidden"},"results":[],"errors":[]}'
+        self.obj.supported_languages()
+        self.obj.supported_languages()
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_snapshot(self):
+        self.transport.text = PROJECT_DETAIL_ANSWER
+        self.obj.expertises("en-us", "fr-fr")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "discovery.json")
+            self.cache.save(path)
+            cache = OhtApi2.TTLCache(ttl=60, path=path)
+        obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, discovery_cache=cache)
+        del self.transport.calls[:]
+        answer = obj.expertises("en-us", "fr-fr")
+        self.assertEqual(len(self.transport.calls), 0)
+        self.assertEqual(answer.results.project_id, "807837")
+
+    @unittest.skipIf(OhtApi2.aiohttp is None, "aiohttp is not installed")
+    def test_async(self):
+        server = StubServer()
+        server.start()
+        obj = stub_api(server, OhtApi2.AsyncOhtApi, discovery_cache=self.cache)
+        del server.requests[:]
+
+        async def discover():
+            try:
+                return [await obj.supported_languages() for _ in range(3)]
+            finally:
+                await obj.aclose()
+        try:
+            answers = asyncio.run(discover())
+        finally:
+            server.stop()
+        self.assertEqual(len(server.requests), 1)
+        self.assertIs(answers[0], answers[2])
+
+
+LANGUAGE_PAIRS_ANSWER = json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [], "results": [
+    {"source": {"code": "en-us", "name": "English"},
+     "targets": [{"code": "fr-fr", "name": "French", "availability": "high"},
+                 {"code": "ru-ru", "name": "Russian", "availability": "medium"}]},
+    {"source": {"code": "fr-fr", "name": "French"},
+     "targets": [{"code": "en-us", "name": "English", "availability": "low"}]}]})
+
+EXPERTISES_ANSWER = json.dumps({"status": {"code": 0, "msg": "ok"}, "errors": [], "results": [
+    {"expertise_name": "Automotive / Aerospace", "expertise_code": "automotive-aerospace"},
+    {"expertise_name": "Marketing / Consumer / Media", "expertise_code": "marketing-consumer-media"}]})
+
+
+class Test_LanguageIndex(unittest.TestCase):
+    def setUp(self):
+        parser = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport())
+        self.index = OhtApi2.LanguageIndex(parser.json_to_ntuple(LANGUAGE_PAIRS_ANSWER),
+                                           {("", ""): parser.json_to_ntuple(EXPERTISES_ANSWER)})
+        self.transport = FakeTransport()
+        self.obj = OhtApi2.OhtApi("a", "b", True, transport=self.transport, language_index=self.index)
+        del self.transport.calls[:]
+
+    def test_lookups(self):
+        self.assertTrue(self.index.is_supported("en-us", "ru-ru"))
+        self.assertTrue(self.index.is_supported("EN-US", "fr-fr"))
+        self.assertFalse(self.index.is_supported("ru-ru", "en-us"))
+        self.assertEqual(self.index.availability("fr-fr", "en-us"), "low")
+        self.assertIsNone(self.index.availability("ru-ru", "en-us"))
+        self.assertIn("automotive-aerospace", self.index.expertises_for("en-us", "fr-fr"))
+
+    def test_pair_specific_expertises(self):
+        parser = OhtApi2.OhtApi("a", "b", True, transport=FakeTransport())
+        answer = parser.json_to_ntuple('{"status":{"code":0,"msg":"ok"},"results":[{"expertise_name":"IT","expertise_code":"it"}],"errors":[]}')
+        self.index.add_expertises(answer, "en-us", "ru-ru")
+        self.assertEqual(self.index.expertises_for("en-us", "ru-ru"), frozenset(["it"]))
+        self.assertIn("marketing-consumer-media", self.index.expertises_for("en-us", "fr-fr"))
+
+    def test_local_check_before_request(self):
+        with self.assertRaises(ValueError):
+            self.obj.create_translation_project("ru-ru", "en-us", ["rsc"])
+        with self.assertRaises(ValueError):
+            self.obj.quote(["rsc"], "en-us", "fr-fr", expertise="unknown")
+        with self.assertRaises(ValueError):
+            self.obj.create_proof_translated_project("en-us", "de-de", ["rsc"], ["rsc2"])
+        self.assertEqual(self.transport.calls, [])
+        self.obj.create_translation_project("en-us", "ru-ru", ["rsc"], expertise="automotive-aerospace")
+        self.obj.quote(["rsc"], "en-us", "en-us", service="proofreading")
+        self.assertEqual(len(self.transport.calls), 2)
+
+    def test_from_api(self):
+        class Transport(FakeTransport):
+            def request(self, method, url, **kwargs):
+                self.text = LANGUAGE_PAIRS_ANSWER if url.endswith("language_pairs") else EXPERTISES_ANSWER
+                return super().request(method, url, **kwargs)
+
+        obj = OhtApi2.OhtApi("a", "b", True, transport=Transport())
+        index = OhtApi2.LanguageIndex.from_api(obj, [("en-us", "fr-fr")])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.expertises_for("en-us", "fr-fr"), frozenset(["automotive-aerospace", "marketing-consumer-media"]))
+
+
+class Test_RequestCount(unittest.TestCase):
+    """ exact number of HTTP requests made by each public method """
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer()
+        cls.server.routes["/projects/807837"] = PROJECT_DETAIL_ANSWER
+        for uuid in ("rsc-560abb5ab099b0-90175867", "rsc-560abb5ab4ab73-60700513"):
+            cls.server.routes["/resources/" + uuid] = resource_answer(uuid + ".txt", b"content")
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server, discovery_cache=OhtApi2.TTLCache())
+        self.dir = tempfile.TemporaryDirectory()
+        del self.server.requests[:]
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self.obj.close()
+
+    def assertRequests(self, expected, call, endpoints=None):
+        del self.server.requests[:]
+        self.obj.request_stats().reset()
+        call()
+        self.assertEqual(len(self.server.requests), expected)
+        self.assertEqual(self.obj.request_stats().calls(), expected)
+        for endpoint, count in (endpoints or {}).items():
+            self.assertEqual(self.obj.request_stats().calls(endpoint), count)
+
+    def test_single_request_methods(self):
+        calls = public_calls(self.obj)
+        self.assertEqual(set(calls), set(OhtApi2.OhtApi._apiUrl))
+        for endpoint, call in calls.items():
+            with self.subTest(endpoint=endpoint):
+                self.assertRequests(1, call, {endpoint: 1})
+
+    def test_streaming(self):
+        path = os.path.join(self.dir.name, "out.bin")
+        self.assertRequests(1, lambda: self.obj.download_resource("rsc", path))
+        self.assertRequests(1, lambda: list(self.obj.iter_resource("rsc")))
+        self.assertRequests(1, lambda: self.obj.open_resource("rsc").close())
+        self.assertRequests(1, lambda: self.obj.create_file_resource(b"content", file_name="a.txt"))
+
+    def test_bulk(self):
+        self.assertRequests(3, lambda: list(self.obj.upload_many([b"a", b"b", b"c"])))
+        self.assertRequests(5, lambda: self.obj.download_project_outputs(807837, self.dir.name),
+                            {"project-details": 1, "get-resource": 2, "download-resource": 2})
+
+    def test_cached_discovery(self):
+        self.assertRequests(1, lambda: [self.obj.supported_languages() for _ in range(3)])
+
+    def test_stats(self):
+        self.obj.request_stats().reset()
+        self.obj.create_file_resource(file_name="a", file_content="b" * 100)
+        stats = self.obj.request_stats().snapshot()["create-file-resource"]
+        self.assertEqual(stats.calls, 1)
+        self.assertEqual(stats.errors, 0)
+        self.assertEqual(stats.bytes_sent, len("public_key=a&secret_key=b&file_name=a&file_mime=") +
+                         len("file_content=" + "b" * 100))
+        self.assertEqual(stats.bytes_received, len(self.server.body))
+        self.assertGreater(stats.seconds, 0)
+
+    def test_stats_query(self):
+        self.obj.request_stats().reset()
+        self.obj.machine_translate("en-us", "fr-fr", "some text")
+        stats = self.obj.request_stats().snapshot()["machine-translate"]
+        method, path, query, payload, headers = self.server.requests[-1]
+        self.assertEqual(method, "get")
+        self.assertEqual(stats.bytes_sent, len(urllib.parse.urlencode(query, doseq=True)))
+
+
+def public_calls(obj, path=None):
+    """ one call of every public request method, by key of OhtApi._apiUrl """
+    return {"account-details": lambda: obj.account_details(),
+            "create-file-resource": lambda: obj.create_file_resource(file_name="a", file_content="b"),
+            "get-resource": lambda: obj.get_resource("rsc-1"),
+            "download-resource": lambda: obj.download_resource("rsc-1", path or ""),
+            "quote": lambda: obj.quote(["rsc-1"], "en-us", "fr-fr"),
+            "word-count": lambda: obj.word_count(["rsc-1"]),
+            "new-translation-project": lambda: obj.create_translation_project("en-us", "fr-fr", ["rsc-1"]),
+            "new-proofreading-project-single": lambda: obj.create_proof_reading_project("en-us", ["rsc-1"]),
+            "new-proofreading-project-advanced":
+                lambda: obj.create_proof_translated_project("en-us", "fr-fr", ["rsc-1"], ["rsc-2"]),
+            "new-transcription-project": lambda: obj.create_transcription_project("en-us", ["rsc-1"]),
+            "project-details": lambda: obj.project_detail(1),
+            "cancel-project": lambda: obj.cancel_project(1),
+            "project-comments": lambda: obj.project_comments(1),
+            "new-comment": lambda: obj.post_comment(1, "text"),
+            "retrieve-project-ratings": lambda: obj.project_ratings(1),
+            "post-project-ratings": lambda: obj.post_project_ratings(1, "Customer", 1),
+            "machine-translate": lambda: obj.machine_translate("en-us", "fr-fr", "text"),
+            "machine-detect-lang": lambda: obj.machine_detect_lang("text"),
+            "discover-langs": lambda: obj.supported_languages(),
+            "discover-langs_pairs": lambda: obj.supported_language_pairs(),
+            "supported-expertises": lambda: obj.expertises()}
+
+
+class Test_OhtStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = OhtStubServer(comments=5, languages=4, download_size=100)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.obj = stub_api(self.server)
+
+    def tearDown(self):
+        self.obj.close()
+
+    def test_every_route(self):
+        calls = public_calls(self.obj)
+        self.assertEqual(set(calls), set(OhtApi2.OhtApi._apiUrl))
+        for endpoint, call in calls.items():
+            with self.subTest(endpoint=endpoint):
+                answer = call()
+                if endpoint == "download-resource":
+                    self.assertEqual(answer, "x" * 100)
+                else:
+                    self.assertEqual(answer.status.code, 0)
+
+    def test_sizes(self):
+        self.assertEqual(len(self.obj.project_comments(1).results), 5)
+        self.assertEqual(len(self.obj.supported_language_pairs().results), 4)
+        self.assertEqual(len(self.obj.project_detail(7).results.resources.translations), 2)
+        self.assertEqual(self.obj.machine_translate("en-us", "fr-fr", "abc").results.TranslatedText, "ABC")
+        self.assertEqual([rating.type for rating in self.obj.project_ratings(1).results], ["Customer", "Service"])
+
+    def test_errors_and_latency(self):
+        server = OhtStubServer(latency=0.05, error_rate=1.0)
+        server.start()
+        obj = stub_api(server, resilience=OhtApi2.ResiliencePolicy(retries=0))
+        try:
+            start = time.perf_counter()
+            self.assertEqual(obj.account_details().status.code, 500)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        finally:
+            obj.close()
+            server.stop()
+
+
 class Test_Answers(unittest.TestCase):
     def setUp(self):
         self.obj = OhtApi2.OhtApi(os.environ['PubKey'],os.environ['PrivKey'], True)